@@ -1,8 +1,22 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.translation import ugettext_lazy as _
 
 from accounts.models import User, UserSetting, UserProfile, UserSchool, UserLicense, UserEmployer, UserCertification
+from accounts.provisioning import provision_users, read_users_csv
+
+
+class ProvisionUsersForm(forms.Form):
+    csv_file = forms.FileField(
+        label=_("CSV file"),
+        help_text=_("Columns: email, username and optionally first_name, last_name, password."),
+    )
 
 
 class CustomUserAdmin(UserAdmin):
@@ -23,6 +37,42 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
     add_fieldsets = ((None, {"classes": ("wide",), "fields": ("email", "username", "password1", "password2")}),)
+    change_list_template = "admin/accounts/user/change_list.html"
+
+    def get_urls(self):
+        return [
+            path(
+                "provision/",
+                self.admin_site.admin_view(self.provision_view),
+                name="accounts_user_provision",
+            ),
+        ] + super().get_urls()
+
+    def provision_view(self, request):
+        """
+        Creates users in bulk from an uploaded CSV file.
+        """
+        if not self.has_add_permission(request):
+            return redirect("admin:accounts_user_changelist")
+        form = ProvisionUsersForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            csv_file = io.TextIOWrapper(form.cleaned_data["csv_file"].file, encoding="utf-8-sig")
+            try:
+                result = provision_users(read_users_csv(csv_file))
+            except ValueError as error:
+                form.add_error("csv_file", str(error))
+            else:
+                for number, reason in result.skipped:
+                    self.message_user(request, f"Skipped row {number}: {reason}", messages.WARNING)
+                self.message_user(request, f"Provisioned {len(result.created)} users")
+                return redirect("admin:accounts_user_changelist")
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": _("Provision users"),
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/accounts/user/provision.html", context)
 
 
 class UserSettingAdmin(admin.ModelAdmin):
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = "accounts"
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel, unused-import
+        import accounts.authentication  # noqa
+        import accounts.availability  # noqa
+        import accounts.search  # noqa
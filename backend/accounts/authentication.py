@@ -0,0 +1,133 @@
+"""
+Authentication classes that resolve the request user from a short lived cache.
+
+A JWT already proves who the caller is, and a DRF token maps to a user that rarely changes, so
+the user row does not have to be read on every request. The columns authentication and
+permission checks read, ``AUTH_USER_FIELDS``, are cached for ``AUTH_USER_CACHE_TIMEOUT``
+seconds, read from the primary database; any other column, the password hash among them,
+is loaded from the database when accessed. The entry is dropped once a transaction saving or
+deleting the user commits, which covers password changes, deactivation and permission
+changes, so a concurrent request can not cache the row as it was before the commit. Tokens
+are dropped when they are deleted, for example on logout.
+"""
+
+from dj_rest_auth.jwt_auth import JWTCookieAuthentication
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from core.routers import primary
+
+
+User = get_user_model()
+
+AUTH_USER_KEY = "auth-user:{user_id}"
+AUTH_TOKEN_KEY = "auth-token:{key}"
+AUTH_USER_FIELDS = (
+    "id",
+    "username",
+    "email",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "is_verified",
+)
+
+
+def cache_user(user):
+    # from_db expects the values in field order
+    snapshot = {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields if field.attname in AUTH_USER_FIELDS
+    }
+    cache.set(AUTH_USER_KEY.format(user_id=user.pk), snapshot, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def get_user(user_id):
+    """
+    The user with primary key ``user_id``, from the cache when possible.
+    Raises ``User.DoesNotExist`` for unknown users.
+    """
+    snapshot = cache.get(AUTH_USER_KEY.format(user_id=user_id))
+    if snapshot is not None:
+        return User.from_db(router.db_for_read(User), list(snapshot), list(snapshot.values()))
+    with primary():
+        user = User.objects.get(pk=user_id)
+    cache_user(user)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(AUTH_USER_KEY.format(user_id=user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        user_id = cache.get(AUTH_TOKEN_KEY.format(key=key))
+        if user_id is None:
+            model = self.get_model()
+            try:
+                with primary():
+                    token = model.objects.select_related("user").get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            cache.set(
+                AUTH_TOKEN_KEY.format(key=key), token.user_id, settings.AUTH_USER_CACHE_TIMEOUT
+            )
+            cache_user(token.user)
+            user = token.user
+        else:
+            try:
+                user = get_user(user_id)
+            except User.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            model = self.get_model()
+            token = model.from_db(router.db_for_read(model), ["key", "user_id"], [key, user_id])
+            token.user = user
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+
+        return (user, token)
+
+
+class CachedJWTCookieAuthentication(JWTCookieAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_user(user_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
+
+
+# drop cached users and tokens as soon as they change
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    key = AUTH_TOKEN_KEY.format(key=instance.key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,164 @@
+"""
+Username and email availability checks for the signup form.
+
+Every process keeps a Bloom filter of the lowercased usernames and emails of all users, and of
+every allauth ``EmailAddress`` (secondary and unverified addresses are taken too), and a
+frozenset of the reserved usernames. A value the filter has never seen is available without a
+query; only possible hits are confirmed with the database.
+
+Processes learn about new users through a version key in the shared cache. It changes, once
+the transaction commits, whenever a user is created or changes their username or email, or an
+email address is saved. A process that sees a new version adds the users modified since its
+last sync, overlapping by ``SYNC_OVERLAP`` so rows committed out of order are not missed, and
+the email addresses past the highest id it has seen, overlapping by ``EMAIL_SYNC_OVERLAP`` ids
+for the same reason. It reads from the primary, as a lagging replica could miss them for good.
+Values are never removed, so a freed username stays a possible hit and is confirmed with the
+database.
+"""
+import threading
+import uuid
+from datetime import timedelta
+
+from allauth.account.models import EmailAddress
+from allauth.utils import email_address_exists
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.bloom import BloomFilter
+from core.routers import primary
+
+
+User = get_user_model()
+
+AVAILABILITY_VERSION_KEY = "account-availability:version"
+SYNC_OVERLAP = timedelta(minutes=5)
+EMAIL_SYNC_OVERLAP = 1000
+
+RESERVED_USERNAMES = frozenset(username.lower() for username in settings.ACCOUNT_USERNAME_BLACKLIST)
+
+
+class AccountFilter:
+    """
+    The per-process filter of taken usernames and emails.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.synced = None
+        self.email_synced = None
+        self.version = None
+
+    def _add_users(self, users):
+        latest = self.synced
+        for username, email, modified in users.values_list(
+            "username", "email", "modified"
+        ).iterator():
+            self.bloom.add(username.lower())
+            self.bloom.add(email.lower())
+            if latest is None or modified > latest:
+                latest = modified
+        self.synced = latest
+
+    def _add_email_addresses(self, addresses):
+        latest = self.email_synced
+        for pk, email in addresses.values_list("pk", "email").iterator():
+            self.bloom.add(email.lower())
+            if latest is None or pk > latest:
+                latest = pk
+        self.email_synced = latest
+
+    def _build(self):
+        capacity = max(
+            settings.ACCOUNT_FILTER_MIN_CAPACITY,
+            4 * User.objects.count() + 2 * EmailAddress.objects.count(),
+        )
+        self.bloom = BloomFilter(capacity, settings.ACCOUNT_FILTER_ERROR_RATE)
+        self.synced = None
+        self.email_synced = None
+        self._add_users(User.objects.all())
+        self._add_email_addresses(EmailAddress.objects.all())
+
+    def refresh(self):
+        """
+        Brings the filter up to date with the version in the cache.
+        """
+        version = cache.get(AVAILABILITY_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(AVAILABILITY_VERSION_KEY, version, None):
+                version = cache.get(AVAILABILITY_VERSION_KEY)
+        with self.lock, primary():
+            if self.bloom is None or self.bloom.is_full:
+                self._build()
+            elif version != self.version:
+                since = self.synced - SYNC_OVERLAP if self.synced else None
+                users = User.objects.filter(modified__gte=since) if since else User.objects.all()
+                self._add_users(users)
+                addresses = EmailAddress.objects.all()
+                if self.email_synced is not None:
+                    addresses = addresses.filter(pk__gt=self.email_synced - EMAIL_SYNC_OVERLAP)
+                self._add_email_addresses(addresses)
+            self.version = version
+
+    def might_contain(self, value):
+        self.refresh()
+        return value.lower() in self.bloom
+
+    def add(self, *values):
+        with self.lock:
+            if self.bloom is not None:
+                for value in values:
+                    self.bloom.add(value.lower())
+
+
+account_filter = AccountFilter()
+
+
+def username_status(username):
+    """
+    ``(available, reason)`` of a username, ``reason`` being "reserved" or "taken".
+    """
+    if username.lower() in RESERVED_USERNAMES:
+        return False, "reserved"
+    if (
+        account_filter.might_contain(username)
+        and User.objects.filter(username__iexact=username).exists()
+    ):
+        return False, "taken"
+    return True, None
+
+
+def email_status(email):
+    """
+    ``(available, reason)`` of an email address, ``reason`` being "taken".
+    """
+    if account_filter.might_contain(email) and email_address_exists(email):
+        return False, "taken"
+    return True, None
+
+
+def bump_version():
+    cache.set(AVAILABILITY_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and update_fields is not None and not {"username", "email"} & set(update_fields):
+        return
+    account_filter.add(instance.username, instance.email)
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=EmailAddress)
+def email_address_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    account_filter.add(instance.email)
+    transaction.on_commit(bump_version)
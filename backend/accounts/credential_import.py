@@ -0,0 +1,263 @@
+"""
+Streaming bulk import of user credentials from CSV or XLSX files.
+
+The file is read a row at a time and handled in chunks of ``CREDENTIAL_IMPORT_BATCH_SIZE`` rows:
+every chunk is validated (spread over a pool of ``workers`` processes), its users are
+resolved with one ``IN`` query per identifier column and its credentials are written with
+``bulk_create``. Memory use is bounded by the chunk size, not by the size of the file. The pool
+is billiard's, as Celery's prefork workers are daemonic and the standard library does not let
+daemonic processes start children.
+
+Every row names its user in an ``email`` or ``username`` column; the remaining columns are the
+fields of the credential kind being imported, see ``CREDENTIAL_KINDS``. A credential the user
+already has, by the natural key of its kind, is skipped, so importing a file again creates
+nothing new.
+"""
+import csv
+import io
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import islice
+
+from billiard.pool import Pool
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from accounts import search
+from accounts.models import DEGREE_TYPE, UserCertification, UserEmployer, UserLicense, UserSchool
+from accounts.profiles import invalidate_profile
+
+
+User = get_user_model()
+
+MAX_REPORTED_ERRORS = 100
+
+# field name, parser, required
+CredentialField = namedtuple("CredentialField", ("name", "parser", "required"))
+# the fields that tell two credentials of a user apart
+CredentialKind = namedtuple("CredentialKind", ("model", "fields", "key"))
+
+ImportResult = namedtuple("ImportResult", ("rows", "created", "skipped", "failed", "errors"))
+
+
+def parse_text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def parse_date(value):
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip())
+
+
+def parse_bool(value):
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y"):
+        return True
+    if text in ("0", "false", "no", "n"):
+        return False
+    raise ValueError(f"{value!r} is not a boolean")
+
+
+def parse_degree_type(value):
+    text = parse_text(value).upper()
+    if text and text not in DEGREE_TYPE:
+        raise ValueError(f"{value!r} is not one of {', '.join(key for key, _ in DEGREE_TYPE)}")
+    return text or None
+
+
+CREDENTIAL_KINDS = {
+    "certification": CredentialKind(UserCertification, (
+        CredentialField("institution_name", parse_text, True),
+        CredentialField("certificate_program", parse_text, True),
+        CredentialField("certificate_number", parse_text, False),
+        CredentialField("completion_date", parse_date, False),
+    ), ("institution_name", "certificate_program", "certificate_number")),
+    "license": CredentialKind(UserLicense, (
+        CredentialField("issuing_authority", parse_text, True),
+        CredentialField("license_type", parse_text, True),
+        CredentialField("license_number", parse_text, True),
+        CredentialField("completion_date", parse_date, False),
+        CredentialField("expiration_date", parse_date, False),
+    ), ("issuing_authority", "license_type", "license_number")),
+    "school": CredentialKind(UserSchool, (
+        CredentialField("school_name", parse_text, True),
+        CredentialField("program", parse_text, False),
+        CredentialField("degree_type", parse_degree_type, False),
+        CredentialField("current_student", parse_bool, False),
+        CredentialField("start_date", parse_date, False),
+        CredentialField("graduate_date", parse_date, False),
+    ), ("school_name", "program", "degree_type")),
+    "employer": CredentialKind(UserEmployer, (
+        CredentialField("employer_name", parse_text, True),
+        CredentialField("position", parse_text, True),
+        CredentialField("current_position", parse_bool, False),
+        CredentialField("description", parse_text, False),
+        CredentialField("start_date", parse_date, False),
+        CredentialField("end_date", parse_date, False),
+    ), ("employer_name", "position", "start_date")),
+}
+
+
+def read_rows(file, name):
+    """
+    Yields ``(row number, {column: value})`` for every data row of a CSV or XLSX file,
+    without loading the whole file. ``file`` is a binary file object.
+    """
+    if os.path.splitext(name)[1].lower() == ".xlsx":
+        # pylint: disable=import-outside-toplevel
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [parse_text(column).lower() for column in next(rows, ())]
+            for number, values in enumerate(rows, start=2):
+                if any(value not in (None, "") for value in values):
+                    yield number, dict(zip(header, values))
+        finally:
+            workbook.close()
+        return
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    header = [column.strip().lower() for column in next(reader, ())]
+    for number, values in enumerate(reader, start=2):
+        if any(values):
+            yield number, dict(zip(header, values))
+
+
+def validate_row(kind, number, row):
+    """
+    Parses one row. Returns ``(number, identifier, fields, errors)``; ``identifier`` is an
+    ``("email" | "username", value)`` pair. Runs in pool processes, so it must not use the
+    database.
+    """
+    errors = []
+    email = User.objects.normalize_email(parse_text(row.get("email")))
+    username = User.normalize_username(parse_text(row.get("username")))
+    identifier = ("email", email) if email else ("username", username)
+    if not identifier[1]:
+        errors.append("email or username is required")
+    fields = {}
+    for field in CREDENTIAL_KINDS[kind].fields:
+        try:
+            value = field.parser(row.get(field.name))
+        except ValueError as error:
+            errors.append(f"{field.name}: {error}")
+            continue
+        if field.required and not value:
+            errors.append(f"{field.name} is required")
+        fields[field.name] = value
+    return number, identifier, fields, errors
+
+
+def validate_chunk(kind, rows):
+    return [validate_row(kind, number, row) for number, row in rows]
+
+
+def import_credentials(kind, rows, batch_size=1000, workers=0, progress=None):
+    """
+    Imports credentials of ``kind`` from ``(row number, row)`` pairs. Every chunk of rows is
+    committed on its own and ``progress(rows, created, failed)`` is called after it.
+    """
+    credential_kind = CREDENTIAL_KINDS[kind]
+    pool = Pool(workers) if workers > 1 else None
+    total = created = skipped = failed = 0
+    errors = []
+    try:
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            total += len(chunk)
+            if pool is not None:
+                size = max(1, -(-len(chunk) // workers))
+                parts = [chunk[start:start + size] for start in range(0, len(chunk), size)]
+                validated = [
+                    row
+                    for part in pool.starmap(validate_chunk, [(kind, part) for part in parts])
+                    for row in part
+                ]
+            else:
+                validated = validate_chunk(kind, chunk)
+            chunk_created, chunk_skipped, chunk_errors = _write_chunk(credential_kind, validated)
+            created += chunk_created
+            skipped += chunk_skipped
+            failed += len(chunk_errors)
+            errors.extend(chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+            if progress is not None:
+                progress(total, created, failed)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return ImportResult(total, created, skipped, failed, errors)
+
+
+def _natural_key(credential_kind, user_id, fields):
+    # optional text columns hold either NULL or "" for a missing value
+    return (user_id, *(fields.get(name) or "" for name in credential_kind.key))
+
+
+def _write_chunk(credential_kind, validated):
+    errors = [
+        (number, "; ".join(row_errors)) for number, _, _, row_errors in validated if row_errors
+    ]
+    valid = [row for row in validated if not row[3]]
+    emails = {value for _, (column, value), _, _ in valid if column == "email"}
+    usernames = {value for _, (column, value), _, _ in valid if column == "username"}
+    users = {}
+    if emails:
+        users.update(
+            (("email", email), pk)
+            for email, pk in User.objects.filter(email__in=emails).values_list("email", "pk")
+        )
+    if usernames:
+        users.update(
+            (("username", username), pk)
+            for username, pk in User.objects.filter(username__in=usernames).values_list(
+                "username", "pk"
+            )
+        )
+
+    found = []
+    for number, identifier, fields, _ in valid:
+        user_id = users.get(identifier)
+        if user_id is None:
+            errors.append((number, f"no user with {identifier[0]} {identifier[1]}"))
+            continue
+        found.append((user_id, fields))
+
+    model = credential_kind.model
+    with transaction.atomic():
+        # imports of the same users wait for each other, so neither misses the other's rows
+        list(User.objects.select_for_update().filter(pk__in={user_id for user_id, _ in found}))
+        existing = {
+            _natural_key(credential_kind, values[0], dict(zip(credential_kind.key, values[1:])))
+            for values in model.objects.filter(
+                user_id__in={user_id for user_id, _ in found}
+            ).values_list("user_id", *credential_kind.key)
+        }
+        credentials = []
+        for user_id, fields in found:
+            key = _natural_key(credential_kind, user_id, fields)
+            if key not in existing:
+                existing.add(key)
+                credentials.append(model(user_id=user_id, **fields))
+        user_ids = {credential.user_id for credential in credentials}
+        model.objects.bulk_create(credentials)
+        # bulk_create skips the signals that keep these in sync
+        search.rebuild_documents(user_ids)
+    for user_id in user_ids:
+        invalidate_profile(user_id)
+    errors.sort()
+    return len(credentials), len(found) - len(credentials), errors
@@ -0,0 +1,159 @@
+"""
+Export of a user's full data archive.
+
+The archive is a zip with one JSON Lines file per kind of data. Every file is streamed from a
+``.values().iterator()`` query straight into the compressed zip member, so memory use does not
+grow with the size of a user's history. The archive is built in a local temporary file and
+saved to the default storage once complete (an S3 bucket in production), as the web dynos
+that serve the download share no disk with the worker that wrote it. Archives are deleted ``DATA_EXPORT_RETENTION_DAYS`` after
+they were completed, see ``expire_exports``.
+"""
+import io
+import json
+import os
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from accounts.models import (
+    EXPORT_STATES,
+    DataExport,
+    UserCertification,
+    UserEmployer,
+    UserLicense,
+    UserProfile,
+    UserSchool,
+    UserSetting
+)
+from questions.models import (
+    Comment,
+    CommentVote,
+    Question,
+    QuestionVote,
+    QuestionWatchers,
+    Reply,
+    ReplyVote,
+)
+from subq.models import SubQFollower
+
+
+User = get_user_model()
+
+USER_FIELDS = (
+    "id", "username", "email", "first_name", "last_name", "image_url", "is_verified", "is_active",
+    "reputation", "last_login", "created", "modified",
+)
+
+
+def export_sections(user_id):
+    """
+    ``(file name, queryset of dicts)`` for every part of the archive of ``user_id``.
+    """
+    return (
+        ("user", User.objects.filter(pk=user_id).values(*USER_FIELDS)),
+        ("settings", UserSetting.objects.filter(user__pk=user_id).values()),
+        ("profile", UserProfile.objects.filter(user__pk=user_id).values()),
+        ("certifications", UserCertification.objects.filter(user_id=user_id).values()),
+        ("employers", UserEmployer.objects.filter(user_id=user_id).values()),
+        ("licenses", UserLicense.objects.filter(user_id=user_id).values()),
+        ("schools", UserSchool.objects.filter(user_id=user_id).values()),
+        ("questions", Question.objects.filter(author_id=user_id).values()),
+        ("replies", Reply.objects.filter(user_id=user_id).values()),
+        ("comments", Comment.objects.filter(user_id=user_id).values()),
+        ("question_votes", QuestionVote.objects.filter(user_id=user_id).values()),
+        ("reply_votes", ReplyVote.objects.filter(user_id=user_id).values()),
+        ("comment_votes", CommentVote.objects.filter(user_id=user_id).values()),
+        ("watched_questions", QuestionWatchers.objects.filter(user_id=user_id).values()),
+        ("memberships", SubQFollower.objects.filter(follower_id=user_id).values()),
+    )
+
+
+def write_archive(user_id, file, chunk_size=2000):
+    """
+    Writes the archive of ``user_id`` to ``file``, a path or a binary file object. Returns the
+    number of rows written.
+    """
+    rows = 0
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, queryset in export_sections(user_id):
+            with archive.open(f"{name}.jsonl", "w") as member, \
+                    io.TextIOWrapper(member, encoding="utf-8") as lines:
+                for row in queryset.order_by("pk").iterator(chunk_size=chunk_size):
+                    lines.write(json.dumps(row, cls=DjangoJSONEncoder))
+                    lines.write("\n")
+                    rows += 1
+    return rows
+
+
+def expiration_cutoff():
+    """
+    Exports completed before this moment are expired.
+    """
+    return timezone.now() - timedelta(days=settings.DATA_EXPORT_RETENTION_DAYS)
+
+
+def is_downloadable(export):
+    return export.state == EXPORT_STATES.READY and export.completed >= expiration_cutoff()
+
+
+def run_export(export_id):
+    """
+    Builds the archive of a queued ``DataExport`` and marks it ready, or failed if writing it
+    raised.
+    """
+    export = DataExport.objects.get(pk=export_id)
+    DataExport.objects.filter(pk=export.pk).update(
+        state=EXPORT_STATES.RUNNING, modified=timezone.now()
+    )
+    try:
+        with tempfile.TemporaryFile() as archive:
+            rows = write_archive(
+                export.user_id, archive, chunk_size=settings.DATA_EXPORT_CHUNK_SIZE
+            )
+            size = archive.seek(0, os.SEEK_END)
+            archive.seek(0)
+            file_name = default_storage.save(
+                f"{settings.DATA_EXPORT_PREFIX}/{export.user_id}-{uuid.uuid4().hex}.zip",
+                File(archive),
+            )
+    except Exception:
+        DataExport.objects.filter(pk=export.pk).update(
+            state=EXPORT_STATES.FAILED, modified=timezone.now()
+        )
+        raise
+    now = timezone.now()
+    DataExport.objects.filter(pk=export.pk).update(
+        state=EXPORT_STATES.READY,
+        file_name=file_name,
+        rows=rows,
+        size=size,
+        completed=now,
+        modified=now,
+    )
+    return rows
+
+
+def expire_exports():
+    """
+    Deletes the archives of exports completed more than ``DATA_EXPORT_RETENTION_DAYS`` ago
+    and marks them expired. Returns the number of exports expired.
+    """
+    expired = DataExport.objects.filter(
+        state=EXPORT_STATES.READY, completed__lt=expiration_cutoff()
+    )
+    ids = []
+    for pk, file_name in expired.values_list("pk", "file_name").iterator():
+        if file_name:
+            default_storage.delete(file_name)
+        ids.append(pk)
+    return DataExport.objects.filter(pk__in=ids).update(
+        state=EXPORT_STATES.EXPIRED, file_name="", modified=timezone.now()
+    )
@@ -0,0 +1,129 @@
+"""
+License expiration sweep.
+
+Once a day every license that has expired is flagged, and licenses expiring within one of the
+``LICENSE_REMINDER_DAYS`` windows are queued for a reminder email. Licenses are walked in
+(expiration_date, id) keyset order over the matching index, a chunk at a time, and every
+processed license is flagged as soon as its chunk is done, so a rerun after a failure only
+picks up what is left.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from accounts.models import UserLicense
+from core.models import TaskWatermark
+
+
+WATERMARK_NAME = "license_expiration_sweep"
+
+
+def keyset_chunks(queryset, batch_size):
+    """
+    Yields the ``(expiration_date, id)`` pairs of ``queryset`` in index order, ``batch_size``
+    at a time, resuming each chunk after the last pair of the previous one.
+    """
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(
+                Q(expiration_date__gt=last[0]) | Q(expiration_date=last[0], pk__gt=last[1])
+            )
+        rows = list(
+            chunk.order_by("expiration_date", "pk").values_list("expiration_date", "pk")[
+                :batch_size
+            ]
+        )
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+
+
+def active_licenses():
+    return UserLicense.objects.filter(status=False, is_expired=False, expiration_date__isnull=False)
+
+
+def expire_licenses(today, batch_size):
+    """
+    Flags every license that expired before ``today``. Returns the number flagged.
+    """
+    expired = 0
+    for rows in keyset_chunks(active_licenses().filter(expiration_date__lt=today), batch_size):
+        expired += UserLicense.objects.filter(pk__in=[pk for _, pk in rows]).update(is_expired=True)
+    return expired
+
+
+def remind_licenses(today, batch_size):
+    """
+    Queues a reminder for every license that entered a reminder window since its last
+    reminder. A license expiring in 25 days gets the 30 day reminder, and the 60 day one
+    is skipped if it was missed. Returns the number of reminders queued.
+    """
+    # local import, the tasks module imports this one
+    from accounts.tasks import send_license_reminders
+
+    reminded = 0
+    lower = today
+    for days in sorted(settings.LICENSE_REMINDER_DAYS):
+        upper = today + timedelta(days=days)
+        due = active_licenses().filter(
+            Q(last_reminder_days__isnull=True) | Q(last_reminder_days__gt=days),
+            expiration_date__gte=lower,
+            expiration_date__lte=upper,
+        )
+        for rows in keyset_chunks(due, batch_size):
+            license_ids = [pk for _, pk in rows]
+            UserLicense.objects.filter(pk__in=license_ids).update(last_reminder_days=days)
+            send_license_reminders.delay(license_ids, days)
+            reminded += len(license_ids)
+        lower = upper + timedelta(days=1)
+    return reminded
+
+
+def sweep(today=None, batch_size=1000, force=False):
+    """
+    Runs the daily expiration sweep. The watermark records the last day that was swept, so
+    further runs on the same day return immediately unless ``force`` is given.
+    """
+    today = today or timezone.localdate()
+    watermark, _ = TaskWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    if (
+        not force
+        and watermark.last_run is not None
+        and timezone.localdate(watermark.last_run) >= today
+    ):
+        return {"expired": 0, "reminded": 0, "skipped": True}
+    expired = expire_licenses(today, batch_size)
+    reminded = remind_licenses(today, batch_size)
+    TaskWatermark.objects.filter(pk=watermark.pk).update(last_run=timezone.now())
+    return {"expired": expired, "reminded": reminded, "skipped": False}
+
+
+def reminder_message(user_license, days):
+    context = {"license": user_license, "user": user_license.user, "days": days}
+    subject = render_to_string("accounts/email/license_reminder_subject.txt", context).strip()
+    body = render_to_string("accounts/email/license_reminder_message.txt", context)
+    return EmailMessage(subject, body, to=[user_license.user.email])
+
+
+def send_reminders(license_ids, days):
+    """
+    Sends the reminder emails of one batch of licenses over a single SMTP connection.
+    Returns the number of emails sent.
+    """
+    licenses = UserLicense.objects.filter(pk__in=license_ids, user__isnull=False).select_related(
+        "user"
+    )
+    messages = [
+        reminder_message(user_license, days) for user_license in licenses if user_license.user.email
+    ]
+    if not messages:
+        return 0
+    with get_connection() as connection:
+        return connection.send_messages(messages)
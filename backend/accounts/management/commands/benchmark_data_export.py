@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.exports import write_archive
+from questions.models import Comment, CommentVote, Question, QuestionVote, Reply, ReplyVote
+from subq.models import SubQ
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Measures data export throughput for a user with a very large history. A synthetic user with
+    ``--rows`` questions, replies, comments and votes of each kind is created inside a
+    transaction that is rolled back afterwards, so the database is left untouched.
+    """
+
+    help = "Benchmark the data export of a user with a large history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            action="store",
+            type=int,
+            dest="rows",
+            default=20000,
+            help="Number of rows of every content and vote kind to generate.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            action="store",
+            type=int,
+            dest="chunk_size",
+            default=settings.DATA_EXPORT_CHUNK_SIZE,
+            help="Number of rows fetched per query while exporting.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["rows"]
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username="export-benchmark",
+                email="export-benchmark@example.com",
+                password="export-benchmark",
+            )
+            subq = SubQ.objects.create(sub_name="export-benchmark", owner=user)
+            Question.objects.bulk_create(
+                Question(slug=f"export-benchmark-{number}", post_title=f"Question {number}",
+                         post_body="Body " * 40, author=user, subq=subq)
+                for number in range(count)
+            )
+            question = Question.objects.filter(author=user).first()
+            Reply.objects.bulk_create(
+                Reply(reply_body="Reply " * 40, user=user, question=question) for _ in range(count)
+            )
+            reply = Reply.objects.filter(user=user).first()
+            Comment.objects.bulk_create(
+                Comment(comment_body="Comment " * 20, user=user, reply=reply) for _ in range(count)
+            )
+            comment = Comment.objects.filter(user=user).first()
+            QuestionVote.objects.bulk_create(
+                QuestionVote(question=question, user=user, vote_type="UP_VOTE")
+                for _ in range(count)
+            )
+            ReplyVote.objects.bulk_create(
+                ReplyVote(reply=reply, user=user, vote_type="UP_VOTE") for _ in range(count)
+            )
+            CommentVote.objects.bulk_create(
+                CommentVote(comment=comment, user=user, vote_type="UP_VOTE") for _ in range(count)
+            )
+
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "export.zip")
+                tracemalloc.start()
+                started = time.perf_counter()
+                rows = write_archive(user.pk, path, chunk_size=options["chunk_size"])
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                size = os.path.getsize(path)
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Exported {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), "
+            f"{size / 2 ** 20:.1f} MiB archive, {peak / 2 ** 20:.1f} MiB peak memory\n"
+        )
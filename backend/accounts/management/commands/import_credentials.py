@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.credential_import import CREDENTIAL_KINDS, import_credentials, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Imports certifications, employers, licenses or schools in bulk from a CSV or XLSX file.
+    Every row names its user in an email or username column.
+    """
+
+    help = "Import user credentials in bulk from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "kind", choices=sorted(CREDENTIAL_KINDS), help="Kind of credential to import."
+        )
+        parser.add_argument("path", help="Path of the CSV or XLSX file to import.")
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=settings.CREDENTIAL_IMPORT_BATCH_SIZE,
+            help="Number of rows validated and written per transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            dest="workers",
+            default=settings.CREDENTIAL_IMPORT_WORKERS,
+            help="Number of processes validating rows.",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["path"], "rb") as file:
+            result = import_credentials(
+                options["kind"],
+                read_rows(file, options["path"]),
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+        for number, error in result.errors:
+            self.stdout.write(f"Row {number}: {error}\n")
+        self.stdout.write(
+            f"Imported {result.created} of {result.rows} rows, {result.skipped} already there, "
+            f"{result.failed} failed\n"
+        )
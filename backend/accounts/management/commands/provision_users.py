@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import provision_users, read_users_csv
+
+
+class Command(BaseCommand):
+    """
+    Creates user accounts in bulk from a CSV file with email, username and optionally
+    first_name, last_name and password columns.
+    """
+
+    help = "Provision users in bulk from a CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="Path of the CSV file to import.")
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=500,
+            help="Number of users created per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["csv_path"], newline="", encoding="utf-8-sig") as csv_file:
+            try:
+                result = provision_users(read_users_csv(csv_file), batch_size=options["batch_size"])
+            except ValueError as error:
+                raise CommandError(error)
+        for number, reason in result.skipped:
+            self.stdout.write(f"Skipped row {number}: {reason}\n")
+        self.stdout.write(
+            f"Provisioned {len(result.created)} users, skipped {len(result.skipped)}\n"
+        )
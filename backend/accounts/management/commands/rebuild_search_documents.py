@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts import search
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the people search document of every user, for example after the search index
+    was created or the searchable fields changed.
+    """
+
+    help = "Rebuild the people search documents of all users"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=500,
+            help="Number of users rebuilt per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+        batch_size = options["batch_size"]
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                search.rebuild_documents(user_ids[start:start + batch_size])
+        self.stdout.write(f"Rebuilt {len(user_ids)} search documents\n")
@@ -35,6 +35,15 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', False)
         return self._create_user(email, first_name, last_name, username, password, **extra_fields)
 
+    def with_profile(self):
+        """
+        Users with everything shown on their profile page loaded up front: the profile and
+        settings are joined in, and each list relation costs one query for all users fetched.
+        """
+        return self.select_related("user_profile", "user_settings").prefetch_related(
+            "user_certifications", "user_employers", "user_licenses", "user_schools"
+        )
+
     def create_superuser(self, email, username, first_name=None, last_name=None, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_usersearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userlicense',
+            name='is_expired',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userlicense',
+            name='last_reminder_days',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userlicense',
+            index=models.Index(fields=['expiration_date', 'id'], name='user_license_expiration_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_userlicense_expiration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='reputation',
+            field=models.IntegerField(default=0, help_text="Net vote points on the user's questions, replies and comments."),
+        ),
+    ]
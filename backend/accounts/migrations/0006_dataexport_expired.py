@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_dataexport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataexport',
+            name='state',
+            field=models.CharField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('READY', 'READY'), ('FAILED', 'FAILED'), ('EXPIRED', 'EXPIRED')], default='PENDING', max_length=10),
+        ),
+    ]
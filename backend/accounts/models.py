@@ -1,10 +1,11 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from model_utils import Choices
+from model_utils.tracker import FieldTracker
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
@@ -22,6 +23,14 @@ DEGREE_TYPE = Choices(
     ("DOCTORATES", "DOCTORATES")
 )
 
+EXPORT_STATES = Choices(
+    ("PENDING", "PENDING"),
+    ("RUNNING", "RUNNING"),
+    ("READY", "READY"),
+    ("FAILED", "FAILED"),
+    ("EXPIRED", "EXPIRED")
+)
+
 
 class UserSetting(BaseAppModel):
 
@@ -69,6 +78,9 @@ class User(AbstractBaseUser, PermissionsMixin, IndexedTimeStampedModel):
             "active. Unselect this instead of deleting accounts."
         ),
     )
+    reputation = models.IntegerField(
+        default=0, help_text=_("Net vote points on the user's questions, replies and comments.")
+    )
     user_settings = models.OneToOneField(
         UserSetting,
         blank=True,
@@ -111,7 +123,7 @@ class User(AbstractBaseUser, PermissionsMixin, IndexedTimeStampedModel):
         new_user_settings = UserSetting()
         new_user_settings.save()
         self.user_settings = new_user_settings
-        self.save()
+        self.save(update_fields=["user_settings"])
 
     def create_default_profile(self):
         if self.user_profile:
@@ -120,7 +132,7 @@ class User(AbstractBaseUser, PermissionsMixin, IndexedTimeStampedModel):
         profile = UserProfile()
         profile.save()
         self.user_profile = profile
-        self.save()
+        self.save(update_fields=["user_profile"])
 
 
 class UserCertification(BaseAppModel):
@@ -179,6 +191,8 @@ class UserLicense(BaseAppModel):
     license_number = models.CharField(max_length=250, blank=True)
     completion_date = models.DateField(blank=True, null=True)
     expiration_date = models.DateField(blank=True, null=True)
+    is_expired = models.BooleanField(default=False)
+    last_reminder_days = models.PositiveSmallIntegerField(blank=True, null=True)
     user: User = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         models.CASCADE,
@@ -186,13 +200,31 @@ class UserLicense(BaseAppModel):
         null=True,
         related_name="user_licenses")
 
+    tracker = FieldTracker(fields=["expiration_date"])
+
     class Meta:
         db_table = 'user_license'
         verbose_name = "User License"
+        indexes = [
+            models.Index(fields=["expiration_date", "id"], name="user_license_expiration_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.get_short_name()} : {self.license_type}"
 
+    def save(self, *args, **kwargs):
+        # a renewed license starts its expiration reminders over
+        if self.pk and self.tracker.has_changed("expiration_date"):
+            self.is_expired = False
+            self.last_reminder_days = None
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {
+                    *kwargs["update_fields"],
+                    "is_expired",
+                    "last_reminder_days",
+                }
+        return super(UserLicense, self).save(*args, **kwargs)
+
     def archive(self):
         self.status = True
         self.save()
@@ -224,17 +256,51 @@ class UserSchool(BaseAppModel):
         self.save()
 
 
-# add a signal to automatically create default
-# user settings when a new user is created
-@receiver(post_save, sender=User)
-def create_default_settings(sender, instance, created=False, **kwargs):
-    if created:
-        instance.create_default_settings()
+class UserSearchDocument(models.Model):
+    """
+    Searchable text of a user and their active credentials, one row per user. It is indexed
+    with a GIN index on Postgres and mirrored into an FTS5 table on SQLite, see accounts.search.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        models.CASCADE,
+        primary_key=True,
+        related_name="search_document")
+    document = models.TextField(blank=True, default="")
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_search_document'
+        verbose_name = "User Search Document"
 
 
-# add a signal to automatically create default
-# user profile when a new user is created
-@receiver(post_save, sender=User)
-def create_default_profile(sender, instance, created=False, **kwargs):
-    if created:
-        instance.create_default_profile()
+class DataExport(IndexedTimeStampedModel):
+    """
+    A downloadable archive of everything a user has stored, built by a background task,
+    see accounts.exports.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        models.CASCADE,
+        related_name="data_exports")
+    state = models.CharField(choices=EXPORT_STATES, default=EXPORT_STATES.PENDING, max_length=10)
+    file_name = models.CharField(max_length=100, blank=True, default="")
+    rows = models.IntegerField(blank=True, null=True)
+    size = models.BigIntegerField(blank=True, null=True)
+    completed = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'user_data_export'
+        verbose_name = "User Data Export"
+
+
+# add a signal to automatically create the default user settings and profile
+# of a new user before it is inserted, so the user row is written only once
+@receiver(pre_save, sender=User)
+def create_default_relations(sender, instance, raw=False, **kwargs):
+    if raw or not instance._state.adding:
+        return
+    if instance.user_settings_id is None:
+        instance.user_settings = UserSetting.objects.create()
+    if instance.user_profile_id is None:
+        instance.user_profile = UserProfile.objects.create()
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import Http404
+
+from accounts.serializers import ViewUserSerializer
+from core.cache import get_or_set, invalidate_tags
+
+
+User = get_user_model()
+
+PROFILE_KEY = "user-profile:{user_id}"
+PROFILE_TAG = "user-profile:{user_id}"
+
+
+def get_profile_document(user_id):
+    """
+    The serialized profile page of a user, built with a constant number of queries and
+    cached until the profile changes.
+    """
+    def build():
+        try:
+            user = User.objects.with_profile().get(pk=user_id)
+        except User.DoesNotExist:
+            raise Http404
+        return ViewUserSerializer(user).data
+
+    return get_or_set(
+        PROFILE_KEY.format(user_id=user_id),
+        build,
+        timeout=settings.USER_PROFILE_CACHE_TIMEOUT,
+        tags=[PROFILE_TAG.format(user_id=user_id)],
+        name="user-profile",
+    )
+
+
+def invalidate_profile(user_id):
+    """
+    Drops the cached profile of a user once the current transaction commits, so a concurrent
+    request cannot cache the profile as it was before the change.
+    """
+    tag = PROFILE_TAG.format(user_id=user_id)
+    transaction.on_commit(lambda: invalidate_tags(tag))
@@ -0,0 +1,108 @@
+"""
+Bulk provisioning of user accounts.
+
+Users are created in batches with one multi-row insert per table (settings, profiles, users,
+email addresses and search documents) instead of the several writes and signal round trips
+a single ``create_user`` call costs.
+"""
+import csv
+from collections import namedtuple
+
+from allauth.account.models import EmailAddress
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from accounts import availability, search
+from accounts.models import UserProfile, UserSetting
+from core.bulk import bulk_create_with_pks
+
+
+User = get_user_model()
+
+PROVISION_FIELDS = ("email", "username", "first_name", "last_name", "password")
+
+ProvisionResult = namedtuple("ProvisionResult", ("created", "skipped"))
+
+
+def read_users_csv(csv_file):
+    """
+    Rows of a CSV file with an email and a username column, and optionally first_name,
+    last_name and password columns.
+    """
+    reader = csv.DictReader(csv_file)
+    missing = {"email", "username"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        yield {field: (row.get(field) or "").strip() for field in PROVISION_FIELDS}
+
+
+def provision_users(rows, batch_size=500):
+    """
+    Creates a user, with default settings and profile, for every row. Rows without an email
+    or username, or whose email or username is already taken, are skipped.
+    Users without a password get an unusable one and have to reset it before logging in.
+    Returns the created users and the skipped rows with the reason they were skipped.
+    """
+    created, skipped = [], []
+    batch = []
+    for number, row in enumerate(rows, start=1):
+        batch.append((number, row))
+        if len(batch) == batch_size:
+            _provision_batch(batch, created, skipped)
+            batch = []
+    if batch:
+        _provision_batch(batch, created, skipped)
+    return ProvisionResult(created, skipped)
+
+
+def _provision_batch(batch, created, skipped):
+    emails = {User.objects.normalize_email(row["email"]) for _, row in batch if row["email"]}
+    usernames = {User.normalize_username(row["username"]) for _, row in batch if row["username"]}
+    taken_emails = set(User.objects.filter(email__in=emails).values_list("email", flat=True))
+    taken_usernames = set(
+        User.objects.filter(username__in=usernames).values_list("username", flat=True)
+    )
+
+    users = []
+    for number, row in batch:
+        email = User.objects.normalize_email(row["email"])
+        username = User.normalize_username(row["username"])
+        if not email or not username:
+            skipped.append((number, "email and username are required"))
+            continue
+        if email in taken_emails or username in taken_usernames:
+            skipped.append((number, "email or username already taken"))
+            continue
+        taken_emails.add(email)
+        taken_usernames.add(username)
+        user = User(
+            email=email,
+            username=username,
+            first_name=row.get("first_name") or "",
+            last_name=row.get("last_name") or "",
+        )
+        if row.get("password"):
+            user.set_password(row["password"])
+        else:
+            user.set_unusable_password()
+        users.append(user)
+    if not users:
+        return
+
+    with transaction.atomic():
+        user_settings = bulk_create_with_pks(UserSetting, [UserSetting() for _ in users])
+        profiles = bulk_create_with_pks(UserProfile, [UserProfile() for _ in users])
+        for user, user_setting, profile in zip(users, user_settings, profiles):
+            user.user_settings = user_setting
+            user.user_profile = profile
+        bulk_create_with_pks(User, users)
+        EmailAddress.objects.bulk_create(
+            [
+                EmailAddress(user=user, email=user.email, primary=True, verified=False)
+                for user in users
+            ]
+        )
+        search.index_new_users(users)
+        transaction.on_commit(availability.bump_version)
+    created.extend(users)
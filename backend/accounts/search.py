@@ -0,0 +1,231 @@
+"""
+People search over a per-user search document.
+
+Every user has one ``UserSearchDocument`` holding the folded words of their name, email,
+username and active credentials. The document is rebuilt whenever one of those rows changes,
+so a search reads a single indexed table instead of joining every credential table. The
+``?search=`` of the user list goes through the same documents, see ``PeopleSearchFilter``.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import filters
+
+from accounts.models import (
+    UserCertification,
+    UserEmployer,
+    UserLicense,
+    UserSchool,
+    UserSearchDocument
+)
+from core.prefix_index import normalize
+
+
+User = get_user_model()
+
+_WORD = re.compile(r"\w+")
+
+MAX_TERMS = 8
+
+SEARCH_USER_FIELDS = ("email", "username", "first_name", "last_name")
+
+# credential relations of a user and the columns of each that are searchable
+SEARCH_CREDENTIAL_FIELDS = {
+    "user_certifications": ("certificate_program", "institution_name"),
+    "user_employers": ("employer_name", "position"),
+    "user_licenses": ("issuing_authority", "license_type"),
+    "user_schools": ("school_name", "program"),
+}
+
+
+def words(text):
+    return _WORD.findall(normalize(text))
+
+
+def document_text(user):
+    """
+    The searchable words of a user: their own fields plus the credentials they have not archived.
+    """
+    values = [getattr(user, field) for field in SEARCH_USER_FIELDS]
+    for relation, fields in SEARCH_CREDENTIAL_FIELDS.items():
+        for credential in getattr(user, relation).all():
+            if not credential.status:
+                values.extend(getattr(credential, field) for field in fields)
+    return " ".join(words(" ".join(value for value in values if value)))
+
+
+def document_text_for_new_user(user):
+    # a user that was just created has no credentials yet
+    return " ".join(words(" ".join(getattr(user, field) or "" for field in SEARCH_USER_FIELDS)))
+
+
+def index_new_users(users):
+    """
+    Creates the search documents of freshly created users in bulk.
+    """
+    documents = [
+        UserSearchDocument(user=user, document=document_text_for_new_user(user)) for user in users
+    ]
+    UserSearchDocument.objects.bulk_create(documents)
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO user_search_fts (rowid, document) VALUES (%s, %s)",
+                [(document.user_id, document.document) for document in documents]
+            )
+
+
+def rebuild_documents(user_ids):
+    """
+    Rebuilds the search documents of the given users, dropping those of users that no
+    longer exist.
+    """
+    user_ids = set(user_ids)
+    users = User.objects.filter(pk__in=user_ids).prefetch_related(*SEARCH_CREDENTIAL_FIELDS)
+    for user in users:
+        user_ids.discard(user.pk)
+        document = document_text(user)
+        UserSearchDocument.objects.update_or_create(user=user, defaults={"document": document})
+        _index(user.pk, document)
+    if user_ids:
+        UserSearchDocument.objects.filter(user_id__in=user_ids).delete()
+        for user_id in user_ids:
+            _index(user_id, None)
+
+
+def _index(user_id, document):
+    # Postgres indexes the document table itself; SQLite keeps an FTS5 copy keyed by user id
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM user_search_fts WHERE rowid = %s", [user_id])
+        if document is not None:
+            cursor.execute(
+                "INSERT INTO user_search_fts (rowid, document) VALUES (%s, %s)", [user_id, document]
+            )
+
+
+def _match(terms):
+    """
+    How the active users matching every one of ``terms`` as a prefix are selected from the
+    search index: the FROM and WHERE clauses, the user id column, the rank ordering and the
+    parameters. ``None`` on databases without a full text index.
+    """
+    users = connection.ops.quote_name(User._meta.db_table)
+    if connection.vendor == "postgresql":
+        return (
+            "FROM user_search_document document "
+            f"JOIN {users} account ON account.id = document.user_id, "
+            "to_tsquery('simple', %s) query "
+            "WHERE to_tsvector('simple', document.document) @@ query AND account.is_active",
+            "document.user_id",
+            "ts_rank(to_tsvector('simple', document.document), query) DESC",
+            [" & ".join(f"{term}:*" for term in terms)],
+        )
+    if connection.vendor == "sqlite":
+        return (
+            "FROM user_search_fts "
+            f"JOIN {users} account ON account.id = user_search_fts.rowid "
+            "WHERE user_search_fts MATCH %s AND account.is_active",
+            "user_search_fts.rowid",
+            "bm25(user_search_fts)",
+            [" ".join(f'"{term}"*' for term in terms)],
+        )
+    return None
+
+
+def _matching_documents(terms):
+    documents = UserSearchDocument.objects.filter(user__is_active=True)
+    for term in terms:
+        documents = documents.filter(document__contains=term)
+    return documents
+
+
+def search_user_ids(query, limit=20, offset=0):
+    """
+    Ids of active users matching every word of ``query`` as a prefix, best match first.
+    Each user appears at most once.
+    """
+    terms = words(query)[:MAX_TERMS]
+    if not terms:
+        return []
+    match = _match(terms)
+    if match is None:
+        return list(
+            _matching_documents(terms)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)[offset : offset + limit]
+        )
+    source, user_id, rank, params = match
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {user_id} {source} ORDER BY {rank}, {user_id} LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_users(query, limit=20, offset=0):
+    user_ids = search_user_ids(query, limit=limit, offset=offset)
+    users = User.objects.in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+class PeopleSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` of a user list, matched against the search documents like the ranked people
+    search. The matching users are selected by a subquery on the search index, so the list
+    keeps its own ordering, pagination and count.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = words(" ".join(self.get_search_terms(request)))[:MAX_TERMS]
+        if not terms:
+            return queryset
+        match = _match(terms)
+        if match is None:
+            return queryset.filter(pk__in=_matching_documents(terms).values("user_id"))
+        source, user_id, _, params = match
+        meta = queryset.model._meta
+        quote = connection.ops.quote_name
+        pk = f"{quote(meta.db_table)}.{quote(meta.pk.column)}"
+        # RawSQL is parenthesized once more under __in, which reads as a scalar subquery
+        return queryset.extra(where=[f"{pk} IN (SELECT {user_id} {source})"], params=params)
+
+
+# keep the search documents current whenever a user or one of their credentials changes
+@receiver(post_save, sender=User)
+def rebuild_user_document(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        index_new_users([instance])
+        return
+    if update_fields is not None and not set(update_fields) & set(SEARCH_USER_FIELDS):
+        return
+    rebuild_documents([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def drop_user_document(sender, instance, **kwargs):
+    _index(instance.pk, None)
+
+
+@receiver(post_save, sender=UserCertification)
+@receiver(post_save, sender=UserEmployer)
+@receiver(post_save, sender=UserLicense)
+@receiver(post_save, sender=UserSchool)
+def rebuild_credential_document(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        rebuild_documents([instance.user_id])
+
+
+# deletes may be cascading from the user itself, so wait until the user is really gone or kept
+@receiver(post_delete, sender=UserCertification)
+@receiver(post_delete, sender=UserEmployer)
+@receiver(post_delete, sender=UserLicense)
+@receiver(post_delete, sender=UserSchool)
+def rebuild_deleted_credential_document(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        transaction.on_commit(lambda: rebuild_documents([instance.user_id]))
@@ -1,3 +1,5 @@
+import os
+
 from allauth.account.adapter import get_adapter
 from allauth.account.utils import setup_user_email
 from allauth.utils import get_username_max_length, email_address_exists
@@ -6,7 +8,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from accounts.models import UserSetting, UserProfile, UserCertification, UserEmployer, UserLicense, UserSchool, \
-    DEGREE_TYPE
+    DEGREE_TYPE, DataExport
 from core.serializers import DynamicFieldsModelSerializer, ChoicesField
 
 User = get_user_model()
@@ -365,10 +367,20 @@ class UserSerializer(DynamicFieldsModelSerializer):
     is_verified = serializers.BooleanField(read_only=True, required=False, allow_null=True)
     is_superuser = serializers.BooleanField(read_only=True, required=False, allow_null=True)
     is_active = serializers.BooleanField(read_only=True, required=False, allow_null=True)
+    reputation = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
-        fields = ("id", "email", "username", "is_staff", "is_superuser", "is_verified", "is_active")
+        fields = (
+            "id",
+            "email",
+            "username",
+            "is_staff",
+            "is_superuser",
+            "is_verified",
+            "is_active",
+            "reputation",
+        )
         read_only_fields = (
             "id",
             "created_date",
@@ -376,7 +388,8 @@ class UserSerializer(DynamicFieldsModelSerializer):
             "is_staff",
             "is_superuser",
             "is_verified",
-            "is_active"
+            "is_active",
+            "reputation"
         )
         optional = (
             "email",
@@ -394,6 +407,7 @@ class ListUserSerializer(DynamicFieldsModelSerializer):
     is_verified = serializers.BooleanField(read_only=True, required=False, allow_null=False)
     is_superuser = serializers.BooleanField(read_only=True, required=False, allow_null=False)
     is_active = serializers.BooleanField(read_only=True, required=False, allow_null=False)
+    reputation = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -408,6 +422,7 @@ class ListUserSerializer(DynamicFieldsModelSerializer):
             "is_active",
             "image_url",
             "is_verified",
+            "reputation",
         )
         read_only_fields = (
             "id",
@@ -418,6 +433,7 @@ class ListUserSerializer(DynamicFieldsModelSerializer):
             "is_superuser",
             "is_active",
             "is_verified",
+            "reputation",
             "user_profile",
             "user_settings",
             "user_certifications",
@@ -494,6 +510,41 @@ class ViewUserSerializer(DynamicFieldsModelSerializer):
         )
 
 
+class PeopleSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=True, max_length=200)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=50, default=20)
+    offset = serializers.IntegerField(required=False, min_value=0, default=0)
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    username = serializers.CharField(
+        required=False, max_length=get_username_max_length(), min_length=6
+    )
+    email = serializers.EmailField(required=False, max_length=255)
+
+    def validate(self, data):
+        if not data.get("username") and not data.get("email"):
+            raise serializers.ValidationError(_("Provide a username or an email to check."))
+        return data
+
+
+class CredentialImportSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=("certification", "employer", "license", "school"))
+    file = serializers.FileField(required=True)
+
+    def validate_file(self, file):
+        if os.path.splitext(file.name)[1].lower() not in (".csv", ".xlsx"):
+            raise serializers.ValidationError(_("Only .csv and .xlsx files can be imported."))
+        return file
+
+
+class DataExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DataExport
+        fields = ("id", "user", "state", "rows", "size", "created", "completed")
+        read_only_fields = fields
+
+
 class UpdateUserSerializer(serializers.ModelSerializer):
     image_url = serializers.URLField(required=False, max_length=256, allow_null=True)
     email = serializers.EmailField(required=False, allow_null=False, max_length=255)
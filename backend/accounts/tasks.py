@@ -1,8 +1,73 @@
+from django.conf import settings
 from django.core import management
+from django.core.files.storage import default_storage
 
+from accounts import credential_import, exports, licenses
 from theraq.celery import app as celery_app
 
 
 @celery_app.task
 def clearsessions():
     management.call_command('clearsessions')
+
+
+@celery_app.task
+def sweep_license_expirations():
+    """
+    Flags expired licenses and queues the expiration reminders that are due today.
+    """
+    return licenses.sweep(batch_size=settings.LICENSE_SWEEP_BATCH_SIZE)
+
+
+@celery_app.task
+def send_license_reminders(license_ids, days):
+    return licenses.send_reminders(license_ids, days)
+
+
+@celery_app.task(bind=True)
+def import_user_credentials(self, kind, path):
+    """
+    Imports the credentials of an uploaded CSV or XLSX file in chunks of
+    ``CREDENTIAL_IMPORT_BATCH_SIZE`` rows, reporting progress as the ``PROGRESS`` task state.
+    The upload is deleted once the import is done.
+    """
+    def progress(rows, created, failed):
+        if not self.request.is_eager:
+            self.update_state(
+                state="PROGRESS", meta={"rows": rows, "created": created, "failed": failed}
+            )
+
+    try:
+        with default_storage.open(path, "rb") as file:
+            result = credential_import.import_credentials(
+                kind,
+                credential_import.read_rows(file, path),
+                batch_size=settings.CREDENTIAL_IMPORT_BATCH_SIZE,
+                workers=settings.CREDENTIAL_IMPORT_WORKERS,
+                progress=progress,
+            )
+    finally:
+        default_storage.delete(path)
+    return {
+        "rows": result.rows,
+        "created": result.created,
+        "skipped": result.skipped,
+        "failed": result.failed,
+        "errors": [{"row": number, "error": error} for number, error in result.errors],
+    }
+
+
+@celery_app.task
+def export_user_data(export_id):
+    """
+    Writes the data archive of a queued ``DataExport``.
+    """
+    return exports.run_export(export_id)
+
+
+@celery_app.task
+def expire_data_exports():
+    """
+    Deletes data export archives past their retention period.
+    """
+    return exports.expire_exports()
@@ -1,9 +1,53 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from allauth.account.models import EmailAddress
+from billiard.pool import Pool
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase  # noqa
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings  # noqa
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-
-from accounts.models import UserCertification, UserEmployer, UserLicense, UserSchool
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import availability, licenses
+from accounts.credential_import import import_credentials, read_rows
+from accounts.exports import expire_exports
+from accounts.authentication import CachedJWTCookieAuthentication, CachedTokenAuthentication
+from accounts.models import (
+    DataExport,
+    UserCertification,
+    UserEmployer,
+    UserLicense,
+    UserProfile,
+    UserSchool,
+    UserSetting,
+)
+from accounts.provisioning import provision_users
+from accounts.search import search_user_ids
+from accounts.tasks import import_user_credentials
+from questions.models import Question, QuestionVote
+from subq.models import SubQ, SubQFollower
 
 User = get_user_model()
 
@@ -81,12 +125,511 @@ class TestUserSignals(TestCase):
         self.assertIsNotNone(self.created_user.user_profile)
 
 
+@mock.patch("accounts.authentication.transaction.on_commit", lambda func: func())
+class TestCachedAuthentication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(username="cached", email="cached@tt.com", password="cached_pass")
+        self.factory = APIRequestFactory()
+
+    def authenticate_jwt(self):
+        token = AccessToken.for_user(self.user)
+        request = self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return CachedJWTCookieAuthentication().authenticate(request)
+
+    def authenticate_token(self, token):
+        request = self.factory.get("/", HTTP_AUTHORIZATION=f"Token {token.key}")
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_jwt_user_cached(self):
+        with self.assertNumQueries(1):
+            self.authenticate_jwt()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate_jwt()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.email, self.user.email)
+
+    def test_password_not_cached(self):
+        self.authenticate_jwt()
+        self.assertNotIn("password", cache.get(f"auth-user:{self.user.pk}"))
+        user, _ = self.authenticate_jwt()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password("cached_pass"))
+
+    def test_token_user_cached(self):
+        token = Token.objects.create(user=self.user)
+        with self.assertNumQueries(1):
+            self.authenticate_token(token)
+        with self.assertNumQueries(0):
+            user, auth = self.authenticate_token(token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(auth.key, token.key)
+
+    def test_password_change_invalidates(self):
+        self.authenticate_jwt()
+        self.user.set_password("new_password")
+        self.user.save()
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate_jwt()
+        self.assertTrue(user.check_password("new_password"))
+
+    def test_permission_change_invalidates(self):
+        self.authenticate_jwt()
+        self.user.is_staff = True
+        self.user.save()
+        user, _ = self.authenticate_jwt()
+        self.assertTrue(user.is_staff)
+
+    def test_deactivation_invalidates(self):
+        token = Token.objects.create(user=self.user)
+        self.authenticate_jwt()
+        self.authenticate_token(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_jwt()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token(token)
+
+    def test_deleted_token_invalidates(self):
+        token = Token.objects.create(user=self.user)
+        self.authenticate_token(token)
+        token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token(token)
+
+
+class TestLicenseSweep(TestCase):
+    def setUp(self):
+        self.today = date(2021, 3, 1)
+        self.user = create_user(
+            username="clinician", email="clinician@tt.com", password="clinician_pass"
+        )
+        self.expired = self.create_license(-1)
+        self.soon = self.create_license(5)
+        self.month = self.create_license(25)
+        self.two_months = self.create_license(45)
+        self.later = self.create_license(90)
+        self.archived = self.create_license(-10, status=True)
+
+    def create_license(self, days, **params):
+        return UserLicense.objects.create(
+            issuing_authority="PA", license_type="OT", license_number="123",
+            expiration_date=self.today + timedelta(days=days), user=self.user, **params
+        )
+
+    def refresh(self, user_license):
+        return UserLicense.objects.get(pk=user_license.pk)
+
+    def test_sweep(self):
+        result = licenses.sweep(today=self.today, batch_size=2)
+        self.assertEqual(result, {"expired": 1, "reminded": 3, "skipped": False})
+        self.assertTrue(self.refresh(self.expired).is_expired)
+        self.assertFalse(self.refresh(self.archived).is_expired)
+        self.assertEqual(self.refresh(self.soon).last_reminder_days, 7)
+        self.assertEqual(self.refresh(self.month).last_reminder_days, 30)
+        self.assertEqual(self.refresh(self.two_months).last_reminder_days, 60)
+        self.assertIsNone(self.refresh(self.later).last_reminder_days)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["clinician@tt.com"])
+        self.assertIn("OT license expires within 7 days", mail.outbox[0].subject)
+
+    def test_rerun_is_idempotent(self):
+        licenses.sweep(today=self.today)
+        self.assertTrue(licenses.sweep(today=self.today)["skipped"])
+        result = licenses.sweep(today=self.today, force=True)
+        self.assertEqual(result, {"expired": 0, "reminded": 0, "skipped": False})
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_next_window(self):
+        licenses.sweep(today=self.today)
+        result = licenses.sweep(today=self.today + timedelta(days=16), force=True)
+        # the 45 day license is now 29 days out, the 25 day one 9 days out
+        self.assertEqual(result["reminded"], 1)
+        self.assertEqual(self.refresh(self.two_months).last_reminder_days, 30)
+
+    def test_renewal_resets_flags(self):
+        licenses.sweep(today=self.today)
+        renewed = self.refresh(self.expired)
+        renewed.expiration_date = self.today + timedelta(days=365)
+        renewed.save()
+        renewed = self.refresh(self.expired)
+        self.assertFalse(renewed.is_expired)
+        self.assertIsNone(renewed.last_reminder_days)
+
+
+class TestUserProvisioning(TestCase):
+    def rows(self, count, start=0):
+        return [
+            {"email": f"user{number}@tt.com", "username": f"user{number}", "first_name": "Pat"}
+            for number in range(start, start + count)
+        ]
+
+    def test_create_user_writes_each_table_once(self):
+        # settings, profile, user, search document and its full text row
+        with self.assertNumQueries(5):
+            user = create_user(username="single", email="single@tt.com", password="single_pass")
+        self.assertIsNotNone(user.user_settings_id)
+        self.assertIsNotNone(user.user_profile_id)
+
+    def test_provision_users(self):
+        result = provision_users(self.rows(3))
+        self.assertEqual(len(result.created), 3)
+        for user in User.objects.filter(username__startswith="user"):
+            self.assertIsNotNone(user.user_settings)
+            self.assertIsNotNone(user.user_profile)
+            self.assertFalse(user.has_usable_password())
+        self.assertEqual(UserSetting.objects.count(), 3)
+        self.assertEqual(UserProfile.objects.count(), 3)
+        self.assertEqual(len(search_user_ids("pat")), 3)
+
+    def test_provision_users_constant_queries(self):
+        provision_users(self.rows(2))
+        with self.assertNumQueries(13):
+            provision_users(self.rows(2, start=10))
+        with self.assertNumQueries(13):
+            provision_users(self.rows(20, start=20))
+
+    def test_provision_users_skips_taken_and_incomplete_rows(self):
+        create_user(username="user0", email="someone@tt.com", password="user0_pass")
+        rows = self.rows(2) + [
+            {"email": "user1@tt.com", "username": "other"},
+            {"email": "", "username": "x"},
+        ]
+        result = provision_users(rows)
+        self.assertEqual([user.username for user in result.created], ["user1"])
+        self.assertEqual([number for number, _ in result.skipped], [1, 3, 4])
+
+    def test_provision_users_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("email,username,first_name,last_name,password\n")
+            csv_file.write("ann@tt.com,ann_user,Ann,Lee,ann_password\n")
+        self.addCleanup(os.unlink, csv_file.name)
+        out = StringIO()
+        call_command("provision_users", csv_file.name, stdout=out)
+        self.assertIn("Provisioned 1 users", out.getvalue())
+        self.assertTrue(User.objects.get(username="ann_user").check_password("ann_password"))
+
+    def test_admin_provision(self):
+        super_user = User.objects.create_superuser(
+            username="admin", email="admin@tt.com", password="admin"
+        )
+        self.client.force_login(super_user)
+        upload = SimpleUploadedFile(
+            "users.csv", b"email,username\nbo@tt.com,bo_user\n", content_type="text/csv"
+        )
+        res = self.client.post(reverse("admin:accounts_user_provision"), {"csv_file": upload})
+        self.assertRedirects(
+            res, reverse("admin:accounts_user_changelist"), fetch_redirect_response=False
+        )
+        self.assertTrue(User.objects.filter(username="bo_user").exists())
+
+
+class TestAvailability(APITestCase):
+    def setUp(self):
+        cache.clear()
+        availability.account_filter = availability.AccountFilter()
+        self.user = create_user(username="Taken_User", email="taken@tt.com", password="taken_pass")
+        self.client = APIClient()
+
+    def test_available_without_queries(self):
+        res = self.client.get(
+            "/api/users/user/availability/", {"username": "free_user", "email": "free@tt.com"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data["username"]["available"])
+        self.assertTrue(res.data["email"]["available"])
+        with self.assertNumQueries(0):
+            self.client.get("/api/users/user/availability/", {"username": "other_free_user"})
+
+    def test_taken_and_reserved(self):
+        res = self.client.get(
+            "/api/users/user/availability/", {"username": "taken_user", "email": "TAKEN@tt.com"}
+        )
+        self.assertEqual(
+            res.data["username"], {"value": "taken_user", "available": False, "reason": "taken"}
+        )
+        self.assertEqual(res.data["email"]["reason"], "taken")
+        res = self.client.get("/api/users/user/availability/", {"username": "Administrator"})
+        self.assertEqual(res.data["username"]["reason"], "reserved")
+
+    def test_new_users_are_added(self):
+        self.assertEqual(availability.username_status("new_signup"), (True, None))
+        other_process = availability.AccountFilter()
+        other_process.refresh()
+        create_user(username="new_signup", email="new@tt.com", password="new_pass")
+        self.assertEqual(availability.username_status("new_signup"), (False, "taken"))
+        # other processes pick the user up once the version changes on commit
+        self.assertFalse(other_process.might_contain("new@tt.com"))
+        availability.bump_version()
+        self.assertTrue(other_process.might_contain("new@tt.com"))
+
+    def test_secondary_email_address_is_taken(self):
+        other_process = availability.AccountFilter()
+        other_process.refresh()
+        EmailAddress.objects.create(user=self.user, email="Second@tt.com", verified=False)
+        self.assertEqual(availability.email_status("second@tt.com"), (False, "taken"))
+        availability.bump_version()
+        self.assertTrue(other_process.might_contain("second@tt.com"))
+        # a filter built from scratch holds the address as well
+        availability.account_filter = availability.AccountFilter()
+        self.assertEqual(availability.email_status("SECOND@tt.com"), (False, "taken"))
+
+    def test_requires_a_value(self):
+        res = self.client.get("/api/users/user/availability/")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SharedStorage(Storage):
+    """
+    An object store shared by every dyno, like the S3 bucket of production: files are kept in
+    memory, never on the local disk of a dyno.
+    """
+
+    files = {}
+
+    def _open(self, name, mode="rb"):
+        if name not in self.files:
+            raise FileNotFoundError(name)
+        return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        self.files[name] = b"".join(content.chunks())
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def size(self, name):
+        return len(self.files[name])
+
+
+class DynoStorageMixin:
+    """
+    Keeps files in a ``SharedStorage`` and gives the web and worker "dynos" a ``MEDIA_ROOT``
+    each, which must stay empty.
+    """
+
+    def setUp(self):
+        super().setUp()
+        SharedStorage.files.clear()
+        self.web_root = tempfile.mkdtemp()
+        self.worker_root = tempfile.mkdtemp()
+        for root in (self.web_root, self.worker_root):
+            self.addCleanup(shutil.rmtree, root)
+        overrides = override_settings(
+            DEFAULT_FILE_STORAGE="accounts.tests.SharedStorage", MEDIA_ROOT=self.web_root
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def on_worker(self):
+        return override_settings(MEDIA_ROOT=self.worker_root)
+
+    def assertNoLocalFiles(self):
+        self.assertEqual(os.listdir(self.web_root) + os.listdir(self.worker_root), [])
+
+
+class TestCredentialImport(DynoStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ann = create_user(username="ann_user", email="ann@tt.com", password="ann_pass")
+        self.bo = create_user(username="bo_user", email="bo@tt.com", password="bo_pass")
+
+    def test_import_csv(self):
+        content = (
+            "email,username,issuing_authority,license_type,license_number,expiration_date\n"
+            "ann@tt.com,,State Board,LPC,100,2030-01-31\n"
+            ",bo_user,State Board,LMFT,200,\n"
+            ",,State Board,LPC,300,\n"
+            "nobody@tt.com,,State Board,LPC,400,\n"
+            "bo@tt.com,,State Board,,500,31/01/2030\n"
+        ).encode()
+        result = import_credentials(
+            "license", read_rows(BytesIO(content), "licenses.csv"), batch_size=2
+        )
+        self.assertEqual((result.rows, result.created, result.failed), (5, 2, 3))
+        self.assertEqual([number for number, _ in result.errors], [4, 5, 6])
+        self.assertEqual(self.ann.user_licenses.get().expiration_date, date(2030, 1, 31))
+        self.assertEqual(self.bo.user_licenses.get().license_type, "LMFT")
+        self.assertEqual(search_user_ids("lmft"), [self.bo.pk])
+
+    def test_import_xlsx(self):
+        workbook = Workbook()
+        workbook.active.append(
+            ["Username", "School_Name", "Degree_Type", "Current_Student", "Start_Date"]
+        )
+        workbook.active.append(
+            ["ann_user", "State University", "masters", True, datetime(2018, 9, 1)]
+        )
+        workbook.active.append(["bo_user", "State University", "diploma", "no", None])
+        file = BytesIO()
+        workbook.save(file)
+        file.seek(0)
+        result = import_credentials("school", read_rows(file, "schools.xlsx"))
+        self.assertEqual((result.created, result.failed), (1, 1))
+        school = self.ann.user_schools.get()
+        self.assertEqual((school.degree_type, school.current_student), ("MASTERS", True))
+        self.assertEqual(school.start_date, date(2018, 9, 1))
+
+    def test_import_queries_do_not_grow_with_rows(self):
+        for count in (10, 50):
+            content = "email,employer_name,position\n" + "".join(
+                f"ann@tt.com,Clinic,Therapist {number}\n" for number in range(count)
+            )
+            # user lookup, user lock, existing credentials, insert and the search document
+            # rebuild of the one affected user
+            with self.assertNumQueries(17):
+                result = import_credentials(
+                    "employer", read_rows(BytesIO(content.encode()), "employers.csv")
+                )
+            self.assertEqual(result.created, count)
+            self.ann.user_employers.all().delete()
+
+    def test_import_skips_existing_credentials(self):
+        content = (
+            "email,institution_name,certificate_program,certificate_number\n"
+            "ann@tt.com,Red Cross,CPR,\n"
+            "ann@tt.com,Red Cross,CPR,\n"
+            "ann@tt.com,Red Cross,CPR,A-1\n"
+            "bo@tt.com,Red Cross,CPR,\n"
+        ).encode()
+        result = import_credentials(
+            "certification", read_rows(BytesIO(content), "certifications.csv"), batch_size=2
+        )
+        self.assertEqual((result.rows, result.created, result.skipped), (4, 3, 1))
+        result = import_credentials(
+            "certification", read_rows(BytesIO(content), "certifications.csv")
+        )
+        self.assertEqual((result.created, result.skipped, result.failed), (0, 4, 0))
+        self.assertEqual(self.ann.user_certifications.count(), 2)
+        self.assertEqual(self.bo.user_certifications.count(), 1)
+
+    def test_import_validates_in_pool_of_daemonic_process(self):
+        # as in a Celery prefork worker
+        content = "email,employer_name,position\n" + "ann@tt.com,Clinic,Therapist\n"
+        with mock.patch.dict(multiprocessing.current_process()._config, daemon=True), \
+                mock.patch("accounts.credential_import.Pool", wraps=Pool) as pool:
+            result = import_credentials(
+                "employer", read_rows(BytesIO(content.encode()), "employers.csv"), workers=2
+            )
+        pool.assert_called_once_with(2)
+        self.assertEqual(result.created, 1)
+
+    def test_import_endpoint(self):
+        _, client = create_super_client()
+        upload = SimpleUploadedFile(
+            "certifications.csv",
+            b"username,institution_name,certificate_program\nbo_user,Institute,CBT\n",
+            content_type="text/csv"
+        )
+        with mock.patch("accounts.views.import_user_credentials.delay") as delay:
+            delay.return_value.id = "import-task"
+            res = client.post("/api/users/user/import/", {"kind": "certification", "file": upload})
+        self.assertEqual(res.data, {"task_id": "import-task"})
+        # the upload is read back on a worker dyno
+        with self.on_worker():
+            result = import_user_credentials.apply(delay.call_args[0]).get()
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(self.bo.user_certifications.get().certificate_program, "CBT")
+        self.assertEqual(SharedStorage.files, {})
+        self.assertNoLocalFiles()
+
+    def test_import_endpoint_requires_superuser(self):
+        _, client = create_normal_client()
+        upload = SimpleUploadedFile(
+            "schools.csv", b"username,school_name\n", content_type="text/csv"
+        )
+        res = client.post("/api/users/user/import/", {"kind": "school", "file": upload})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TestDataExport(DynoStorageMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.test_user, self.normal_client = create_normal_client()
+        self.other = create_user(username="other", email="other@tt.com", password="other_pass")
+        subq = SubQ.objects.create(sub_name="export-sub", owner=self.other)
+        SubQFollower.objects.create(follower=self.test_user, subq=subq)
+        question = Question.objects.create(
+            slug="export-question",
+            post_title="Export",
+            post_body="Body",
+            author=self.test_user,
+            subq=subq,
+        )
+        QuestionVote.objects.create(question=question, user=self.test_user, vote_type="UP_VOTE")
+        UserLicense.objects.create(
+            user=self.test_user, issuing_authority="Board", license_type="LPC"
+        )
+
+    def export(self):
+        with mock.patch("accounts.views.transaction.on_commit", lambda func: func()), \
+                self.on_worker():
+            res = self.normal_client.post(f"/api/users/user/{self.test_user.username}/export/")
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        return DataExport.objects.get(pk=res.data["id"])
+
+    def test_export_and_download(self):
+        export = self.export()
+        self.assertEqual(export.state, "READY")
+        self.assertTrue(default_storage.exists(export.file_name))
+        res = self.normal_client.get(f"/api/users/user/exports/{export.pk}/download/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with zipfile.ZipFile(BytesIO(b"".join(res.streaming_content))) as archive:
+            user = json.loads(archive.read("user.jsonl"))
+            self.assertEqual(user["username"], "test_user")
+            self.assertNotIn("password", user)
+            self.assertEqual(len(archive.read("questions.jsonl").splitlines()), 1)
+            self.assertEqual(len(archive.read("question_votes.jsonl").splitlines()), 1)
+            self.assertEqual(len(archive.read("licenses.jsonl").splitlines()), 1)
+            self.assertEqual(len(archive.read("memberships.jsonl").splitlines()), 1)
+            self.assertEqual(archive.read("schools.jsonl"), b"")
+        self.assertNoLocalFiles()
+
+    def test_export_is_sent_after_commit(self):
+        with mock.patch("accounts.views.export_user_data.delay") as delay:
+            res = self.normal_client.post(f"/api/users/user/{self.test_user.username}/export/")
+        self.assertEqual(res.data["state"], "PENDING")
+        delay.assert_not_called()
+
+    def test_expired_export(self):
+        export = self.export()
+        completed = timezone.now() - timedelta(days=settings.DATA_EXPORT_RETENTION_DAYS, minutes=1)
+        DataExport.objects.filter(pk=export.pk).update(completed=completed)
+        res = self.normal_client.get(f"/api/users/user/exports/{export.pk}/download/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(expire_exports(), 1)
+        self.assertFalse(default_storage.exists(export.file_name))
+        self.assertEqual(DataExport.objects.get(pk=export.pk).state, "EXPIRED")
+        self.assertEqual(expire_exports(), 0)
+
+    def test_export_of_other_user(self):
+        res = self.normal_client.post(f"/api/users/user/{self.other.pk}/export/")
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        export = DataExport.objects.create(user=self.other, state="READY")
+        res = self.normal_client.get(f"/api/users/user/exports/{export.pk}/")
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_download_before_ready(self):
+        export = DataExport.objects.create(user=self.test_user)
+        res = self.normal_client.get(f"/api/users/user/exports/{export.pk}/")
+        self.assertEqual(res.data["state"], "PENDING")
+        res = self.normal_client.get(f"/api/users/user/exports/{export.pk}/download/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class TestUserViewSet(APITestCase):
     def setUp(self):
         self.test_user, self.normal_client = create_normal_client()
         self.super_user, self.super_client = create_super_client()
         self.user1 = create_user(username="user1", email="user1@tt.com", password="user1_pass")
         self.user2 = create_user(username="user2", email="user2@tt.com", password="user2_pass")
+        cache.clear()
 
     def test_get_list(self):
         res = self.normal_client.get("/api/users/user/")
@@ -103,6 +646,55 @@ class TestUserViewSet(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(self.user2.id, res.data["id"])
 
+    def test_retrieve_constant_queries(self):
+        for number in range(3):
+            UserCertification.objects.create(
+                user=self.user1, institution_name=f"School {number}", certificate_program="CPR"
+            )
+            UserSchool.objects.create(user=self.user1, school_name=f"School {number}")
+        with self.assertNumQueries(5):
+            res = self.normal_client.get(f"/api/users/user/{self.user1.pk}/")
+        self.assertEqual(len(res.data["user_certifications"]), 3)
+        self.assertEqual(len(res.data["user_schools"]), 3)
+        with self.assertNumQueries(0):
+            self.normal_client.get(f"/api/users/user/{self.user1.pk}/")
+
+    @mock.patch("accounts.profiles.transaction.on_commit", lambda func: func())
+    def test_retrieve_invalidated_by_child_viewsets(self):
+        self.normal_client.get(f"/api/users/user/{self.test_user.pk}/")
+        res = self.normal_client.post(
+            "/api/users/certifications/",
+            {"institution_name": "Red Cross", "certificate_program": "CPR"},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.normal_client.get(f"/api/users/user/{self.test_user.username}/")
+        self.assertEqual(len(res.data["user_certifications"]), 1)
+
+        self.normal_client.patch(
+            f"/api/users/profile/{self.test_user.pk}/", {"headline": "Updated"}
+        )
+        res = self.normal_client.get(f"/api/users/user/{self.test_user.pk}/")
+        self.assertEqual(res.data["user_profile"]["headline"], "Updated")
+
+    def test_retrieve_invalidated_after_commit(self):
+        self.normal_client.get(f"/api/users/user/{self.test_user.pk}/")
+        callbacks = []
+        with mock.patch("accounts.profiles.transaction.on_commit", callbacks.append):
+            self.normal_client.patch(
+                f"/api/users/profile/{self.test_user.pk}/", {"headline": "Updated"}
+            )
+        res = self.normal_client.get(f"/api/users/user/{self.test_user.pk}/")
+        self.assertNotEqual(res.data["user_profile"]["headline"], "Updated")
+
+        for callback in callbacks:
+            callback()
+        res = self.normal_client.get(f"/api/users/user/{self.test_user.pk}/")
+        self.assertEqual(res.data["user_profile"]["headline"], "Updated")
+
+    def test_retrieve_missing_user(self):
+        res = self.normal_client.get("/api/users/user/999999/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_update_user_not_permitted(self):
         payload = {"first_name": "Peter", "last_name": "Pan"}
         res = self.normal_client.patch(f"/api/users/user/{self.user1.pk}/", payload)
@@ -573,3 +1165,73 @@ class TestUserSchoolViewSet(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         school_refreshed = UserSchool.objects.get(pk=new_school.pk)
         self.assertTrue(school_refreshed.status)
+
+
+class TestPeopleSearch(APITestCase):
+    def setUp(self):
+        self.test_user, self.normal_client = create_normal_client()
+        self.user1 = create_user(username="jsmith", email="jane@tt.com", password="user1_pass",
+                                 first_name="Jane", last_name="Smith")
+        self.user2 = create_user(username="bjones", email="bob@tt.com", password="user2_pass",
+                                 first_name="Bob", last_name="Jones")
+        UserEmployer.objects.create(
+            employer_name="Lancaster General", position="Occupational Therapist", user=self.user1
+        )
+        UserSchool.objects.create(school_name="Pennsylvania State University", program="OT",
+                                  user=self.user1)
+        UserSchool.objects.create(school_name="Pennsylvania College", program="PT", user=self.user2)
+
+    def search(self, query):
+        res = self.normal_client.get("/api/users/user/search/", {"q": query})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [user["id"] for user in res.data["results"]]
+
+    def test_search_by_name_and_credentials(self):
+        self.assertEqual(self.search("jane"), [self.user1.pk])
+        self.assertEqual(self.search("occupational lanc"), [self.user1.pk])
+        self.assertCountEqual(self.search("penn"), [self.user1.pk, self.user2.pk])
+        self.assertEqual(self.search("nobody"), [])
+
+    def test_search_lists_each_user_once(self):
+        UserSchool.objects.create(school_name="Pennsylvania Tech", program="OT", user=self.user1)
+        self.assertCountEqual(self.search("penn"), [self.user1.pk, self.user2.pk])
+
+    def test_search_follows_credential_changes(self):
+        school = UserSchool.objects.get(user=self.user2)
+        school.archive()
+        self.assertEqual(self.search("penn"), [self.user1.pk])
+
+        self.user2.first_name = "Robert"
+        self.user2.save()
+        self.assertEqual(self.search("robert"), [self.user2.pk])
+
+    def test_search_skips_inactive_users(self):
+        self.user1.is_active = False
+        self.user1.save()
+        self.assertEqual(self.search("penn"), [self.user2.pk])
+
+    def test_search_requires_query(self):
+        res = self.normal_client.get("/api/users/user/search/")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_search_by_position(self):
+        res = self.normal_client.get("/api/users/user/", {"search": "Therapist"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([user["id"] for user in res.data["results"]], [self.user1.pk])
+
+    def test_list_search_uses_search_documents(self):
+        UserSchool.objects.create(school_name="Pennsylvania Tech", program="OT", user=self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            res = self.normal_client.get("/api/users/user/", {"search": "penn"})
+        self.assertCountEqual(
+            [user["id"] for user in res.data["results"]], [self.user1.pk, self.user2.pk]
+        )
+        self.assertFalse(any("user_school" in query["sql"] for query in queries))
+
+    def test_list_search_pages_through_every_match(self):
+        for i in range(11):
+            create_user(username=f"penn{i}", email=f"penn{i}@tt.com", password="pass")
+        res = self.normal_client.get("/api/users/user/", {"search": "penn", "offset": 10})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 13)
+        self.assertEqual(len(res.data["results"]), 3)
@@ -64,6 +64,30 @@ user_urlpatterns = [
     path("user/", UserViewSet.as_view({
         'get': 'list'
     })),
+    path("user/search/", UserViewSet.as_view({
+        'get': 'search'
+    })),
+    path("user/availability/", UserViewSet.as_view({
+        'get': 'availability'
+    })),
+    path("user/import/", UserViewSet.as_view({
+        'post': 'import_credentials'
+    })),
+    path("user/import/<str:task_id>/", UserViewSet.as_view({
+        'get': 'import_status'
+    })),
+    path("user/exports/<int:export_id>/", UserViewSet.as_view({
+        'get': 'export_status'
+    })),
+    path("user/exports/<int:export_id>/download/", UserViewSet.as_view({
+        'get': 'export_download'
+    })),
+    path("user/<int:pk>/export/", UserViewSet.as_view({
+        'post': 'export'
+    })),
+    path("user/<slug:username>/export/", UserViewSet.as_view({
+        'post': 'export'
+    })),
     path("user/<int:pk>/", UserViewSet.as_view({
         'get': 'retrieve',
         'put': 'update',
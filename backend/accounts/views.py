@@ -1,13 +1,24 @@
 import json
+import os
+import uuid
 
+from celery.result import AsyncResult
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework import filters, mixins
+from rest_framework import filters, mixins, permissions, status
 
+from accounts.availability import email_status, username_status
+from accounts.exports import is_downloadable
 from accounts.models import (
+    DataExport,
     UserSetting,
     UserProfile,
     UserCertification,
@@ -15,6 +26,8 @@ from accounts.models import (
     UserLicense,
     UserSchool
 )
+from accounts.profiles import get_profile_document, invalidate_profile
+from accounts.search import PeopleSearchFilter, search_users
 from accounts.serializers import (
     ViewUserSettingSerializer,
     UpdateUserSettingSerializer,
@@ -34,8 +47,14 @@ from accounts.serializers import (
     UpdateUserSchoolSerializer,
     CreateUserSchoolSerializer,
     ViewUserSchoolSerializer,
-    ListUserSerializer
+    ListUserSerializer,
+    PeopleSearchQuerySerializer,
+    CredentialImportSerializer,
+    DataExportSerializer,
+    AvailabilityQuerySerializer
 )
+from accounts.tasks import export_user_data, import_user_credentials
+from core.openapi import UnpaginatedAutoSchema
 from core.renderers import TheraQJsonRenderer
 
 User = get_user_model()
@@ -69,6 +88,7 @@ class UserSettingViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, vie
         serializer = ViewUserSettingSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user.pk)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -88,14 +108,15 @@ class UserProfileViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, vie
 
     def update(self, request, *args, **kwargs):
         try:
-            item = get_object_or_404(UserSetting, user__username=kwargs["username"])
+            item = get_object_or_404(UserProfile, user__username=kwargs["username"])
         except KeyError:
-            item = get_object_or_404(UserSetting, pk=kwargs["pk"])
+            item = get_object_or_404(UserProfile, pk=kwargs["pk"])
         serializer = ViewUserProfileSerialzer(item, data=request.data)
         if item.user.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user.pk)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -107,36 +128,205 @@ class UserViewSet(mixins.ListModelMixin,
     queryset = User.objects.all()
     serializer_class = ViewUserSerializer
     renderer_classes = (TheraQJsonRenderer,)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, PeopleSearchFilter]
     filterset_fields = ["id", "is_staff", "is_superuser", "is_active", "is_verified"]
-    search_fields = ["email", "username", "user_certifications__certificate_program",
-                     "user_certifications__institution_name", "user_employers__employer_name",
-                     "users_employer__position", "user_licenses__issuing_authority", "user_licenses__license_type",
-                     "user_schools__school_name", "user_schools__program"]
 
     def get_serializer_class(self):
-        if self.action == "list":
+        if self.action in ("list", "search"):
             return ListUserSerializer
         return ViewUserSerializer
 
+    def get_permissions(self):
+        if self.action == "availability":
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
     def retrieve(self, request, *args, **kwargs):
+        try:
+            user_id = get_object_or_404(
+                User.objects.values_list("pk", flat=True), username=kwargs["username"]
+            )
+        except KeyError:
+            user_id = kwargs["pk"]
+        return Response(get_profile_document(user_id))
+
+    @swagger_auto_schema(
+        query_serializer=PeopleSearchQuerySerializer,
+        responses={200: ListUserSerializer(many=True), 400: "Bad Request"},
+        auto_schema=UnpaginatedAutoSchema,
+    )
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="Ranked people search",
+        url_name="search",
+    )
+    def search(self, request, *args, **kwargs):
+        """
+        Searches users by name, email, username and credentials. Every word of q must match
+        the start of a word, results are ranked by relevance and each user is listed once.
+        """
+        query = PeopleSearchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=400)
+        users = search_users(
+            query.validated_data["q"],
+            limit=query.validated_data["limit"],
+            offset=query.validated_data["offset"]
+        )
+        serializer = ListUserSerializer(users, many=True)
+        return Response({"results": serializer.data})
+
+    @swagger_auto_schema(
+        query_serializer=AvailabilityQuerySerializer,
+        responses={200: "Availability of the username and email", 400: "Bad Request"}
+    )
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="Username and email availability",
+        url_name="availability",
+    )
+    def availability(self, request, *args, **kwargs):
+        """
+        Whether a username and/or email can still be used to sign up. Answered from an in-memory
+        filter of existing accounts, so most checks do not query the database.
+        """
+        query = AvailabilityQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = {}
+        for field, check in (("username", username_status), ("email", email_status)):
+            value = query.validated_data.get(field)
+            if value:
+                available, reason = check(value)
+                data[field] = {"value": value, "available": available, "reason": reason}
+        return Response(data)
+
+    @swagger_auto_schema(
+        request_body=CredentialImportSerializer,
+        responses={202: "Import Task Id", 400: "Bad Request", 401: "Unauthorized"}
+    )
+    @action(
+        detail=False,
+        methods=['POST'],
+        name="Bulk import of user credentials",
+        url_name="import_credentials",
+    )
+    def import_credentials(self, request, *args, **kwargs):
+        """
+        Queues the import of a CSV or XLSX file of certifications, employers, licenses or
+        schools. Every row names its user in an email or username column.
+        """
+        if not request.user.is_superuser:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = CredentialImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        upload = serializer.validated_data["file"]
+        extension = os.path.splitext(upload.name)[1].lower()
+        # read back by the task on a bulk worker dyno, see DEFAULT_FILE_STORAGE in production
+        path = default_storage.save(f"imports/credentials/{uuid.uuid4().hex}{extension}", upload)
+        task = import_user_credentials.delay(serializer.validated_data["kind"], path)
+        return Response(status=status.HTTP_202_ACCEPTED, data={"task_id": task.id})
+
+    @swagger_auto_schema(responses={200: "Import Task State", 401: "Unauthorized"})
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="State of a credential import",
+        url_name="import_status",
+    )
+    def import_status(self, request, *args, **kwargs):
+        """
+        Reports the state and progress of a queued credential import.
+        """
+        if not request.user.is_superuser:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        result = AsyncResult(kwargs["task_id"], app=import_user_credentials.app)
+        info = result.info if isinstance(result.info, dict) else None
+        return Response(
+            status=200, data={"task_id": result.id, "state": result.state, "progress": info}
+        )
+
+    @swagger_auto_schema(responses={202: DataExportSerializer, 401: "Unauthorized"})
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Export all data of a user",
+        url_name="export",
+    )
+    def export(self, request, *args, **kwargs):
+        """
+        Queues an archive of everything the user has stored: profile, credentials, questions,
+        replies, comments, votes, watches and memberships.
+        """
         try:
             item = get_object_or_404(User, username=kwargs["username"])
         except KeyError:
             item = get_object_or_404(User, pk=kwargs["pk"])
-        serializer = ViewUserSerializer(item)
-        return Response(serializer.data)
+        if item.pk != request.user.pk and not request.user.is_superuser:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        export = DataExport.objects.create(user=item)
+        transaction.on_commit(lambda: export_user_data.delay(export.pk))
+        return Response(DataExportSerializer(export).data, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(
+        responses={200: DataExportSerializer, 401: "Unauthorized", 404: "Export Does not Exist"}
+    )
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="State of a data export",
+        url_name="export_status",
+    )
+    def export_status(self, request, *args, **kwargs):
+        export = self._get_export(request, kwargs["export_id"])
+        if export is None:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        return Response(DataExportSerializer(export).data)
+
+    @swagger_auto_schema(
+        responses={200: "Zip Archive", 401: "Unauthorized", 404: "Export Not Ready"}
+    )
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="Download a data export",
+        url_name="export_download",
+    )
+    def export_download(self, request, *args, **kwargs):
+        """
+        The finished archive, a zip of JSON Lines files.
+        """
+        export = self._get_export(request, kwargs["export_id"])
+        if export is None:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        if not is_downloadable(export):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            default_storage.open(export.file_name, "rb"),
+            as_attachment=True,
+            filename=f"theraq-data-{export.user_id}-{export.completed:%Y%m%d}.zip",
+        )
+
+    def _get_export(self, request, export_id):
+        export = get_object_or_404(DataExport, pk=export_id)
+        if export.user_id != request.user.pk and not request.user.is_superuser:
+            return None
+        return export
 
     def update(self, request, *args, **kwargs):
         try:
-            item = get_object_or_404(User, username=kwargs["username"])
+            item = get_object_or_404(User.objects.with_profile(), username=kwargs["username"])
         except KeyError:
-            item = get_object_or_404(User, pk=kwargs["pk"])
+            item = get_object_or_404(User.objects.with_profile(), pk=kwargs["pk"])
         if item.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         serializer = ViewUserSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.pk)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -159,6 +349,7 @@ class UserCertificationViewSet(viewsets.ModelViewSet):
         serializer = CreateUserCertificationSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
+            invalidate_profile(request.user.pk)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
@@ -176,6 +367,7 @@ class UserCertificationViewSet(viewsets.ModelViewSet):
         serializer = ViewUserCertificationSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -184,6 +376,7 @@ class UserCertificationViewSet(viewsets.ModelViewSet):
         if item.user.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         item.archive()
+        invalidate_profile(item.user_id)
         return Response(status=204)
 
 
@@ -205,6 +398,7 @@ class UserEmployerViewSet(viewsets.ModelViewSet):
         serializer = CreateUserEmployerSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
+            invalidate_profile(request.user.pk)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
@@ -221,6 +415,7 @@ class UserEmployerViewSet(viewsets.ModelViewSet):
         serializer = UpdateUserEmployerSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -229,6 +424,7 @@ class UserEmployerViewSet(viewsets.ModelViewSet):
         if item.user.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         item.archive()
+        invalidate_profile(item.user_id)
         return Response(status=204)
 
 
@@ -250,6 +446,7 @@ class UserLicenseViewSet(viewsets.ModelViewSet):
         serializer = CreateUserLicenseSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
+            invalidate_profile(request.user.pk)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
@@ -266,6 +463,7 @@ class UserLicenseViewSet(viewsets.ModelViewSet):
         serializer = ViewUserLicenseSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -274,6 +472,7 @@ class UserLicenseViewSet(viewsets.ModelViewSet):
         if item.user.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         item.archive()
+        invalidate_profile(item.user_id)
         return Response(status=204)
 
 
@@ -295,6 +494,7 @@ class UserSchoolViewSet(viewsets.ModelViewSet):
         serializer = CreateUserSchoolSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save(user=request.user)
+            invalidate_profile(request.user.pk)
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
@@ -311,6 +511,7 @@ class UserSchoolViewSet(viewsets.ModelViewSet):
         serializer = UpdateUserSchoolSerializer(item, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_profile(item.user_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -319,4 +520,5 @@ class UserSchoolViewSet(viewsets.ModelViewSet):
         if item.user.pk != request.user.pk and not request.user.is_superuser:
             return Response(status=401)
         item.archive()
+        invalidate_profile(item.user_id)
         return Response(status=204)
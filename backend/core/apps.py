@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel
+        from core import metrics  # noqa: F401 connects the Celery signals
+        from core.middleware import check_connections
+
+        request_started.connect(check_connections, dispatch_uid="core.check_connections")
@@ -0,0 +1,164 @@
+"""
+An ASGI server interface for the Django WSGI application.
+
+Django 2.2 has neither async views nor an async ORM, so requests still run the regular
+synchronous stack, but on threads of the ASGI process instead of on dedicated worker
+processes: the event loop accepts connections and reads request bodies, and every request is
+offloaded to a thread pool. A process therefore keeps up to ``ASGI_THREADS`` plus
+``ASGI_READ_THREADS`` requests in flight at the memory cost of one worker. GET and HEAD
+requests to ``ASGI_READ_PATHS`` (question detail, the subq list and autocomplete) have their
+own, larger pool, so slow writes and exports cannot starve them.
+
+Every thread keeps its own database connection, which counts against the connection limit of
+the database when ``CONN_MAX_AGE`` is set. The handler refuses to start with more threads than
+``ASGI_DB_CONNECTIONS``, the connections budgeted for one process; run more processes only
+with a larger database plan and a budget to match.
+"""
+import asyncio
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.wsgi import WSGIHandler
+
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class ASGIHandler:
+    def __init__(self):
+        threads = settings.ASGI_THREADS + settings.ASGI_READ_THREADS
+        if threads > settings.ASGI_DB_CONNECTIONS:
+            raise ImproperlyConfigured(
+                f"ASGI_THREADS and ASGI_READ_THREADS add up to {threads} threads, each holding a "
+                f"database connection, over the budget of {settings.ASGI_DB_CONNECTIONS} "
+                f"(ASGI_DB_CONNECTIONS)"
+            )
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(settings.ASGI_THREADS, thread_name_prefix="asgi")
+        self.read_executor = ThreadPoolExecutor(
+            settings.ASGI_READ_THREADS, thread_name_prefix="asgi-read"
+        )
+        self.read_paths = [re.compile(pattern) for pattern in settings.ASGI_READ_PATHS]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(
+                self.executor_for(scope), self.run_wsgi, self.environ(scope, body), send, loop
+            )
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown()
+                self.read_executor.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        """
+        The request body, spooled to disk past ``FILE_UPLOAD_MAX_MEMORY_SIZE``, or None when
+        the client disconnected.
+        """
+        body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+        return body
+
+    def executor_for(self, scope):
+        if scope["method"] in READ_METHODS and any(
+            path.match(scope["path"]) for path in self.read_paths
+        ):
+            return self.read_executor
+        return self.executor
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            # WSGI carries paths as latin-1 decoded bytes
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1")
+            if name == "content-type":
+                key = "CONTENT_TYPE"
+            elif name == "content-length":
+                key = "CONTENT_LENGTH"
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+            value = value.decode("latin-1")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def run_wsgi(self, environ, send, loop):
+        """
+        Runs a request on the current thread and streams the response back through the event
+        loop. Closing the response, which closes the thread's obsolete database connections,
+        happens on the same thread as the request.
+        """
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type="http.response.start",
+                status=int(status.split(" ", 1)[0]),
+                headers=[
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            )
+
+        response = self.wsgi(environ, start_response)
+        try:
+            call(start)
+            for chunk in response:
+                if chunk:
+                    call({"type": "http.response.body", "body": chunk, "more_body": True})
+            call({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            response.close()
@@ -0,0 +1,62 @@
+"""
+A celery beat scheduler that only sends tasks while it holds a lock.
+
+Beat runs as a process of its own (see the Procfile). Should a second one start, during a
+deploy or after scaling the process up by mistake, it finds the lock taken and stays idle
+instead of sending every periodic task twice; it takes over once the first one stops renewing
+the lock for ``BEAT_LOCK_TIMEOUT`` seconds. The lock lives in the default cache, so it is
+shared by every host using the same Redis.
+"""
+import logging
+import os
+import socket
+import uuid
+
+from celery.beat import PersistentScheduler
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+BEAT_LOCK_KEY = "celery-beat-lock"
+
+
+class LockedScheduler(PersistentScheduler):
+    def __init__(self, *args, **kwargs):
+        self.lock_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.locked = False
+        super().__init__(*args, **kwargs)
+
+    def acquire_lock(self):
+        """
+        Takes or renews the lock, returning whether this scheduler holds it.
+        """
+        timeout = settings.BEAT_LOCK_TIMEOUT
+        if cache.add(BEAT_LOCK_KEY, self.lock_owner, timeout):
+            held = True
+        else:
+            held = cache.get(BEAT_LOCK_KEY) == self.lock_owner and cache.touch(
+                BEAT_LOCK_KEY, timeout
+            )
+        if held != self.locked:
+            if held:
+                logger.info("Beat lock acquired by %s", self.lock_owner)
+            else:
+                logger.warning("Beat lock held by %s, not sending tasks", cache.get(BEAT_LOCK_KEY))
+        self.locked = held
+        return held
+
+    def release_lock(self):
+        if self.locked and cache.get(BEAT_LOCK_KEY) == self.lock_owner:
+            cache.delete(BEAT_LOCK_KEY)
+        self.locked = False
+
+    def tick(self, *args, **kwargs):
+        if not self.acquire_lock():
+            return self.max_interval
+        return super().tick(*args, **kwargs)
+
+    def close(self):
+        self.release_lock()
+        super().close()
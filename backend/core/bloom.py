@@ -0,0 +1,39 @@
+"""
+A Bloom filter: a fixed size bit array answering "definitely absent" or "possibly present".
+
+Membership tests never give false negatives, and give false positives at about the
+``error_rate`` the filter was sized for as long as no more than ``capacity`` values are added.
+The bit positions of a value come from one blake2b digest split into two 64 bit hashes and
+combined as ``h1 + i * h2`` (Kirsch-Mitzenmacher double hashing).
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value)
+        )
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
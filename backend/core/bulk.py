@@ -0,0 +1,23 @@
+from django.db import connections, router, transaction
+
+
+def bulk_create_with_pks(model, objs, batch_size=None):
+    """
+    ``bulk_create`` that leaves the primary key set on every object, so the objects can be
+    used as foreign keys right away. ``objs`` must not have primary keys yet.
+
+    Postgres returns the keys from the insert. SQLite can not on this Django version, so the
+    keys are read back from the tail of the table: the insert holds the database write lock
+    until the surrounding transaction ends, which makes the new rows the last ones.
+    """
+    objs = list(objs)
+    using = router.db_for_write(model)
+    manager = model._default_manager.db_manager(using)
+    if not objs or connections[using].vendor != "sqlite":
+        return manager.bulk_create(objs, batch_size=batch_size)
+    with transaction.atomic(using=using, savepoint=False):
+        manager.bulk_create(objs, batch_size=batch_size)
+        pks = list(manager.order_by("-pk").values_list("pk", flat=True)[:len(objs)])
+    for obj, pk in zip(objs, reversed(pks)):
+        obj.pk = pk
+    return objs
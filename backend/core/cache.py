@@ -0,0 +1,323 @@
+"""
+Project-wide caching helpers on top of Django's cache framework.
+
+* ``RedisCache`` is a cache backend on the Redis server the Celery broker already uses, for
+  deployments where every dyno must see the same cache. See ``cache_from_url`` in the settings.
+* Tags: an entry can be stored with tags, and ``invalidate_tags`` drops every entry carrying
+  one of them. Each tag has a version token in the cache; entries remember the versions they
+  were computed under and are discarded when a version moved on.
+* Single flight: when an entry is missing or past its timeout, one process recomputes it under
+  a short lived lock while the others keep serving the previous value for up to
+  ``CACHE_STALE_TTL`` seconds, or wait for the new one when there is none.
+* ``stats`` counts hits, misses, stale reads and recomputes per cache name in each process; the
+  same events are exported as metrics (core.metrics).
+
+``cached`` and ``cached_response`` wrap functions, serializer method fields and views.
+"""
+import functools
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from rest_framework.response import Response
+
+from core.metrics import CACHE_EVENTS
+from core.routers import primary
+
+
+TAG_KEY = "cache-tag:{tag}"
+LOCK_KEY = "cache-lock:{key}"
+
+
+class RedisCache(BaseCache):
+    """
+    Cache backend on a Redis server, ``LOCATION`` being a redis:// URL. Integers are stored as
+    plain Redis integers so ``incr`` is atomic; everything else is pickled.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        # pylint: disable=import-outside-toplevel
+        import redis
+
+        self._client = redis.Redis.from_url(server)
+
+    def _key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expiry(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(0, int(timeout))
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            return False
+        return bool(
+            self._client.set(self._key(key, version), self._dump(value), ex=expiry, nx=True)
+        )
+
+    def get(self, key, default=None, version=None):
+        value = self._client.get(self._key(key, version))
+        return default if value is None else self._load(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            self.delete(key, version=version)
+            return
+        self._client.set(self._key(key, version), self._dump(value), ex=expiry)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        key = self._key(key, version)
+        if expiry is None:
+            return bool(self._client.persist(key)) or bool(self._client.exists(key))
+        return bool(self._client.expire(key, expiry))
+
+    def delete(self, key, version=None):
+        return bool(self._client.delete(self._key(key, version)))
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._client.mget([self._key(key, version) for key in keys])
+        return {key: self._load(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        with self._client.pipeline() as pipeline:
+            for key, value in data.items():
+                if expiry == 0:
+                    pipeline.delete(self._key(key, version))
+                else:
+                    pipeline.set(self._key(key, version), self._dump(value), ex=expiry)
+            pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        return bool(self._client.exists(self._key(key, version)))
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        if not self._client.exists(key):
+            raise ValueError("Key '%s' not found" % key)
+        return self._client.incrby(key, delta)
+
+    def clear(self):
+        # the server is shared with the Celery broker, only drop this cache's keys
+        for key in self._client.scan_iter(match=self.make_key("*")):
+            self._client.delete(key)
+
+
+class CacheStats:
+    """
+    Per-process counters of cache events by cache name.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def record(self, name, event):
+        with self.lock:
+            self.counts[(name, event)] += 1
+        CACHE_EVENTS.inc(cache=name, event=event)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+stats = CacheStats()
+
+
+def tag_versions(tags):
+    """
+    The current version token of every tag, creating the missing ones.
+    """
+    keys = {TAG_KEY.format(tag=tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(*tags):
+    """
+    Drops every entry stored with one of ``tags``.
+    """
+    cache.set_many({TAG_KEY.format(tag=tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def _is_current(entry):
+    if not entry["tags"]:
+        return True
+    return tag_versions(entry["tags"]) == entry["tags"]
+
+
+def get_or_set(key, compute, timeout=None, tags=(), name="default"):
+    """
+    The cached value of ``key``, calling ``compute()`` to (re)build it when it is missing, past
+    ``timeout`` seconds or carries an invalidated tag. Only one process recomputes a key at a
+    time; the others serve the previous value while it is within ``CACHE_STALE_TTL`` of its
+    timeout, and otherwise wait up to ``CACHE_LOCK_WAIT`` seconds for the new value.
+    """
+    timeout = settings.CACHE_DEFAULT_TIMEOUT if timeout is None else timeout
+    entry = cache.get(key)
+    if entry is not None and not _is_current(entry):
+        entry = None
+    if entry is not None and entry["expires"] > time.time():
+        stats.record(name, "hit")
+        return entry["value"]
+
+    lock_key = LOCK_KEY.format(key=key)
+    locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            stats.record(name, "stale")
+            return entry["value"]
+        deadline = time.time() + settings.CACHE_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None and _is_current(entry):
+                stats.record(name, "hit")
+                return entry["value"]
+        # the lock holder is slow or gone, compute without the lock
+
+    stats.record(name, "miss")
+    try:
+        # versions are read before computing, so an invalidation during the computation
+        # leaves the new entry already stale; a lagging replica could not
+        versions = tag_versions(tags) if tags else {}
+        with primary():
+            value = compute()
+        stats.record(name, "recompute")
+        cache.set(
+            key,
+            {"value": value, "expires": time.time() + timeout, "tags": versions},
+            timeout + settings.CACHE_STALE_TTL,
+        )
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+def _default_key(args, kwargs):
+    return ":".join(
+        [*map(str, args), *(f"{name}={value}" for name, value in sorted(kwargs.items()))]
+    )
+
+
+def cached(timeout=None, key=None, tags=None, name=None):
+    """
+    Caches the return value of a function with ``get_or_set``. ``key`` and ``tags`` are called
+    with the function's arguments and return the key suffix and the tags of a call; by default
+    the arguments themselves form the key. On a serializer method field, pass for example
+    ``key=lambda self, obj: obj.pk``.
+    """
+    def decorator(func):
+        prefix = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            suffix = key(*args, **kwargs) if key else _default_key(args, kwargs)
+            return get_or_set(
+                f"{prefix}:{suffix}",
+                lambda: func(*args, **kwargs),
+                timeout=timeout,
+                tags=tags(*args, **kwargs) if tags else (),
+                name=prefix,
+            )
+
+        return wrapper
+
+    return decorator
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def cached_response(timeout=None, tags=None, per_user=False, name=None):
+    """
+    Caches the data of successful GET responses of a DRF view function or viewset method,
+    keyed by the full request path and, with ``per_user``, the requesting user. ``tags`` is
+    called with the view's arguments.
+    """
+    def decorator(view):
+        prefix = name or f"{view.__module__}.{view.__qualname__}"
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(
+                arg for arg in args if hasattr(arg, "method") and hasattr(arg, "get_full_path")
+            )
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            suffix = request.get_full_path()
+            if per_user:
+                suffix = f"{request.user.pk}:{suffix}"
+
+            uncacheable = []
+
+            def compute():
+                response = view(*args, **kwargs)
+                if response.status_code != 200 or not isinstance(response, Response):
+                    uncacheable.append(response)
+                    raise _Uncacheable
+                return response.data
+
+            try:
+                data = get_or_set(
+                    f"{prefix}:{suffix}",
+                    compute,
+                    timeout=timeout,
+                    tags=tags(*args, **kwargs) if tags else (),
+                    name=prefix,
+                )
+            except _Uncacheable:
+                return uncacheable[0]
+            return Response(data)
+
+        return wrapper
+
+    return decorator
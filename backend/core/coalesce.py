@@ -0,0 +1,50 @@
+"""
+Coalesced Celery tasks, for work that only needs to happen once however often it is asked for.
+
+A task declared with ``base=CoalescedTask`` gets a ``coalesce(*args)`` method to call instead
+of ``delay``. The first call after a run claims the arguments in the cache and sends the task
+``COALESCE_DELAY`` seconds later; calls with the same arguments made until the run starts
+find the claim and send nothing, so 500 votes on one question send a single recount. The run
+drops the claim before doing its work, so calls made while it runs send the next one and no
+change is missed. Calls are sent once the current transaction commits, so the run sees what
+the caller wrote and rolled back calls send nothing.
+
+A claim whose task is lost, say with its worker, expires after ``COALESCE_TIMEOUT`` seconds.
+Arguments must be JSON serializable, like every task argument here; claims are keyed by a hash
+of them, which keeps keys short and free of the spaces memcached rejects.
+"""
+import hashlib
+import json
+
+from celery import Task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+COALESCE_KEY = "coalesce:{task}:{args}"
+
+
+class CoalescedTask(Task):
+    def coalesce_key(self, args):
+        serialized = json.dumps(list(args), sort_keys=True, separators=(",", ":"))
+        return COALESCE_KEY.format(
+            task=self.name, args=hashlib.sha1(serialized.encode()).hexdigest()
+        )
+
+    def coalesce(self, *args, delay=None):
+        """
+        Sends the task with ``args`` in ``delay`` seconds, ``COALESCE_DELAY`` by default, unless
+        it is already waiting to run with them.
+        """
+        transaction.on_commit(lambda: self._send_coalesced(args, delay))
+
+    def _send_coalesced(self, args, delay):
+        if delay is None:
+            delay = settings.COALESCE_DELAY
+        if cache.add(self.coalesce_key(args), 1, delay + settings.COALESCE_TIMEOUT):
+            self.apply_async(args, countdown=delay)
+
+    def __call__(self, *args, **kwargs):
+        cache.delete(self.coalesce_key(args))
+        return super().__call__(*args, **kwargs)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import psutil
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from core.asgi import ASGIHandler
+from questions.models import Question
+from subq.models import SubQ, SubQFollower
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Compares the throughput of a sync worker, which serves one request at a time, with an ASGI
+    process keeping ``--concurrency`` requests in flight, both in this one process and so at
+    the same memory. ``--query-latency`` adds a delay to every query to stand in for the network
+    round trips to a remote database, which is the time a sync worker spends blocked. A
+    throwaway user, subq and questions are created for the run and deleted afterwards.
+    """
+
+    help = "Benchmark sync (WSGI) against async (ASGI) request throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", action="store", type=int, dest="requests", default=300,
+            help="Number of requests sent in every mode.",
+        )
+        parser.add_argument(
+            "--concurrency", action="store", type=int, dest="concurrency", default=32,
+            help="Number of requests the ASGI process keeps in flight.",
+        )
+        parser.add_argument(
+            "--query-latency", action="store", type=float, dest="query_latency", default=2.0,
+            help="Milliseconds added to every database query.",
+        )
+        parser.add_argument(
+            "--path", action="store", dest="path", default="/api/subqs/subq/",
+            help="Path of the GET endpoint to request.",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            username="asgi-benchmark", email="asgi-benchmark@example.com", password="asgi-benchmark"
+        )
+        subq = SubQ.objects.create(sub_name="asgi-benchmark", owner=user)
+        Question.objects.bulk_create(
+            Question(slug=f"asgi-benchmark-{number}", post_title=f"Question {number}",
+                     post_body="Body " * 40, author=user, subq=subq)
+            for number in range(10)
+        )
+        latency = options["query_latency"] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def connected(connection, **kwargs):
+            # a connection object reconnects on every request without CONN_MAX_AGE
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        token = user.tokens()["access"]
+        connection_created.connect(connected)
+        try:
+            for connection in connections.all():
+                connection.close()
+            # load the URL conf, serializers and the like outside the measurements
+            self._run_wsgi({**options, "requests": 5}, token)
+            process = psutil.Process()
+            for mode, run in (("wsgi", self._run_wsgi), ("asgi", self._run_asgi)):
+                rss = process.memory_info().rss
+                started = time.perf_counter()
+                run(options, token)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{mode}: {options['requests'] / elapsed:,.0f} requests/s, "
+                    f"RSS {process.memory_info().rss / 2 ** 20:.0f} MiB "
+                    f"(+{(process.memory_info().rss - rss) / 2 ** 20:.1f} MiB)\n"
+                )
+        finally:
+            connection_created.disconnect(connected)
+            for connection in connections.all():
+                connection.close()
+                if slow_query in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(slow_query)
+            # the foreign keys do not cascade
+            Question.objects.filter(subq=subq).delete()
+            SubQFollower.objects.filter(subq=subq).delete()
+            subq.delete()
+            user.delete()
+
+    def _check(self, path, status):
+        if status != 200:
+            raise CommandError(f"{path} answered {status}")
+
+    def _run_wsgi(self, options, token):
+        handler = WSGIHandler()
+        environ = RequestFactory()._base_environ(
+            PATH_INFO=options["path"],
+            REQUEST_METHOD="GET",
+            SERVER_NAME="localhost",
+            HTTP_HOST="localhost",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        for _ in range(options["requests"]):
+            status = []
+            response = handler(dict(environ), lambda code, headers: status.append(code))
+            response.close()
+            self._check(options["path"], int(status[0].split(" ", 1)[0]))
+
+    def _run_asgi(self, options, token):
+        application = ASGIHandler()
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": options["path"],
+            "query_string": b"",
+            "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+        }
+        remaining = [options["requests"]]
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def client():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                messages = []
+
+                async def send(message):
+                    messages.append(message)
+
+                await application(scope, receive, send)
+                self._check(options["path"], messages[0]["status"])
+
+        async def main():
+            await asyncio.gather(*(client() for _ in range(options["concurrency"])))
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+            application.executor.shutdown()
+            application.read_executor.shutdown()
@@ -0,0 +1,103 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Starts gunicorn with the theraq.gunicorn configuration, with and without preloading and
+    warm-up, and reports the time until it answers, the latency of the first requests (served
+    by cold workers without preloading) against the later ones, and the memory of every worker:
+    USS is the memory only that worker holds, PSS also counts its share of the pages it shares
+    with the master and the other workers.
+    """
+
+    help = "Measure gunicorn startup time and per-worker memory with and without preloading"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", action="store", type=int, dest="workers", default=3,
+            help="Number of gunicorn workers.",
+        )
+        parser.add_argument(
+            "--requests", action="store", type=int, dest="requests", default=30,
+            help="Number of requests sent once gunicorn answers.",
+        )
+        parser.add_argument(
+            "--path", action="store", dest="path", default="/api/subqs/subq/",
+            help="Path requested.",
+        )
+        parser.add_argument(
+            "--port", action="store", type=int, dest="port", default=8765,
+            help="Port gunicorn binds to on 127.0.0.1.",
+        )
+
+    def handle(self, *args, **options):
+        for preload in (False, True):
+            self._run(preload, options)
+
+    def _get(self, url):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+        except urllib.error.HTTPError as exc:
+            if exc.code >= 500:
+                raise CommandError(f"{url} answered {exc.code}")
+        return time.perf_counter() - started
+
+    def _run(self, preload, options):
+        url = f"http://127.0.0.1:{options['port']}{options['path']}"
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", "theraq.wsgi",
+                "--config", "python:theraq.gunicorn",
+                "--bind", f"127.0.0.1:{options['port']}",
+                "--workers", str(options["workers"]),
+            ],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "GUNICORN_PRELOAD": str(preload), "GUNICORN_WARM_UP": str(preload)},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise CommandError("gunicorn exited during startup")
+                try:
+                    first = self._get(url)
+                    break
+                except urllib.error.URLError:
+                    time.sleep(0.05)
+            ready = time.perf_counter() - started
+            master = psutil.Process(process.pid)
+            while len(master.children()) < options["workers"]:
+                time.sleep(0.05)
+            latencies = [first] + [self._get(url) for _ in range(options["requests"])]
+            cold = latencies[:options["workers"]]
+            warm = latencies[options["workers"]:]
+            workers = [child.memory_full_info() for child in master.children()]
+        finally:
+            process.terminate()
+            process.wait()
+
+        mode = "preload" if preload else "lazy"
+        self.stdout.write(
+            f"{mode:>7}: answering after {ready:.2f}s, "
+            f"first requests max {max(cold) * 1000:.0f} ms, "
+            f"later requests median {statistics.median(warm) * 1000:.0f} ms\n"
+        )
+        for number, memory in enumerate(workers, start=1):
+            self.stdout.write(
+                f"         worker {number}: RSS {memory.rss / 2 ** 20:.1f} MiB, "
+                f"USS {memory.uss / 2 ** 20:.1f} MiB, PSS {memory.pss / 2 ** 20:.1f} MiB\n"
+            )
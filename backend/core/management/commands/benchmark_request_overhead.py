@@ -0,0 +1,119 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+
+User = get_user_model()
+
+MODES = {
+    # what the settings did before: every request in a transaction, a connection per request
+    "atomic": {"ATOMIC_REQUESTS": True, "CONN_MAX_AGE": 0},
+    # AtomicWriteRequestsMiddleware and persistent connections
+    "read-only": {"ATOMIC_REQUESTS": False, "CONN_MAX_AGE": 600},
+}
+
+
+class Command(BaseCommand):
+    """
+    Measures the per-request database overhead of a safe request through the full WSGI stack,
+    with every request wrapped in a transaction on a fresh connection (the former
+    ``ATOMIC_REQUESTS`` setup) and with read-only requests in autocommit on a persistent
+    connection. A throwaway user authenticates the requests and is deleted afterwards.
+    """
+
+    help = "Benchmark the connection and transaction overhead of read-only requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            action="store",
+            type=int,
+            dest="requests",
+            default=500,
+            help="Number of requests sent in every mode.",
+        )
+        parser.add_argument(
+            "--path",
+            action="store",
+            dest="path",
+            default="/api/users/user/",
+            help="Path of the GET endpoint to request.",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            username="request-benchmark",
+            email="request-benchmark@example.com",
+            password="request-benchmark",
+        )
+        try:
+            environ = self._environ(options["path"], user.tokens()["access"])
+            handler = WSGIHandler()
+            for mode, overrides in MODES.items():
+                counts, elapsed = self._run(handler, environ, options["requests"], overrides)
+                requests = options["requests"]
+                self.stdout.write(
+                    f"{mode:>9}: {elapsed / requests * 1000:.2f} ms/request, "
+                    f"{counts['connections'] / requests:.2f} connections/request, "
+                    f"{counts['atomic_queries'] / requests:.2f} of "
+                    f"{counts['queries'] / requests:.2f} queries/request in a transaction\n"
+                )
+        finally:
+            for connection in connections.all():
+                connection.settings_dict.update(ATOMIC_REQUESTS=False)
+            user.delete()
+
+    @staticmethod
+    def _environ(path, token):
+        host = next(
+            (host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"), "localhost"
+        )
+        return RequestFactory()._base_environ(
+            PATH_INFO=path,
+            REQUEST_METHOD="GET",
+            SERVER_NAME=host,
+            HTTP_HOST=host,
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+            HTTP_X_FORWARDED_PROTO="https",
+            **{"wsgi.url_scheme": "https"},
+        )
+
+    def _run(self, handler, environ, requests, overrides):
+        counts = Counter()
+
+        def connected(**kwargs):
+            counts["connections"] += 1
+
+        def count_queries(execute, sql, params, many, context):
+            counts["queries"] += 1
+            if context["connection"].in_atomic_block:
+                counts["atomic_queries"] += 1
+            return execute(sql, params, many, context)
+
+        for connection in connections.all():
+            connection.close()
+            connection.settings_dict.update(overrides)
+            connection.execute_wrappers.append(count_queries)
+        connection_created.connect(connected)
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                status = []
+                response = handler(dict(environ), lambda code, headers: status.append(code))
+                # closing the response fires request_finished, which closes obsolete connections
+                response.close()
+                if not status[0].startswith("200"):
+                    raise CommandError(f"{environ['PATH_INFO']} answered {status[0]}")
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(connected)
+            for connection in connections.all():
+                connection.execute_wrappers.remove(count_queries)
+        return counts, elapsed
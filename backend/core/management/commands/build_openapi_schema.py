@@ -0,0 +1,33 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.openapi import generate_schema
+
+
+class Command(BaseCommand):
+    """
+    Writes the OpenAPI schema served by ``/api/openapi/api.json/``, so that it does not have to
+    be generated at runtime. Run by bin/post_compile on every build.
+    """
+
+    help = "Generate the OpenAPI schema artifact"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            action="store",
+            dest="output",
+            default=settings.OPENAPI_SCHEMA_PATH,
+            help="Path of the schema file.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        content = generate_schema()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.part", "wb") as schema_file:
+            schema_file.write(content)
+        os.replace(f"{path}.part", path)
+        self.stdout.write(f"Wrote {len(content)} bytes to {path}\n")
@@ -0,0 +1,340 @@
+"""
+Prometheus metrics, exposed in the text format at ``/metrics``.
+
+Every process (gunicorn worker, Celery pool process) keeps its own counters and histograms in
+memory and writes them, at most every ``METRICS_FLUSH_INTERVAL`` seconds and at exit, to a file
+of its own in ``METRICS_DIR``. The endpoint adds up the files of all processes, so it reports
+the whole server whichever worker answers, with no metrics service to run. Files of processes
+that exited are kept so counters never go backwards; gunicorn clears the directory when it
+starts (see theraq.gunicorn).
+
+Celery workers run on other dynos, which share no disk with the web processes, so their pool
+processes write their values to the default cache (Redis in production) instead, after every
+task. Each takes a slot number from a counter and keeps its values under that slot for
+``METRICS_SNAPSHOT_TIMEOUT`` seconds after its last write; the endpoint adds the slots up with
+the files. Slots below the oldest one still there are skipped from then on, and a process
+whose slot was skipped takes a new one.
+
+Requests are measured by ``MetricsMiddleware``, cache events by core.cache, and tasks through
+the Celery signals below. Recording is a no-op unless ``METRICS_ENABLED`` is on.
+"""
+import atexit
+import glob
+import hmac
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_safe
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+SLOT_KEY = "metrics:slot"
+FIRST_SLOT_KEY = "metrics:first-slot"
+SNAPSHOT_KEY = "metrics:snapshot:{slot}"
+
+
+class MetricStore:
+    """
+    The metric values of this process, by ``(name, labels)``: a number for counters and
+    ``[bucket counts..., sum, count]`` for histograms. With ``remote`` set they are written to
+    the cache instead of to a file.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remote = False
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.path = None
+        self.slot = None
+        self.values = {}
+        self.flushed = time.monotonic()
+
+    def _values(self):
+        if os.getpid() != self.pid:
+            # a forked child starts empty, the parent reports its own values
+            self.reset()
+        return self.values
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            values = self._values()
+            values[(name, labels)] = values.get((name, labels), 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, labels, buckets, value):
+        with self.lock:
+            values = self._values()
+            histogram = values.get((name, labels))
+            if histogram is None:
+                histogram = values[(name, labels)] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            values = self._values()
+            if not values:
+                return
+            rows = [[name, list(labels), value] for (name, labels), value in values.items()]
+            if self.remote:
+                self._write_snapshot(rows)
+            else:
+                self._write_file(rows)
+            self.flushed = time.monotonic()
+
+    def _write_file(self, rows):
+        if self.path is None:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            self.path = os.path.join(
+                settings.METRICS_DIR, f"{self.pid}-{uuid.uuid4().hex[:8]}.json"
+            )
+        with open(f"{self.path}.part", "w") as metrics_file:
+            json.dump(rows, metrics_file)
+        os.replace(f"{self.path}.part", self.path)
+
+    def _write_snapshot(self, rows):
+        if self.slot is None or self.slot < (cache.get(FIRST_SLOT_KEY) or 1):
+            cache.add(SLOT_KEY, 0, None)
+            self.slot = cache.incr(SLOT_KEY)
+        cache.set(SNAPSHOT_KEY.format(slot=self.slot), rows, settings.METRICS_SNAPSHOT_TIMEOUT)
+
+
+store = MetricStore()
+atexit.register(store.flush)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        METRICS[name] = self
+
+    def _labels(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if settings.METRICS_ENABLED:
+            store.inc(self.name, self._labels(labels), amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        if settings.METRICS_ENABLED:
+            store.observe(self.name, self._labels(labels), self.buckets, value)
+
+
+METRICS = {}
+
+REQUEST_DURATION = Histogram(
+    "theraq_http_request_duration_seconds", "Time to respond to a request.",
+    ("method", "route", "status"), LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "theraq_http_response_size_bytes",
+    "Size of response bodies.",
+    ("method", "route"),
+    SIZE_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "theraq_http_db_queries",
+    "Database queries run by a request.",
+    ("method", "route"),
+    QUERY_BUCKETS,
+)
+CACHE_EVENTS = Counter(
+    "theraq_cache_events_total", "Cache lookups by outcome: hit, miss, stale or recompute.",
+    ("cache", "event"),
+)
+TASK_DURATION = Histogram(
+    "theraq_celery_task_duration_seconds",
+    "Run time of Celery tasks.",
+    ("task", "state"),
+    TASK_BUCKETS,
+)
+TASK_QUEUE_LAG = Histogram(
+    "theraq_celery_task_queue_lag_seconds", "Time Celery tasks waited in the queue.", ("task",),
+    TASK_BUCKETS,
+)
+
+
+def _snapshots():
+    """
+    The values the worker processes wrote to the cache, by process.
+    """
+    first = cache.get(FIRST_SLOT_KEY) or 1
+    last = cache.get(SLOT_KEY) or 0
+    keys = [SNAPSHOT_KEY.format(slot=slot) for slot in range(first, last + 1)]
+    found = cache.get_many(keys)
+    live = [slot for slot, key in zip(range(first, last + 1), keys) if key in found]
+    if live and live[0] > first:
+        # the snapshots of processes gone for METRICS_SNAPSHOT_TIMEOUT expired
+        cache.set(FIRST_SLOT_KEY, live[0], None)
+    return list(found.values())
+
+
+def _files():
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        try:
+            with open(path) as metrics_file:
+                yield json.load(metrics_file)
+        except (OSError, ValueError):
+            continue
+
+
+def collect():
+    """
+    The values of all processes, added up by ``(name, labels)``.
+    """
+    store.flush()
+    totals = {}
+    for rows in [*_files(), *_snapshots()]:
+        for name, labels, value in rows:
+            key = (name, tuple(labels))
+            if isinstance(value, list):
+                total = totals.setdefault(key, [0] * len(value))
+                totals[key] = [left + right for left, right in zip(total, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def render():
+    totals = collect()
+    lines = []
+    for name, metric in sorted(METRICS.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for (metric_name, labels), value in sorted(totals.items()):
+            if metric_name != name:
+                continue
+            if metric.kind == "counter":
+                lines.append(f"{name}{_format_labels(metric.labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(
+                [*metric.buckets, math.inf], value[:-2] + [value[-1] - sum(value[:-2])]
+            ):
+                cumulative += count
+                label_text = _format_labels(
+                    metric.labelnames, labels, [("le", _format_bound(bound))]
+                )
+                lines.append(f"{name}_bucket{label_text} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric.labelnames, labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(metric.labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """
+    Removes the files of all processes, for a server that starts afresh.
+    """
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        os.remove(path)
+
+
+@require_safe
+def metrics_view(request):
+    """
+    The metrics in the Prometheus text format, for scrapers sending ``METRICS_TOKEN`` as a
+    bearer token.
+    """
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), expected):
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@worker_init.connect
+def use_cache(**kwargs):
+    # the pool processes forked from here inherit it
+    store.remote = True
+
+
+@worker_process_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    store.flush()
+
+
+@before_task_publish.connect
+def task_published(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    now = time.time()
+    task.request.metrics_started = time.monotonic()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is not None:
+        TASK_QUEUE_LAG.observe(max(0.0, now - published_at), task=task.name)
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = getattr(task.request, "metrics_started", None)
+    if started is not None:
+        TASK_DURATION.observe(time.monotonic() - started, task=task.name, state=state or "UNKNOWN")
+    if store.remote:
+        # a worker may sit idle for long, so its values are not left waiting for the interval
+        store.flush()
@@ -0,0 +1,236 @@
+"""
+Request level database handling.
+
+``AtomicWriteRequestsMiddleware`` replaces ``ATOMIC_REQUESTS``: only requests with an unsafe
+method (POST, PUT, PATCH, DELETE) run their view inside a transaction. GET, HEAD and OPTIONS
+run in autocommit mode, so they do not pay for BEGIN/COMMIT and do not keep a transaction open
+while the response is serialized.
+
+``check_connections`` runs at the start of every request and closes persistent connections
+(``CONN_MAX_AGE``) that stopped working, for example after a database failover, instead of
+failing the first query of the request.
+
+``MetricsMiddleware`` records request latency, response size and query count metrics, see
+core.metrics.
+
+``NPlusOneMiddleware`` reports statements a request repeats, see core.nplusone.
+
+``RequestProfilingMiddleware`` records SQL, serializer and render timings of requests, see
+core.profiling.
+
+``ReplicaRoutingMiddleware`` lets ``core.routers.PrimaryReplicaRouter`` send the reads of safe
+requests to the replicas, and pins clients to the primary for a while after they wrote.
+"""
+import itertools
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+from log_request_id.middleware import RequestIDMiddleware as BaseRequestIDMiddleware
+
+from core import metrics, nplusone, profiling
+from core.routers import use_replicas
+
+
+logger = logging.getLogger(__name__)
+routing_logger = logging.getLogger("core.routers")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class AtomicWriteRequestsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS:
+            return None
+        non_atomic = getattr(view_func, "_non_atomic_requests", set())
+        aliases = [alias for alias in settings.ATOMIC_WRITE_DATABASES if alias not in non_atomic]
+        if not aliases:
+            return None
+        return self._run_atomic(aliases, view_func, request, view_args, view_kwargs)
+
+    def _run_atomic(self, aliases, view_func, request, view_args, view_kwargs):
+        with transaction.atomic(using=aliases[0]):
+            if len(aliases) > 1:
+                return self._run_atomic(aliases[1:], view_func, request, view_args, view_kwargs)
+            response = view_func(request, *view_args, **view_kwargs)
+            # DRF only rolls back handled exceptions under ATOMIC_REQUESTS
+            if getattr(response, "exception", False):
+                for alias in settings.ATOMIC_WRITE_DATABASES:
+                    if connections[alias].in_atomic_block:
+                        transaction.set_rollback(True, using=alias)
+            return response
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        if safe and pinned:
+            routing_logger.debug("%s %s pinned to the primary", request.method, request.path)
+        token = use_replicas.set(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        if not safe and response.status_code < 400:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Active while ``METRICS_ENABLED`` is on. Requests are labelled with their URL pattern, or
+    "unmatched", so the number of series stays bounded.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        metrics.REQUEST_DURATION.observe(
+            duration, method=request.method, route=route, status=response.status_code
+        )
+        metrics.REQUEST_QUERIES.observe(queries[0], method=request.method, route=route)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(len(response.content), method=request.method, route=route)
+        return response
+
+
+class NPlusOneMiddleware:
+    """
+    Active while ``NPLUSONE_ACTION`` is set, in the test and local settings.
+    """
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_ACTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        fingerprints = nplusone.QueryFingerprints()
+        with fingerprints.track_queries():
+            response = self.get_response(request)
+        fingerprints.check(f"{request.method} {request.path}")
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Active while ``REQUEST_PROFILING`` is on. Staff users sending the
+    ``REQUEST_PROFILING_HEADER`` get the timings back in ``Server-Timing`` and ``X-DB-Queries``
+    headers, and ``RequestIDMiddleware`` adds them to the request log line. Every
+    ``REQUEST_PROFILE_EVERY``-th request, and every request slower than
+    ``REQUEST_PROFILE_SLOW_MS``, is profiled with cProfile into ``REQUEST_PROFILE_DIR``; the
+    latter runs the profiler on every request.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.requests = itertools.count(1)
+        profiling.install_serializer_timing()
+
+    def __call__(self, request):
+        profile = profiling.RequestProfile()
+        request.profile = profile
+        every = settings.REQUEST_PROFILE_EVERY
+        sampled = bool(every) and next(self.requests) % every == 0
+        profiler = None
+        if sampled or settings.REQUEST_PROFILE_SLOW_MS:
+            profiler = profiling.start_profiler()
+        token = profiling.current_profile.set(profile)
+        try:
+            with profile.track_queries():
+                response = self.get_response(request)
+        finally:
+            profiling.current_profile.reset(token)
+            if profiler is not None:
+                profiler.disable()
+            profile.finish()
+
+        slow_ms = settings.REQUEST_PROFILE_SLOW_MS
+        slow = bool(slow_ms) and profile.total * 1000 >= slow_ms
+        if profiler is not None and (sampled or slow):
+            path = profiling.dump_profile(profiler, request, profile)
+            logger.info("Profile of %s %s written to %s", request.method, request.path, path)
+        staff = getattr(getattr(request, "user", None), "is_staff", False)
+        if staff and settings.REQUEST_PROFILING_HEADER in request.META:
+            response["Server-Timing"] = profile.server_timing()
+            response["X-DB-Queries"] = str(profile.queries)
+        return response
+
+    def process_template_response(self, request, response):
+        profile = request.profile
+        profile.start_render()
+
+        def rendered(response):
+            profile.end_render()
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class RequestIDMiddleware(BaseRequestIDMiddleware):
+    """
+    Request id logging, with the timings of ``RequestProfilingMiddleware`` in the request log line.
+    """
+
+    def get_log_message(self, request, response):
+        message = super().get_log_message(request, response)
+        profile = getattr(request, "profile", None)
+        if profile is not None and profile.total is not None:
+            message = f"{message} {profile.summary()}"
+        return message
+
+
+def check_connections(**kwargs):
+    """
+    Pings every open connection, at most once per ``CONN_HEALTH_CHECK_INTERVAL`` seconds, and
+    closes it when the ping fails so the request reconnects.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        last_check = getattr(connection, "health_checked", None)
+        if last_check is not None and now - last_check < settings.CONN_HEALTH_CHECK_INTERVAL:
+            continue
+        connection.health_checked = now
+        if not connection.is_usable():
+            connection.close()
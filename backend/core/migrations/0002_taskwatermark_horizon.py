@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskwatermark',
+            name='horizon_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='taskwatermark',
+            name='horizon_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -40,3 +40,23 @@ class BaseVoteModel(BaseAppModel):
 
     class Meta:
         abstract = True
+
+
+class TaskWatermark(models.Model):
+    """
+    Progress marker of an incremental background job. ``last_id`` is the highest primary key
+    a job has processed, ``last_run`` when it last completed. Jobs that only process rows once
+    they are old enough record the highest primary key at ``horizon_seen`` as ``horizon_id``.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_run = models.DateTimeField(blank=True, null=True)
+    horizon_id = models.BigIntegerField(default=0)
+    horizon_seen = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "task_watermark"
+        verbose_name = "Task Watermark"
+
+    def __str__(self):
+        return self.name
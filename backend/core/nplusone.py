@@ -0,0 +1,137 @@
+"""
+Detection of N+1 queries.
+
+``QueryFingerprints`` normalizes every SELECT run while it is active, so the same statement
+with other parameters (``WHERE question_id = 1``, ``= 2``...) has the same fingerprint, and
+keeps the stack of the project code that first ran each one. A statement run more than
+``NPLUSONE_THRESHOLD`` times is almost always a query per row of a list, made by a serializer
+method or a related manager; ``NPlusOneMiddleware`` checks every request, and ``detect`` any
+block of code such as a test. What happens then is ``NPLUSONE_ACTION``: "raise" raises
+``NPlusOneError`` (test settings), "log" logs a warning (local settings).
+"""
+import logging
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\((?:\s*%s\s*,)*\s*%s\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+MIDDLEWARE_FILE = os.path.join(os.path.dirname(__file__), "middleware.py")
+DJANGO_DB = os.path.join("django", "db", "")
+# library frames shown after the project's
+LIBRARY_FRAMES = 4
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """
+    The statement with its literals replaced by placeholders and ``IN`` lists of any length
+    collapsed into one.
+    """
+    sql = STRING_LITERAL.sub("%s", sql)
+    sql = NUMBER_LITERAL.sub("%s", sql)
+    sql = VALUE_LIST.sub("(%s)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def _is_project_file(filename):
+    return filename.startswith(settings.BASE_DIR) and "-packages" not in filename
+
+
+def _query_stack():
+    """
+    The frames of the project's own code that led to the query, without the middleware, and the
+    library frames between the last of them and the database layer, which show where fields
+    declared with ``source`` run their queries.
+    """
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if os.path.abspath(frame.filename) not in (__file__, MIDDLEWARE_FILE)
+    ]
+    project = [frame for frame in frames if _is_project_file(os.path.abspath(frame.filename))]
+    inner = []
+    for frame in reversed(frames):
+        if _is_project_file(os.path.abspath(frame.filename)):
+            break
+        if DJANGO_DB not in frame.filename:
+            inner.insert(0, frame)
+    return traceback.format_list(project + inner[-LIBRARY_FRAMES:])
+
+
+class QueryFingerprints:
+    def __init__(self, threshold=None):
+        self.threshold = settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        self.counts = Counter()
+        self.stacks = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == "SELECT":
+            key = fingerprint(sql)
+            self.counts[key] += 1
+            if key not in self.stacks:
+                self.stacks[key] = _query_stack()
+        return execute(sql, params, many, context)
+
+    def track_queries(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.record_query))
+        return stack
+
+    def repeated(self):
+        """
+        ``(fingerprint, count, stack)`` of the statements run more than the threshold.
+        """
+        return [
+            (key, count, self.stacks[key])
+            for key, count in self.counts.most_common()
+            if count > self.threshold
+        ]
+
+    def report(self, label):
+        repeated = self.repeated()
+        if not repeated:
+            return None
+        parts = [f"{label} ran {len(repeated)} statement(s) more than {self.threshold} times:"]
+        for key, count, stack in repeated:
+            parts.append(
+                f"\n{count} x {key}\nFirst run from:\n{''.join(stack) or '  (no project code)'}"
+            )
+        return "".join(parts)
+
+    def check(self, label, action=None):
+        action = action or settings.NPLUSONE_ACTION
+        message = self.report(label)
+        if message is None or not action:
+            return
+        if action == "raise":
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+@contextmanager
+def detect(label="Block", threshold=None, action="raise"):
+    """
+    Checks the queries run inside the block, raising ``NPlusOneError`` by default::
+
+        with detect("Question feed"):
+            self.client.get("/api/questions/question/")
+    """
+    fingerprints = QueryFingerprints(threshold)
+    with fingerprints.track_queries():
+        yield fingerprints
+    fingerprints.check(label, action)
@@ -0,0 +1,77 @@
+"""
+The OpenAPI schema of the API.
+
+Introspecting every viewset and serializer takes seconds, so the JSON document is generated at
+build time by the ``build_openapi_schema`` command into ``OPENAPI_SCHEMA_PATH`` and served from
+there with an ETag of its content. Without the file it is generated on the first request and
+kept for the life of the process. The swagger and redoc pages load the schema from the same
+view (``SPEC_URL``).
+"""
+import functools
+import hashlib
+import logging
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import condition, require_safe
+from drf_yasg import openapi
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.inspectors import SwaggerAutoSchema
+
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="TheraQ API",
+    default_version='v1',
+    description="TheraQ API",
+    terms_of_service="https://www.theraq.com/policies/terms/",
+    contact=openapi.Contact(email="contact@theraq.com"),
+    license=openapi.License(name="Private"),
+)
+
+
+class UnpaginatedAutoSchema(SwaggerAutoSchema):
+    """
+    Schema of a list action that neither filters nor paginates with the viewset's backends, so
+    its own query parameters do not clash with theirs.
+    """
+
+    def should_filter(self):
+        return False
+
+    def should_page(self):
+        return False
+
+
+def generate_schema():
+    """
+    The public schema of every endpoint, as JSON.
+    """
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(API_INFO)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema():
+    """
+    ``(content, etag)`` of the schema, from the build artifact when there is one.
+    """
+    try:
+        with open(settings.OPENAPI_SCHEMA_PATH, "rb") as schema_file:
+            content = schema_file.read()
+    except FileNotFoundError:
+        logger.info("No schema at %s, generating it", settings.OPENAPI_SCHEMA_PATH)
+        content = generate_schema()
+    return content, hashlib.sha256(content).hexdigest()
+
+
+@require_safe
+@condition(etag_func=lambda request: get_schema()[1])
+def schema_json(request):
+    response = HttpResponse(get_schema()[0], content_type="application/json")
+    # clients may keep it, but must revalidate with the ETag
+    response["Cache-Control"] = "public, no-cache"
+    return response
@@ -0,0 +1,236 @@
+"""
+A compact, sorted prefix index stored in a single file and read through ``mmap``.
+
+All processes on a host map the same file, so the operating system keeps one copy of it in
+the page cache no matter how many gunicorn workers serve lookups. Writers never modify a file
+in place: a new file is written next to the old one and atomically renamed over it, and
+readers notice the new inode on their next lookup.
+
+File layout (all integers little endian)::
+
+    header   magic "TQPX" | version u16 | reserved u16 | count u32
+    offsets  count x u32, offset of every record, ordered by key
+    records  key_len u16 | key | kind u8 | weight u32 | label_len u16 | label | slug_len u16 | slug
+"""
+import fcntl
+import heapq
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import unicodedata
+from collections import namedtuple
+
+
+MAGIC = b"TQPX"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+OFFSET = struct.Struct("<I")
+LENGTH = struct.Struct("<H")
+KIND_WEIGHT = struct.Struct("<BI")
+MAX_WEIGHT = 2 ** 32 - 1
+
+IndexEntry = namedtuple("IndexEntry", ("kind", "label", "slug", "weight"))
+
+_WORD_START = re.compile(r"(?:^|(?<=[\s\-_/]))\w", re.UNICODE)
+
+
+def normalize(text):
+    """
+    Case and accent folded form of ``text`` with collapsed whitespace.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def entry_keys(label):
+    """
+    Keys an entry is reachable by: the whole label and every suffix starting at a word,
+    so "early intervention" is found by both "ear" and "inter".
+    """
+    normalized = normalize(label)
+    return {normalized[match.start():] for match in _WORD_START.finditer(normalized)}
+
+
+def write_index(path, entries):
+    """
+    Atomically replaces the index at ``path`` with ``entries``.
+    """
+    records = []
+    for entry in entries:
+        label = entry.label.encode("utf-8")
+        slug = entry.slug.encode("utf-8")
+        weight = max(0, min(int(entry.weight or 0), MAX_WEIGHT))
+        for key in entry_keys(entry.label):
+            records.append((key.encode("utf-8"), entry.kind, slug, weight, label))
+    records.sort()
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    offsets = []
+    body = bytearray()
+    base = HEADER.size + OFFSET.size * len(records)
+    for key, kind, slug, weight, label in records:
+        offsets.append(base + len(body))
+        body += LENGTH.pack(len(key)) + key
+        body += KIND_WEIGHT.pack(kind, weight)
+        body += LENGTH.pack(len(label)) + label
+        body += LENGTH.pack(len(slug)) + slug
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".prefix-index-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(HEADER.pack(MAGIC, VERSION, 0, len(records)))
+            for offset in offsets:
+                tmp.write(OFFSET.pack(offset))
+            tmp.write(body)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class PrefixIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as index_file:
+            stat = os.fstat(index_file.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            if stat.st_size == 0:
+                raise ValueError(f"Empty prefix index: {path}")
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a prefix index: {path}")
+
+    def __len__(self):
+        return self.count
+
+    def _offset(self, position):
+        return OFFSET.unpack_from(self._map, HEADER.size + position * OFFSET.size)[0]
+
+    def _key(self, offset):
+        (length,) = LENGTH.unpack_from(self._map, offset)
+        start = offset + LENGTH.size
+        return self._map[start:start + length], start + length
+
+    def _record(self, offset):
+        key, position = self._key(offset)
+        kind, weight = KIND_WEIGHT.unpack_from(self._map, position)
+        position += KIND_WEIGHT.size
+        (label_length,) = LENGTH.unpack_from(self._map, position)
+        position += LENGTH.size
+        label = self._map[position:position + label_length]
+        position += label_length
+        (slug_length,) = LENGTH.unpack_from(self._map, position)
+        position += LENGTH.size
+        slug = self._map[position:position + slug_length]
+        return key, kind, weight, label, slug
+
+    def _lower_bound(self, prefix):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(self._offset(middle))[0] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self):
+        for position in range(self.count):
+            _, kind, weight, label, slug = self._record(self._offset(position))
+            yield IndexEntry(kind, label.decode("utf-8"), slug.decode("utf-8"), weight)
+
+    def search(self, prefix, limit=10, kinds=None, scan_limit=2000):
+        """
+        The ``limit`` heaviest entries with a key starting with ``prefix``. At most
+        ``scan_limit`` keys are inspected, which bounds the cost of very short prefixes.
+        """
+        prefix = normalize(prefix).encode("utf-8")
+        if not prefix:
+            return []
+        best = {}
+        position = self._lower_bound(prefix)
+        end = min(self.count, position + scan_limit)
+        while position < end:
+            key, kind, weight, label, slug = self._record(self._offset(position))
+            if not key.startswith(prefix):
+                break
+            position += 1
+            if kinds and kind not in kinds:
+                continue
+            best[(kind, slug)] = (weight, label)
+        top = heapq.nsmallest(
+            limit, best.items(), key=lambda item: (-item[1][0], item[1][1], item[0])
+        )
+        return [
+            IndexEntry(kind, label.decode("utf-8"), slug.decode("utf-8"), weight)
+            for (kind, slug), (weight, label) in top
+        ]
+
+    def close(self):
+        self._map.close()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(path):
+    """
+    The process wide reader of ``path``, reopened whenever the file was replaced.
+    Returns ``None`` while no index has been written.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    index = _indexes.get(path)
+    if index is not None and index.identity == (stat.st_ino, stat.st_mtime_ns):
+        return index
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None or index.identity != (stat.st_ino, stat.st_mtime_ns):
+            index = PrefixIndex(path)
+            _indexes[path] = index
+    return index
+
+
+class IndexLock:
+    """
+    Serializes writers of an index across processes with an advisory file lock.
+    """
+
+    def __init__(self, path):
+        self.lock_path = f"{path}.lock"
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        self._file = open(self.lock_path, "a")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+
+
+def replace_entries(path, kind, slug, entry=None):
+    """
+    Incrementally updates an index: drops the entry identified by ``kind`` and ``slug`` and,
+    when given, adds ``entry`` in its place. Only the index file is read.
+    """
+    with IndexLock(path):
+        index = open_index(path)
+        existing = index.entries() if index is not None else ()
+        entries = {(item.kind, item.slug): item for item in existing}
+        entries.pop((kind, slug), None)
+        if entry is not None:
+            entries[(entry.kind, entry.slug)] = entry
+        write_index(path, entries.values())
@@ -0,0 +1,120 @@
+"""
+Per-request timings recorded by ``RequestProfilingMiddleware``: the number and duration of SQL
+queries, the time spent building serializer data and the time spent rendering the response.
+
+Serializer time is measured around ``BaseSerializer.data``, which every serializer goes through
+to produce its output; ``install_serializer_timing`` wraps it once the middleware is enabled.
+"""
+import cProfile
+import functools
+import os
+import re
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+
+current_profile = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def track_queries(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.record_query))
+        return stack
+
+    def start_render(self):
+        self.render_started = time.perf_counter()
+
+    def end_render(self):
+        if self.render_started is not None:
+            self.render_time += time.perf_counter() - self.render_started
+            self.render_started = None
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"serialize;dur={self.serializer_time * 1000:.1f}",
+            f"render;dur={self.render_time * 1000:.1f}",
+            f"total;dur={self.total * 1000:.1f}",
+        ])
+
+    def summary(self):
+        return (
+            f"queries={self.queries} db_ms={self.db_time * 1000:.1f} "
+            f"serialize_ms={self.serializer_time * 1000:.1f} "
+            f"render_ms={self.render_time * 1000:.1f} "
+            f"total_ms={self.total * 1000:.1f}"
+        )
+
+
+def _timed_data(data):
+    @functools.wraps(data)
+    def wrapper(serializer):
+        profile = current_profile.get()
+        if profile is None:
+            return data(serializer)
+        # nested serializers only count once, as part of the outermost one
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install_serializer_timing():
+    if not getattr(BaseSerializer.data.fget, "timed", False):
+        BaseSerializer.data = property(_timed_data(BaseSerializer.data.fget))
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump_profile(profiler, request, profile):
+    """
+    Writes the cProfile stats of a request to ``REQUEST_PROFILE_DIR`` and returns the path.
+    """
+    os.makedirs(settings.REQUEST_PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^\w-]+", "-", request.path).strip("-") or "root"
+    started = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(
+        settings.REQUEST_PROFILE_DIR,
+        f"{started}-{request.method}-{name}-{profile.total * 1000:.0f}ms.prof",
+    )
+    profiler.dump_stats(path)
+    return path
@@ -0,0 +1,55 @@
+"""
+Database routing between the primary (``default``) and its read replicas.
+
+Writes always go to the primary. Reads go to a replica, picked at random from
+``DATABASE_REPLICAS``, only while ``ReplicaRoutingMiddleware`` serves a safe request of a
+client that has not written recently; everything else, including Celery tasks and management
+commands, reads from the primary. A client that wrote is pinned to the primary for
+``REPLICA_PIN_SECONDS`` by a cookie, so it reads its own writes despite replication lag.
+
+Values that outlive the request, like the entries of the shared cache, are built inside
+``primary()``: a replica lagging behind a write that already invalidated an entry would
+otherwise put the old value back for everyone until it expires.
+
+Routing decisions are logged at DEBUG level on the ``core.routers`` logger.
+"""
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+logger = logging.getLogger(__name__)
+
+use_replicas = ContextVar("use_replicas", default=False)
+
+
+@contextmanager
+def primary():
+    """
+    Sends the reads made inside the block to the primary.
+    """
+    token = use_replicas.set(False)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not use_replicas.get():
+            return DEFAULT_DB_ALIAS
+        alias = random.choice(settings.DATABASE_REPLICAS)
+        logger.debug("Read of %s routed to %s", model._meta.label, alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every configured database is the primary or a copy of it
+        return obj1._state.db in settings.DATABASES and obj2._state.db in settings.DATABASES
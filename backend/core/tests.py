@@ -1,3 +1,898 @@
-from django.test import TestCase
+import asyncio
+import fnmatch
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import warnings
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings  # noqa
+from rest_framework import serializers
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.asgi import ASGIHandler
+from core.beat import LockedScheduler
+from core.bloom import BloomFilter
+from core.cache import (
+    LOCK_KEY,
+    RedisCache,
+    cached,
+    cached_response,
+    get_or_set,
+    invalidate_tags,
+    stats,
+)
+from core.coalesce import CoalescedTask
+from core.middleware import (
+    AtomicWriteRequestsMiddleware,
+    MetricsMiddleware,
+    NPlusOneMiddleware,
+    ReplicaRoutingMiddleware,
+    RequestIDMiddleware,
+    check_connections,
+)
+from core import metrics
+from core.nplusone import NPlusOneError, detect, fingerprint
+from core.openapi import get_schema
+from core.prefix_index import IndexEntry, PrefixIndex, open_index, replace_entries, write_index
+from core.warmup import warm_up
+from theraq.celery import app as celery_app
+
+
+class TestPrefixIndex(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.idx")
+        write_index(self.path, [
+            IndexEntry(1, "Early Intervention", "early-intervention", 30),
+            IndexEntry(1, "Early Childhood", "early-childhood", 50),
+            IndexEntry(2, "Pediatrics", "pediatrics", 5),
+            IndexEntry(2, "École Thérapie", "ecole-therapie", 1),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_search_orders_by_weight(self):
+        index = PrefixIndex(self.path)
+        results = index.search("ear")
+        self.assertEqual(
+            [entry.slug for entry in results], ["early-childhood", "early-intervention"]
+        )
+
+    def test_search_word_prefix(self):
+        index = PrefixIndex(self.path)
+        self.assertEqual([entry.slug for entry in index.search("INTER")], ["early-intervention"])
+        self.assertEqual([entry.slug for entry in index.search("thér")], ["ecole-therapie"])
+        self.assertEqual(index.search("zzz"), [])
+        self.assertEqual(index.search(""), [])
+
+    def test_search_kinds_and_limit(self):
+        index = PrefixIndex(self.path)
+        self.assertEqual(len(index.search("e", limit=1)), 1)
+        self.assertEqual(
+            [entry.slug for entry in index.search("e", kinds=(2,))], ["ecole-therapie"]
+        )
+
+    def test_replace_entries(self):
+        first = open_index(self.path)
+        replace_entries(self.path, 1, "early-childhood", None)
+        replace_entries(self.path, 2, "peds", IndexEntry(2, "Peds", "peds", 100))
+        index = open_index(self.path)
+        self.assertIsNot(first, index)
+        self.assertEqual(
+            [entry.slug for entry in index.search("e")], ["early-intervention", "ecole-therapie"]
+        )
+        self.assertEqual([entry.slug for entry in index.search("pe")], ["peds", "pediatrics"])
+
+
+class TestBloomFilter(SimpleTestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f"user{number}@example.com" for number in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        self.assertTrue(bloom.is_full)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add(f"member{number}")
+        false_positives = sum(f"stranger{number}" in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestCache(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_hits_and_misses(self):
+        self.assertEqual(get_or_set("key", self.compute, name="test"), 1)
+        self.assertEqual(get_or_set("key", self.compute, name="test"), 1)
+        self.assertEqual(
+            stats.snapshot(), {("test", "miss"): 1, ("test", "recompute"): 1, ("test", "hit"): 1}
+        )
+
+    def test_tag_invalidation(self):
+        get_or_set("tagged", self.compute, tags=["a", "b"])
+        get_or_set("untouched", self.compute, tags=["c"])
+        invalidate_tags("b")
+        self.assertEqual(get_or_set("tagged", self.compute, tags=["a", "b"]), 3)
+        self.assertEqual(get_or_set("untouched", self.compute, tags=["c"]), 2)
+
+    def test_invalidation_during_compute(self):
+        def compute():
+            invalidate_tags("a")
+            return self.compute()
+
+        get_or_set("key", compute, tags=["a"])
+        self.assertEqual(get_or_set("key", self.compute, tags=["a"]), 2)
+
+    def test_serves_stale_while_another_process_recomputes(self):
+        get_or_set("key", self.compute, timeout=0)
+        cache.add(LOCK_KEY.format(key="key"), 1)
+        self.assertEqual(get_or_set("key", self.compute, timeout=0, name="test"), 1)
+        self.assertEqual(stats.snapshot()[("test", "stale")], 1)
+        cache.delete(LOCK_KEY.format(key="key"))
+        self.assertEqual(get_or_set("key", self.compute, timeout=0), 2)
+
+    @override_settings(CACHE_LOCK_WAIT=0.1)
+    def test_waits_for_the_lock_holder(self):
+        cache.add(LOCK_KEY.format(key="key"), 1)
+        self.assertEqual(get_or_set("key", self.compute), 1)
+        # the lock of the other process is left alone
+        self.assertTrue(cache.has_key(LOCK_KEY.format(key="key")))
+
+    def test_cached_serializer_method_field(self):
+        test = self
+
+        class ItemSerializer(serializers.Serializer):
+            total = serializers.SerializerMethodField()
+
+            @cached(
+                key=lambda self, item: item["id"], tags=lambda self, item: [f"item:{item['id']}"]
+            )
+            def get_total(self, item):
+                return test.compute()
+
+        self.assertEqual(
+            ItemSerializer([{"id": 1}, {"id": 2}, {"id": 1}], many=True).data[2]["total"], 1
+        )
+        invalidate_tags("item:1")
+        self.assertEqual(ItemSerializer({"id": 1}).data["total"], 3)
+
+    def test_cached_response(self):
+        @api_view(["GET"])
+        @permission_classes([AllowAny])
+        @cached_response(per_user=True)
+        def view(request):
+            if "missing" in request.query_params:
+                return Response(status=404)
+            return Response({"calls": self.compute()})
+
+        factory = APIRequestFactory()
+        self.assertEqual(view(factory.get("/items/")).data, {"calls": 1})
+        self.assertEqual(view(factory.get("/items/")).data, {"calls": 1})
+        self.assertEqual(view(factory.get("/items/?page=2")).data, {"calls": 2})
+        self.assertEqual(view(factory.get("/items/?missing=1")).status_code, 404)
+        self.assertEqual(view(factory.get("/items/?missing=1")).status_code, 404)
+
+
+class FakeRedis:
+    """
+    The part of ``redis.Redis`` RedisCache uses, on a dict with expiry times.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _alive(self, key):
+        if key in self.expires and self.expires[key] <= time.time():
+            del self.data[key], self.expires[key]
+        return key in self.data
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.time() + ex
+        return True
+
+    def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def exists(self, key):
+        return int(self._alive(key))
+
+    def persist(self, key):
+        return self._alive(key) and self.expires.pop(key, None) is not None
+
+    def expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.time() + seconds
+        return True
+
+    def delete(self, *keys):
+        deleted = [key for key in keys if self._alive(key)]
+        for key in deleted:
+            self.data.pop(key)
+            self.expires.pop(key, None)
+        return len(deleted)
+
+    def incrby(self, key, delta):
+        value = int(self.get(key) or 0) + delta
+        self.data[key] = str(value).encode()
+        return value
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    # a pipeline runs its commands right away
+    def pipeline(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self):
+        return []
+
+
+class TestRedisCache(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        with mock.patch("redis.Redis.from_url", return_value=self.redis) as from_url:
+            self.cache = RedisCache("redis://localhost:6379/0", {"KEY_PREFIX": "theraq"})
+        from_url.assert_called_once_with("redis://localhost:6379/0")
+
+    def test_round_trip(self):
+        values = {
+            "int": 12,
+            "bool": True,
+            "text": "12",
+            "tuple": ("question", 1, None),
+            "dict": {"a": [1]},
+        }
+        for key, value in values.items():
+            self.cache.set(key, value)
+            self.assertEqual(self.cache.get(key), value)
+            self.assertIs(type(self.cache.get(key)), type(value))
+        # integers are plain Redis integers, so INCRBY works on them
+        self.assertEqual(self.redis.get(self.cache.make_key("int")), b"12")
+        self.assertEqual(self.cache.get("missing", "default"), "default")
+        self.assertEqual(self.cache.get_many(["int", "missing", "text"]), {"int": 12, "text": "12"})
+        self.cache.set_many({"many": 1, "more": [2]})
+        self.assertEqual(self.cache.get_many(["many", "more"]), {"many": 1, "more": [2]})
+
+    def test_add_only_sets_missing_keys(self):
+        self.assertTrue(self.cache.add("lock", "first", 60))
+        self.assertFalse(self.cache.add("lock", "second", 60))
+        self.assertEqual(self.cache.get("lock"), "first")
+        self.assertFalse(self.cache.add("expired", 1, 0))
+        self.assertFalse(self.cache.has_key("expired"))
+        self.cache.delete("lock")
+        self.assertTrue(self.cache.add("lock", "second", None))
+        self.assertNotIn(self.cache.make_key("lock"), self.redis.expires)
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr("sequence")
+        self.assertFalse(self.cache.has_key("sequence"))
+        self.cache.add("sequence", 0, None)
+        self.assertEqual(self.cache.incr("sequence"), 1)
+        self.assertEqual(self.cache.incr("sequence", 5), 6)
+        self.assertEqual(self.cache.get("sequence"), 6)
+
+    def test_touch(self):
+        self.assertFalse(self.cache.touch("missing", None))
+        self.assertFalse(self.cache.touch("missing", 60))
+        self.cache.set("key", "value", 60)
+        self.assertTrue(self.cache.touch("key", None))
+        self.assertNotIn(self.cache.make_key("key"), self.redis.expires)
+        # a key without expiry stays touched
+        self.assertTrue(self.cache.touch("key", None))
+        self.assertTrue(self.cache.touch("key", 30))
+        self.assertIn(self.cache.make_key("key"), self.redis.expires)
+
+    def test_clear_only_removes_own_keys(self):
+        self.redis.set("celery-task-meta-1", b"result")
+        self.cache.set("key", "value")
+        self.cache.set_many({"a": 1, "b": 2})
+        self.cache.clear()
+        self.assertEqual(list(self.redis.data), ["celery-task-meta-1"])
+        self.cache.set("key", "value")
+        self.cache.delete_many(["key", "missing"])
+        self.assertEqual(list(self.redis.data), ["celery-task-meta-1"])
+
+
+class TestAtomicWriteRequests(TestCase):
+    def setUp(self):
+        self.middleware = AtomicWriteRequestsMiddleware(lambda request: Response())
+        self.factory = APIRequestFactory()
+        self.savepoints = []
+
+    def view(self, request, fail=False):
+        self.savepoints.append(len(connection.savepoint_ids))
+        get_user_model().objects.create_user(
+            username="atomic", email="atomic@example.com", password="atomic"
+        )
+        if fail:
+            response = Response(status=400)
+            response.exception = True
+            return response
+        return Response()
+
+    def test_safe_request_not_wrapped(self):
+        self.assertIsNone(self.middleware.process_view(self.factory.get("/"), self.view, (), {}))
+
+    def test_unsafe_request_wrapped(self):
+        outer = len(connection.savepoint_ids)
+        self.middleware.process_view(self.factory.post("/"), self.view, (), {})
+        self.assertEqual(self.savepoints, [outer + 1])
+        self.assertTrue(get_user_model().objects.filter(username="atomic").exists())
+
+    def test_handled_exception_rolls_back(self):
+        response = self.middleware.process_view(
+            self.factory.post("/"), self.view, (), {"fail": True}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(get_user_model().objects.filter(username="atomic").exists())
+
+    def test_non_atomic_view(self):
+        self.view.__func__._non_atomic_requests = {"default"}
+        try:
+            self.assertIsNone(
+                self.middleware.process_view(self.factory.post("/"), self.view, (), {})
+            )
+        finally:
+            del self.view.__func__._non_atomic_requests
+
+
+class TestCheckConnections(SimpleTestCase):
+    def test_closes_unusable_connections(self):
+        usable = mock.Mock(
+            in_atomic_block=False, health_checked=None, **{"is_usable.return_value": True}
+        )
+        broken = mock.Mock(
+            in_atomic_block=False, health_checked=None, **{"is_usable.return_value": False}
+        )
+        with mock.patch("core.middleware.connections") as connections:
+            connections.all.return_value = [usable, broken]
+            check_connections()
+            check_connections()
+        usable.close.assert_not_called()
+        broken.close.assert_called_once()
+        self.assertEqual(usable.is_usable.call_count, 1)
+
+
+@override_settings(DATABASE_REPLICAS=("replica",))
+class TestReplicaRouting(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.routed = []
+
+        def get_response(request):
+            self.routed.append(router.db_for_read(get_user_model()))
+            get_user_model().objects.get_or_create(username="writer", email="writer@example.com")
+            self.routed.append(get_user_model().objects.filter(username="writer").exists())
+            return HttpResponse(status=201 if request.method == "POST" else 200)
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(router.db_for_read(get_user_model()), "default")
+        self.assertEqual(router.db_for_write(get_user_model()), "default")
+
+    def test_safe_request_reads_from_replica(self):
+        with self.assertLogs("core.routers", "DEBUG") as logs:
+            response = self.middleware(self.factory.get("/"))
+        # the row was written to the primary and is not on the replica
+        self.assertEqual(self.routed, ["replica", False])
+        self.assertNotIn("primary_pin", response.cookies)
+        self.assertIn("routed to replica", logs.output[0])
+
+    def test_cache_rebuilds_read_from_primary(self):
+        def get_response(request):
+            self.routed.append(get_or_set("routed", lambda: router.db_for_read(get_user_model())))
+            self.routed.append(router.db_for_read(get_user_model()))
+            return HttpResponse()
+
+        self.addCleanup(cache.clear)
+        ReplicaRoutingMiddleware(get_response)(self.factory.get("/"))
+        self.assertEqual(self.routed, ["default", "replica"])
+
+    def test_write_pins_client_to_primary(self):
+        response = self.middleware(self.factory.post("/"))
+        self.assertEqual(self.routed, ["default", True])
+        self.assertEqual(response.cookies["primary_pin"]["max-age"], 10)
+
+        request = self.factory.get("/")
+        request.COOKIES["primary_pin"] = response.cookies["primary_pin"].value
+        self.middleware(request)
+        self.assertEqual(self.routed[2:], ["default", True])
+
+
+class TestASGIHandler(SimpleTestCase):
+    def setUp(self):
+        self.application = ASGIHandler()
+
+    def tearDown(self):
+        self.application.executor.shutdown()
+        self.application.read_executor.shutdown()
+
+    def scope(self, method, path, query_string=b"", headers=()):
+        return {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "query_string": query_string,
+            "headers": [(b"host", b"testserver"), *headers],
+        }
+
+    def request(self, scope, body=b""):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.application(scope, receive, send))
+        finally:
+            loop.close()
+        return messages
+
+    def test_request(self):
+        messages = self.request(self.scope("GET", "/api/autocomplete/", b"limit=5"))
+        self.assertEqual(messages[0]["status"], 400)
+        self.assertIn((b"content-type", b"application/json"), messages[0]["headers"])
+        body = json.loads(b"".join(message.get("body", b"") for message in messages[1:]))
+        self.assertIn("q", body["data"])
+        self.assertFalse(messages[-1]["more_body"])
+
+    def test_environ(self):
+        scope = self.scope("POST", "/api/users/user/", b"a=1", [
+            (b"content-type", b"application/json"),
+            (b"content-length", b"2"),
+            (b"accept", b"text/html"),
+            (b"accept", b"application/json"),
+        ])
+        environ = ASGIHandler.environ(scope, io.BytesIO(b"{}"))
+        self.assertEqual(environ["CONTENT_TYPE"], "application/json")
+        self.assertEqual(environ["CONTENT_LENGTH"], "2")
+        self.assertEqual(environ["HTTP_ACCEPT"], "text/html,application/json")
+        self.assertEqual(environ["QUERY_STRING"], "a=1")
+        self.assertEqual(environ["wsgi.input"].read(), b"{}")
+
+    def test_read_endpoints_use_read_pool(self):
+        executor_for = self.application.executor_for
+        self.assertIs(
+            executor_for(self.scope("GET", "/api/questions/question/")), self.application.executor
+        )
+        self.assertIs(
+            executor_for(self.scope("GET", "/api/questions/question/a-slug/")),
+            self.application.read_executor,
+        )
+        self.assertIs(
+            executor_for(self.scope("GET", "/api/subqs/subq/")), self.application.read_executor
+        )
+        self.assertIs(
+            executor_for(self.scope("POST", "/api/subqs/subq/")), self.application.executor
+        )
+        self.assertIs(
+            executor_for(self.scope("GET", "/api/questions/question/1/add_vote/")),
+            self.application.executor,
+        )
+
+    @override_settings(ASGI_THREADS=8, ASGI_READ_THREADS=32, ASGI_DB_CONNECTIONS=20)
+    def test_threads_within_connection_budget(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ASGIHandler()
+
+
+class TestWarmUp(SimpleTestCase):
+    def test_warm_up(self):
+        # runs in the gunicorn master, so it must not touch the database
+        self.assertGreater(warm_up(), 50)
+
+
+class TestOpenAPISchema(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "openapi.json")
+        get_schema.cache_clear()
+
+    def tearDown(self):
+        get_schema.cache_clear()
+        shutil.rmtree(self.directory)
+
+    def test_serves_artifact_with_etag(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path):
+            call_command("build_openapi_schema", stdout=io.StringIO())
+            res = self.client.get("/api/openapi/api.json/")
+            self.assertEqual(res.status_code, 200)
+            with open(self.path, "rb") as schema_file:
+                self.assertEqual(res.content, schema_file.read())
+            self.assertIn("/users/user/search/", json.loads(res.content)["paths"])
+
+            res = self.client.get("/api/openapi/api.json/", HTTP_IF_NONE_MATCH=res["ETag"])
+            self.assertEqual(res.status_code, 304)
+
+    def test_generated_once_without_artifact(self):
+        with override_settings(OPENAPI_SCHEMA_PATH=self.path), \
+                mock.patch("core.openapi.generate_schema", return_value=b"{}") as generate_schema:
+            self.assertEqual(self.client.get("/api/openapi/api.json/").content, b"{}")
+            self.assertEqual(self.client.get("/api/openapi/api.json/").content, b"{}")
+        self.assertEqual(generate_schema.call_count, 1)
+
+
+class TestRequestProfiling(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.staff = get_user_model().objects.create_user(
+            username="staff", email="staff@example.com", password="staff", is_staff=True
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, user, client=None, **extra):
+        client = client or APIClient()
+        client.force_authenticate(user)
+        return client.get("/api/users/user/", **extra)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_timing_headers(self):
+        res = self.get(self.staff, HTTP_X_PROFILE="1")
+        self.assertGreater(int(res["X-DB-Queries"]), 0)
+        self.assertRegex(
+            res["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, render;',
+        )
+        self.assertIn("queries=", RequestIDMiddleware().get_log_message(res.wsgi_request, res))
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_headers_only_for_staff(self):
+        user = get_user_model().objects.create_user(
+            username="plain", email="plain@example.com", password="plain"
+        )
+        self.assertNotIn("Server-Timing", self.get(user, HTTP_X_PROFILE="1"))
+        self.assertNotIn("Server-Timing", self.get(self.staff))
+
+    def test_disabled(self):
+        res = self.get(self.staff, HTTP_X_PROFILE="1")
+        self.assertNotIn("Server-Timing", res)
+        self.assertFalse(hasattr(res.wsgi_request, "profile"))
+
+    def test_sampled_dump(self):
+        with override_settings(
+            REQUEST_PROFILING=True, REQUEST_PROFILE_EVERY=2, REQUEST_PROFILE_DIR=self.directory
+        ):
+            # the middleware counts requests per handler, as a server process does
+            client = APIClient()
+            self.get(self.staff, client)
+            self.get(self.staff, client)
+        dumps = os.listdir(self.directory)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].endswith(".prof"))
+        self.assertGreater(pstats.Stats(os.path.join(self.directory, dumps[0])).total_calls, 0)
+
+
+class TestNPlusOne(TestCase):
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create_user(
+                username=f"user{n}", email=f"user{n}@example.com", password="user"
+            )
+            for n in range(3)
+        ]
+
+    def load_users(self, request=None):
+        for user in self.users:
+            get_user_model().objects.get(pk=user.pk)
+        return HttpResponse()
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM q WHERE id IN (%s, %s,%s) AND slug = 'it''s'  AND n > 10"),
+            fingerprint("SELECT * FROM q WHERE id IN (%s) AND slug = 'other' AND n > -2"),
+        )
+        self.assertIn('"user_2fa"', fingerprint('SELECT "user_2fa"."id" FROM "user_2fa"'))
+
+    def test_detect(self):
+        with self.assertRaises(NPlusOneError) as raised:
+            with detect("Loading users", threshold=2):
+                self.load_users()
+        message = str(raised.exception)
+        self.assertIn("Loading users ran 1 statement(s) more than 2 times", message)
+        self.assertIn("3 x SELECT", message)
+        self.assertIn("in load_users", message)
+        with detect(threshold=3) as fingerprints:
+            self.load_users()
+        self.assertEqual(fingerprints.repeated(), [])
+
+    @override_settings(NPLUSONE_THRESHOLD=2)
+    def test_middleware(self):
+        middleware = NPlusOneMiddleware(self.load_users)
+        request = APIRequestFactory().get("/api/users/user/")
+        with self.assertRaises(NPlusOneError):
+            middleware(request)
+        with override_settings(NPLUSONE_ACTION="log"), self.assertLogs(
+            "core.nplusone", "WARNING"
+        ) as logs:
+            self.assertEqual(middleware(request).status_code, 200)
+        self.assertIn("GET /api/users/user/ ran 1 statement(s)", logs.output[0])
+        with override_settings(NPLUSONE_ACTION=None):
+            self.assertRaises(MiddlewareNotUsed, NPlusOneMiddleware, self.load_users)
+
+
+@celery_app.task
+def metered_task():
+    return None
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        metrics.store.reset()
+        overrides = override_settings(
+            METRICS_ENABLED=True, METRICS_TOKEN="secret", METRICS_DIR=self.directory
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = get_user_model().objects.create_user(
+            username="user", email="user@example.com", password="user"
+        )
+
+    def tearDown(self):
+        metrics.store.remote = False
+        metrics.store.reset()
+        shutil.rmtree(self.directory)
+        cache.clear()
+
+    def scrape(self, token="secret"):
+        return APIClient().get("/metrics", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_requests(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.get("/api/users/user/")
+        res = self.scrape()
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = res.content.decode()
+        labels = 'method="GET",route="api/users/user/",status="200"'
+        self.assertIn(f"theraq_http_request_duration_seconds_count{{{labels}}} 1", body)
+        self.assertIn(f'theraq_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', body)
+        self.assertRegex(
+            body, r'theraq_http_db_queries_sum\{method="GET",route="api/users/user/"\} [1-9]'
+        )
+        self.assertIn("# TYPE theraq_http_response_size_bytes histogram", body)
+
+    def test_token(self):
+        self.assertEqual(self.scrape("wrong").status_code, 401)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.scrape().status_code, 404)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.scrape().status_code, 404)
+
+    def test_disabled(self):
+        with override_settings(METRICS_ENABLED=False):
+            metrics.CACHE_EVENTS.inc(cache="questions", event="hit")
+            self.assertRaises(MiddlewareNotUsed, MetricsMiddleware, lambda request: HttpResponse())
+        self.assertEqual(metrics.collect(), {})
+
+    def test_processes_add_up(self):
+        metrics.CACHE_EVENTS.inc(cache="questions", event="hit")
+        metrics.TASK_DURATION.observe(0.02, task="t", state="SUCCESS")
+        with open(os.path.join(self.directory, "1-other.json"), "w") as metrics_file:
+            json.dump(
+                [
+                    ["theraq_cache_events_total", ["questions", "hit"], 2],
+                    [
+                        "theraq_celery_task_duration_seconds",
+                        ["t", "SUCCESS"],
+                        [0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0.3, 1],
+                    ],
+                ],
+                metrics_file,
+            )
+        totals = metrics.collect()
+        self.assertEqual(totals[("theraq_cache_events_total", ("questions", "hit"))], 3)
+        self.assertEqual(totals[("theraq_celery_task_duration_seconds", ("t", "SUCCESS"))][-1], 2)
+        body = metrics.render()
+        self.assertIn(
+            'theraq_celery_task_duration_seconds_bucket{task="t",state="SUCCESS",le="0.05"} 1', body
+        )
+        self.assertIn(
+            'theraq_celery_task_duration_seconds_bucket{task="t",state="SUCCESS",le="0.5"} 2', body
+        )
+
+    def test_worker_processes_write_to_cache(self):
+        metrics.store.remote = True
+        metrics.TASK_DURATION.observe(0.02, task="t", state="SUCCESS")
+        metrics.store.flush()
+        first = metrics.store.slot
+        metrics.store.reset()
+        metrics.TASK_DURATION.observe(0.2, task="t", state="SUCCESS")
+        metrics.store.flush()
+        self.assertEqual(os.listdir(self.directory), [])
+
+        # a web process adds them up
+        metrics.store.remote = False
+        metrics.store.reset()
+        key = ("theraq_celery_task_duration_seconds", ("t", "SUCCESS"))
+        self.assertEqual(metrics.collect()[key][-1], 2)
+
+        cache.delete(metrics.SNAPSHOT_KEY.format(slot=first))
+        self.assertEqual(metrics.collect()[key][-1], 1)
+        self.assertEqual(cache.get(metrics.FIRST_SLOT_KEY), first + 1)
+
+    def test_skipped_slot_is_replaced(self):
+        metrics.store.remote = True
+        metrics.CACHE_EVENTS.inc(cache="questions", event="hit")
+        metrics.store.flush()
+        slot = metrics.store.slot
+        cache.set(metrics.FIRST_SLOT_KEY, slot + 1, None)
+        metrics.store.flush()
+        self.assertEqual(metrics.store.slot, slot + 1)
+        metrics.store.remote = False
+        metrics.store.reset()
+        self.assertEqual(metrics.collect()[("theraq_cache_events_total", ("questions", "hit"))], 1)
+
+    def test_forked_child_starts_empty(self):
+        metrics.CACHE_EVENTS.inc(cache="questions", event="miss")
+        metrics.store.pid = -1
+        metrics.CACHE_EVENTS.inc(cache="questions", event="hit")
+        self.assertEqual(
+            list(metrics.store.values), [("theraq_cache_events_total", ("questions", "hit"))]
+        )
+
+    def test_cache_events(self):
+        get_or_set("metrics-test", lambda: 1, timeout=60)
+        get_or_set("metrics-test", lambda: 1, timeout=60)
+        events = {
+            labels[1]: value
+            for (name, labels), value in metrics.collect().items()
+            if name == "theraq_cache_events_total"
+        }
+        self.assertEqual(events.get("hit"), 1)
+        self.assertGreaterEqual(events.get("miss"), 1)
+        cache.delete("metrics-test")
+
+    def test_tasks(self):
+        metered_task.delay()
+        totals = metrics.collect()
+        self.assertEqual(
+            totals[("theraq_celery_task_duration_seconds", ("core.tests.metered_task", "SUCCESS"))][
+                -1
+            ],
+            1,
+        )
+        # eager tasks are never published, a worker gets the header with the message
+        self.assertNotIn(
+            ("theraq_celery_task_queue_lag_seconds", ("core.tests.metered_task",)), totals
+        )
+        metered_task.push_request(published_at=time.time() - 2)
+        try:
+            metrics.task_started(task=metered_task)
+        finally:
+            metered_task.pop_request()
+        lag = metrics.collect()[
+            ("theraq_celery_task_queue_lag_seconds", ("core.tests.metered_task",))
+        ]
+        self.assertEqual(lag[-1], 1)
+        self.assertGreaterEqual(lag[-2], 2)
+
+
+coalesced_runs = []
+
+
+@celery_app.task(base=CoalescedTask)
+def coalesced_task(key):
+    coalesced_runs.append(key)
+
+
+@mock.patch("core.coalesce.transaction.on_commit", lambda func: func())
+class TestCoalescedTask(SimpleTestCase):
+    def setUp(self):
+        del coalesced_runs[:]
+        self.addCleanup(cache.clear)
+
+    def test_coalesce(self):
+        with mock.patch.object(coalesced_task, "apply_async") as send:
+            for _ in range(500):
+                coalesced_task.coalesce("a")
+            coalesced_task.coalesce("b")
+            self.assertEqual(send.call_args_list, [
+                mock.call(("a",), countdown=settings.COALESCE_DELAY),
+                mock.call(("b",), countdown=settings.COALESCE_DELAY),
+            ])
+            # a run takes calls made after it started
+            coalesced_task("a")
+            coalesced_task.coalesce("a")
+            self.assertEqual(send.call_count, 3)
+
+    def test_coalesce_key_is_valid(self):
+        key = coalesced_task.coalesce_key(({"question": 1, "reply": 2}, "two words"))
+        self.assertNotIn(" ", key)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            cache.validate_key(cache.make_key(key))
+        self.assertNotEqual(key, coalesced_task.coalesce_key(({"question": 1}, "two words")))
+
+    def test_eager(self):
+        coalesced_task.coalesce("a")
+        coalesced_task.coalesce("a")
+        self.assertEqual(coalesced_runs, ["a", "a"])
+
+
+class TestTaskRouting(SimpleTestCase):
+    def test_routes(self):
+        for task, queue in (
+            ("accounts.tasks.export_user_data", "bulk"),
+            ("subq.tasks.roll_up_subq_stats", "maintenance"),
+            ("questions.tasks.recount_votes", "realtime"),
+        ):
+            route = celery_app.amqp.router.route({}, task)
+            self.assertEqual((route["queue"].name, route["queue"].routing_key), (queue, queue))
+
+
+@mock.patch("celery.beat.PersistentScheduler.tick", return_value=5)
+class TestLockedScheduler(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(cache.clear)
+
+    def scheduler(self, name):
+        return LockedScheduler(app=celery_app, schedule_filename=os.path.join(self.directory, name))
+
+    def test_single_beat_sends(self, tick):
+        first, second = self.scheduler("first"), self.scheduler("second")
+        self.assertEqual(first.tick(), 5)
+        self.assertEqual(second.tick(), second.max_interval)
+        self.assertEqual(first.tick(), 5)
+        self.assertEqual(tick.call_count, 2)
+        first.close()
+        self.assertEqual(second.tick(), 5)
+        second.close()
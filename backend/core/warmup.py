@@ -0,0 +1,75 @@
+"""
+Warm-up of a freshly loaded application.
+
+The gunicorn master runs ``warm_up`` before forking its workers (see theraq.gunicorn), so the
+imports and caches a first request would otherwise fill are shared by every worker: the URL
+conf with all views, the admin, drf_yasg and the allauth providers, the serializers and the
+model metadata their fields are built from, and the translation catalog.
+"""
+import importlib
+import logging
+
+from allauth.socialaccount import providers
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_MODULES = ("serializers", "views", "admin", "tasks")
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def import_app_modules():
+    for app in settings.LOCAL_APPS:
+        for name in WARM_UP_MODULES:
+            module = f"{app}.{name}"
+            try:
+                importlib.import_module(module)
+            except ModuleNotFoundError as exc:
+                if exc.name != module:
+                    raise
+
+
+def build_serializers():
+    """
+    Instantiates every serializer class once and builds its fields. Returns the number of
+    serializers built; abstract ones and those that need arguments are skipped.
+    """
+    built = 0
+    for serializer_class in set(_subclasses(BaseSerializer)):
+        if issubclass(serializer_class, ListSerializer):
+            continue
+        try:
+            serializer = serializer_class()
+            getattr(serializer, "fields", None)
+        except Exception:  # pylint: disable=broad-except
+            logger.debug("Skipped warming up %s", serializer_class.__qualname__, exc_info=True)
+        else:
+            built += 1
+    return built
+
+
+def warm_up():
+    """
+    Loads everything a first request would. Returns the number of serializers built.
+    """
+    import_app_modules()
+    resolver = get_resolver()
+    # populating the reverse lookups imports every URL conf and view
+    getattr(resolver, "reverse_dict")
+    providers.registry.get_list()
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext("")
+    built = build_serializers()
+    # the forked workers must not share the master's database connections
+    connections.close_all()
+    return built
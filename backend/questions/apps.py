@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class QuestionsConfig(AppConfig):
     name = 'questions'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel, unused-import
+        import questions.autocomplete  # noqa
+        import questions.counters  # noqa
+        import questions.reputation  # noqa
@@ -0,0 +1,172 @@
+"""
+Autocomplete of sub and tag names from a prefix index file, see core.prefix_index.
+
+Every web dyno keeps its own index file, shared by the workers of that dyno through mmap, so
+lookups never touch the database. The dynos share no disk but do share the cache: it holds a
+version token of the index, replaced whenever a sub or tag is saved and every hour by
+``rebuild_autocomplete_index`` so that follower counts are picked up too. Each process looks at
+the token at most every ``AUTOCOMPLETE_VERSION_CHECK_INTERVAL`` seconds and, when the file of
+its host was built for another one, rebuilds the file in a background thread while lookups keep
+being served from the current file. Only the very first lookup on a host waits for a build.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.prefix_index import IndexEntry, IndexLock, open_index, write_index
+from questions.models import QTag
+from subq.models import SubQ
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "autocomplete:version"
+
+KIND_SUBQ = 1
+KIND_QTAG = 2
+KINDS = {"subq": KIND_SUBQ, "qtag": KIND_QTAG}
+KIND_NAMES = {value: key for key, value in KINDS.items()}
+
+
+def subq_entries(queryset=None):
+    queryset = SubQ.objects.all() if queryset is None else queryset
+    rows = (
+        queryset.filter(status=False)
+        .annotate(weight=Count("followers", filter=Q(followers__status=False)))
+        .values_list("sub_name", "slug", "weight")
+    )
+    return [IndexEntry(KIND_SUBQ, name, slug, weight) for name, slug, weight in rows]
+
+
+def qtag_entries(queryset=None):
+    queryset = QTag.objects.all() if queryset is None else queryset
+    rows = (
+        queryset.filter(status=False)
+        .annotate(weight=Count("question_tags"))
+        .values_list("tag_name", "slug", "weight")
+    )
+    return [IndexEntry(KIND_QTAG, name, slug, weight) for name, slug, weight in rows]
+
+
+def current_version():
+    """
+    The version token every index file should be built for.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """
+    Has every host rebuild its index on one of its next lookups.
+    """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def index_version(path):
+    """
+    The version token the index at ``path`` was built for, ``None`` when there is none.
+    """
+    try:
+        with open(f"{path}.version") as version_file:
+            return version_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, version):
+    write_index(path, subq_entries() + qtag_entries())
+    partial = f"{path}.version.part"
+    with open(partial, "w") as version_file:
+        version_file.write(version)
+    os.replace(partial, f"{path}.version")
+
+
+def build_index():
+    """
+    Rebuilds the whole autocomplete index of this host from the database.
+    """
+    path = settings.AUTOCOMPLETE_INDEX_PATH
+    with IndexLock(path):
+        _write(path, current_version())
+    return open_index(path)
+
+
+def refresh_index(version):
+    """
+    Rebuilds the index of this host unless another process already built it for ``version``.
+    """
+    path = settings.AUTOCOMPLETE_INDEX_PATH
+    with IndexLock(path):
+        if index_version(path) != version:
+            _write(path, version)
+
+
+_refresh = {"checked": None, "thread": None}
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_thread(version):
+    try:
+        refresh_index(version)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Rebuilding the autocomplete index failed")
+    finally:
+        connections.close_all()
+
+
+def _refresh_in_background(version):
+    with _refresh_lock:
+        thread = _refresh["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=_refresh_in_thread, args=(version,), name="autocomplete-refresh", daemon=True
+        )
+        _refresh["thread"] = thread
+        thread.start()
+
+
+def get_index():
+    """
+    The autocomplete index of this host, built on first use when no index file exists yet.
+    """
+    path = settings.AUTOCOMPLETE_INDEX_PATH
+    index = open_index(path)
+    if index is None:
+        logger.info("No autocomplete index at %s, building it", path)
+        return build_index()
+    now = time.monotonic()
+    checked = _refresh["checked"]
+    if checked is None or now - checked >= settings.AUTOCOMPLETE_VERSION_CHECK_INTERVAL:
+        _refresh["checked"] = now
+        version = current_version()
+        if index_version(path) != version:
+            _refresh_in_background(version)
+    return index
+
+
+def search(prefix, limit=10, kinds=None):
+    return get_index().search(
+        prefix, limit=limit, kinds=kinds, scan_limit=settings.AUTOCOMPLETE_SCAN_LIMIT
+    )
+
+
+# renamed, archived and new subs and tags show up once the hosts rebuilt their index
+@receiver(post_save, sender=SubQ)
+@receiver(post_save, sender=QTag)
+def expire_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(bump_version)
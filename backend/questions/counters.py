@@ -0,0 +1,106 @@
+"""
+Vote counters of questions, replies and comments.
+
+The vote endpoints write votes with single statements that return the vote they replaced (see
+questions.managers), and ``vote_changed`` moves the counters by the exact difference.
+
+Votes saved through the ORM, in the admin or a shell, ask for a recount of their target from
+the vote table by the ``questions.tasks.recount_votes`` task instead. Recounts are coalesced
+(see core.coalesce) so a burst of votes on one question costs one recount rather than one per
+vote, and counts lag at most ``COALESCE_DELAY`` seconds, plus the queue wait, behind the votes.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from questions.models import Comment, CommentVote, Question, QuestionVote, Reply, ReplyVote
+
+
+# target name: (target model, vote model, voted content field)
+VOTE_TARGETS = {
+    "question": (Question, QuestionVote, "question"),
+    "reply": (Reply, ReplyVote, "reply"),
+    "comment": (Comment, CommentVote, "comment"),
+}
+
+
+def vote_count(vote_model, content_field, vote_type):
+    votes = (
+        vote_model.objects.filter(**{content_field: OuterRef("pk")}, vote_type=vote_type)
+        .order_by()
+        .values(content_field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+
+
+def recount(target, ids=None):
+    """
+    Recounts the votes of the given ``target`` rows, or of all of them, in one statement.
+    Returns the number of rows updated.
+    """
+    model, vote_model, content_field = VOTE_TARGETS[target]
+    rows = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    return rows.update(
+        up_votes=vote_count(vote_model, content_field, "UP_VOTE"),
+        down_votes=vote_count(vote_model, content_field, "DOWN_VOTE"),
+    )
+
+
+def adjust(target, target_id, up_votes, down_votes):
+    """
+    Adds to the counters of one question, reply or comment in one UPDATE. Counters stop at
+    zero, in case a recount of votes saved through the ORM is still pending.
+    """
+    if not up_votes and not down_votes:
+        return
+    model = VOTE_TARGETS[target][0]
+    model.objects.filter(pk=target_id).update(
+        up_votes=Greatest(F("up_votes") + up_votes, 0),
+        down_votes=Greatest(F("down_votes") + down_votes, 0),
+    )
+
+
+def difference(previous, current):
+    """
+    The change of ``(up_votes, down_votes)`` when a vote goes from vote type ``previous`` to
+    ``current``, either being ``None`` for no vote.
+    """
+    return (
+        (current == "UP_VOTE") - (previous == "UP_VOTE"),
+        (current == "DOWN_VOTE") - (previous == "DOWN_VOTE"),
+    )
+
+
+def vote_changed(vote, previous, current):
+    for target, (_, vote_model, content_field) in VOTE_TARGETS.items():
+        if isinstance(vote, vote_model):
+            adjust(target, getattr(vote, f"{content_field}_id"), *difference(previous, current))
+            return
+
+
+def request_recount(vote):
+    # pylint: disable=import-outside-toplevel
+    from questions.tasks import recount_votes
+
+    for target, (_, vote_model, content_field) in VOTE_TARGETS.items():
+        if isinstance(vote, vote_model):
+            recount_votes.coalesce(target, getattr(vote, f"{content_field}_id"))
+            return
+
+
+@receiver(post_save, sender=QuestionVote)
+@receiver(post_save, sender=ReplyVote)
+@receiver(post_save, sender=CommentVote)
+def vote_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw and (created or instance.tracker.has_changed("vote_type")):
+        request_recount(instance)
+
+
+@receiver(post_delete, sender=QuestionVote)
+@receiver(post_delete, sender=ReplyVote)
+@receiver(post_delete, sender=CommentVote)
+def vote_deleted(sender, instance, **kwargs):
+    request_recount(instance)
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from questions import autocomplete
+
+
+class Command(BaseCommand):
+    help = "Rebuild the shared autocomplete index of sub and tag names"
+
+    def handle(self, *args, **options):
+        autocomplete.bump_version()
+        index = autocomplete.build_index()
+        self.stdout.write(f"Wrote {len(index)} keys to {settings.AUTOCOMPLETE_INDEX_PATH}\n")
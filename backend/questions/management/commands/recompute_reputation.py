@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from questions import reputation
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds every user's reputation from the question, reply and comment vote tables, to
+    reconcile the incrementally maintained scores.
+    """
+
+    help = "Recompute user reputation from all votes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=settings.REPUTATION_RECOMPUTE_BATCH_SIZE,
+            help="Number of users recomputed per statement.",
+        )
+
+    def handle(self, *args, **options):
+        updated = reputation.recompute(batch_size=options["batch_size"])
+        self.stdout.write(f"Recomputed the reputation of {updated} users\n")
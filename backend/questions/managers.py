@@ -0,0 +1,159 @@
+from django.db import connections, models
+
+
+class VoteQuerySet(models.QuerySet):
+    """
+    Votes are written with one statement each, so casting a vote can not race with another
+    request of the same user into duplicate rows, and the caller learns what the statement
+    replaced to adjust counters and reputation by the exact difference. Being raw SQL, these
+    statements send no model signals.
+    """
+
+    def _target_field(self):
+        """
+        The foreign key to the voted question, reply or comment.
+        """
+        return next(
+            field for field in self.model._meta.concrete_fields
+            if field.is_relation and field.name != "user"
+        )
+
+    def _vote(self, pk, user, target, vote_type):
+        target_field = self._target_field()
+        return self.model(pk=pk, user=user, vote_type=vote_type, **{target_field.name: target})
+
+    def cast(self, user, target, vote_type):
+        """
+        Adds or changes the vote of ``user`` on ``target`` with a single
+        ``INSERT ... ON CONFLICT DO UPDATE`` statement, preceded by a SELECT on SQLite. Returns
+        the vote, the vote type it replaced (``None`` when the user had not voted) and whether
+        the row was inserted.
+
+        On Postgres the replaced vote type is read by the statement itself, from the snapshot it
+        started with. A vote the same user inserted concurrently is not part of that snapshot,
+        so a vote that was not inserted but replaced ``None`` replaced a vote of unknown type.
+        """
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        instance = self._vote(None, user, target, vote_type)
+        fields = [field for field in meta.concrete_fields if not field.primary_key]
+        params = [
+            field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields
+        ]
+        table = quote(meta.db_table)
+        target_field = self._target_field().name
+        vote_column, updated_date, status, user_column, target_column = (
+            quote(meta.get_field(name).column)
+            for name in ("vote_type", "updated_date", "status", "user", target_field)
+        )
+        upsert = (
+            f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+            f"VALUES ({', '.join(['%s'] * len(fields))}) "
+            f"ON CONFLICT ({user_column}, {target_column}) "
+            f"DO UPDATE SET {vote_column} = EXCLUDED.{vote_column}, {status} = EXCLUDED.{status}, "
+            f"{updated_date} = EXCLUDED.{updated_date} "
+            f"RETURNING {quote(meta.pk.column)}"
+        )
+        previous_sql = (
+            f"SELECT {vote_column} FROM {table} WHERE {user_column} = %s AND {target_column} = %s"
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # the system column xmax is 0 on a row the statement inserted
+                cursor.execute(
+                    f"WITH previous AS ({previous_sql}) "
+                    f"{upsert}, (SELECT * FROM previous), xmax = 0",
+                    [user.pk, target.pk] + params,
+                )
+                pk, previous, inserted = cursor.fetchone()
+            else:
+                # SQLite would run the WITH query after the insert, but it runs one write at a
+                # time, so the vote read first is the one replaced
+                cursor.execute(previous_sql, [user.pk, target.pk])
+                row = cursor.fetchone()
+                previous = None if row is None else row[0]
+                cursor.execute(upsert, params)
+                pk, inserted = cursor.fetchone()[0], previous is None
+        return self._vote(pk, user, target, vote_type), previous, inserted
+
+    def retract(self, user, target):
+        """
+        Removes the vote of ``user`` on ``target`` with one ``DELETE ... RETURNING`` statement.
+        Returns the removed vote, or ``None`` when there was none.
+        """
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        user_column, target_column = (
+            quote(meta.get_field(name).column) for name in ("user", self._target_field().name)
+        )
+        sql = (
+            f"DELETE FROM {quote(meta.db_table)} WHERE {user_column} = %s AND {target_column} = %s "
+            f"RETURNING {quote(meta.pk.column)}, {quote(meta.get_field('vote_type').column)}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, target.pk])
+            row = cursor.fetchone()
+        return None if row is None else self._vote(row[0], user, target, row[1])
+
+    def upsert_many(self, votes):
+        """
+        Writes ``(user_id, target_id, vote_type)`` votes with one multi-row
+        ``INSERT ... ON CONFLICT DO UPDATE`` statement. Returns the number of votes written.
+        """
+        if not votes:
+            return 0
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        target_field = self._target_field().name
+        fields = [field for field in meta.concrete_fields if not field.primary_key]
+        params = []
+        for user_id, target_id, vote_type in votes:
+            instance = self.model(
+                user_id=user_id, vote_type=vote_type, **{f"{target_field}_id": target_id}
+            )
+            params.extend(
+                field.get_db_prep_save(field.pre_save(instance, True), connection)
+                for field in fields
+            )
+        vote_column, updated_date, status, user_column, target_column = (
+            quote(meta.get_field(name).column)
+            for name in ("vote_type", "updated_date", "status", "user", target_field)
+        )
+        columns = ", ".join(quote(field.column) for field in fields)
+        row = f"({', '.join(['%s'] * len(fields))})"
+        sql = (
+            f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+            f"VALUES {', '.join([row] * len(votes))} "
+            f"ON CONFLICT ({user_column}, {target_column}) "
+            f"DO UPDATE SET {vote_column} = EXCLUDED.{vote_column}, {status} = EXCLUDED.{status}, "
+            f"{updated_date} = EXCLUDED.{updated_date}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        return len(votes)
+
+    def retract_many(self, pairs):
+        """
+        Removes the votes of ``(user_id, target_id)`` pairs with one DELETE statement.
+        """
+        if not pairs:
+            return 0
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        user_column, target_column = (
+            quote(meta.get_field(name).column) for name in ("user", self._target_field().name)
+        )
+        condition = " OR ".join([f"({user_column} = %s AND {target_column} = %s)"] * len(pairs))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(meta.db_table)} WHERE {condition}",
+                [value for pair in pairs for value in pair],
+            )
+            return cursor.rowcount
+
+
+VoteManager = models.Manager.from_queryset(VoteQuerySet)
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-19 15:23
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    """
+    Fills the new counters from the vote tables, one UPDATE per table.
+    """
+    for target, vote in (("Question", "QuestionVote"), ("Reply", "ReplyVote"), ("Comment", "CommentVote")):
+        model = apps.get_model("questions", target)
+        vote_model = apps.get_model("questions", vote)
+        content_field = target.lower()
+        counts = {}
+        for vote_type, field in (("UP_VOTE", "up_votes"), ("DOWN_VOTE", "down_votes")):
+            votes = (
+                vote_model.objects.filter(**{content_field: OuterRef("pk")}, vote_type=vote_type)
+                .order_by()
+                .values(content_field)
+                .annotate(total=Count("pk"))
+                .values("total")
+            )
+            counts[field] = Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+        model.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='down_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='up_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='down_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='up_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='down_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='up_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.28 on 2026-10-19 15:27
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+VOTE_TABLES = (("Question", "QuestionVote"), ("Reply", "ReplyVote"), ("Comment", "CommentVote"))
+
+
+def merge_duplicate_votes(apps, schema_editor):
+    """
+    Keeps the latest vote of every user on every question, reply and comment, the one the
+    user cast last, and recounts the vote counters of the content that had duplicates. The
+    reputation of authors counted the duplicates too, ``recompute_reputation`` corrects it.
+    """
+    for target, vote in VOTE_TABLES:
+        model = apps.get_model("questions", target)
+        vote_model = apps.get_model("questions", vote)
+        content_field = target.lower()
+        duplicates = (
+            vote_model.objects.filter(user__isnull=False)
+            .values("user", content_field)
+            .annotate(votes=Count("pk"), latest=Max("pk"))
+            .filter(votes__gt=1)
+            .order_by()
+        )
+        recount = set()
+        for group in duplicates:
+            vote_model.objects.filter(
+                user=group["user"], **{content_field: group[content_field]}
+            ).exclude(pk=group["latest"]).delete()
+            recount.add(group[content_field])
+        if not recount:
+            continue
+        counts = {}
+        for vote_type, field in (("UP_VOTE", "up_votes"), ("DOWN_VOTE", "down_votes")):
+            votes = (
+                vote_model.objects.filter(**{content_field: OuterRef("pk")}, vote_type=vote_type)
+                .order_by()
+                .values(content_field)
+                .annotate(total=Count("pk"))
+                .values("total")
+            )
+            counts[field] = Coalesce(Subquery(votes, output_field=IntegerField()), Value(0))
+        model.objects.filter(pk__in=recount).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0002_vote_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commentvote',
+            constraint=models.UniqueConstraint(fields=('user', 'comment'), name='comment_vote_unique_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='questionvote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='question_vote_unique_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='replyvote',
+            constraint=models.UniqueConstraint(fields=('user', 'reply'), name='reply_vote_unique_user'),
+        ),
+    ]
@@ -2,8 +2,10 @@ from django.conf import settings
 from django.db import models
 # Create your models here.
 from django.utils.text import slugify
+from model_utils.tracker import FieldTracker
 
 from core.models import BaseAppModel, BaseVoteModel
+from questions.managers import VoteManager
 from subq.models import SubQ
 
 
@@ -21,6 +23,9 @@ class Question(BaseAppModel):
     subq = models.ForeignKey(
         SubQ, models.DO_NOTHING, blank=True, null=False, related_name="subq_questions"
     )
+    # vote counters, recounted in the background, see questions.counters
+    up_votes = models.PositiveIntegerField(default=0)
+    down_votes = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = "question"
@@ -102,6 +107,8 @@ class Reply(BaseAppModel):
     question = models.ForeignKey(
         Question, models.DO_NOTHING, blank=True, null=True, related_name="question_replies"
     )
+    up_votes = models.PositiveIntegerField(default=0)
+    down_votes = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = "reply"
@@ -123,6 +130,8 @@ class Comment(BaseAppModel):
     reply = models.ForeignKey(
         Reply, models.DO_NOTHING, blank=True, null=True, related_name="reply_comments"
     )
+    up_votes = models.PositiveIntegerField(default=0)
+    down_votes = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = "comment"
@@ -146,9 +155,16 @@ class CommentVote(BaseVoteModel):
         related_name="comment_votes",
     )
 
+    tracker = FieldTracker(fields=["vote_type"])
+
+    objects = VoteManager()
+
     class Meta:
         db_table = "comment_vote"
         verbose_name = "Comment Vote"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "comment"], name="comment_vote_unique_user"),
+        ]
 
 
 class QuestionVote(BaseVoteModel):
@@ -164,9 +180,16 @@ class QuestionVote(BaseVoteModel):
         related_name="question_votes",
     )
 
+    tracker = FieldTracker(fields=["vote_type"])
+
+    objects = VoteManager()
+
     class Meta:
         db_table = "question_vote"
         verbose_name = "Question Vote"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "question"], name="question_vote_unique_user"),
+        ]
 
 
 class ReplyVote(BaseVoteModel):
@@ -182,6 +205,13 @@ class ReplyVote(BaseVoteModel):
         related_name="reply_votes",
     )
 
+    tracker = FieldTracker(fields=["vote_type"])
+
+    objects = VoteManager()
+
     class Meta:
         db_table = "reply_vote"
         verbose_name = "Reply Vote"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "reply"], name="reply_vote_unique_user"),
+        ]
@@ -0,0 +1,117 @@
+"""
+User reputation, the net vote points on everything a user has posted.
+
+``User.reputation`` is kept current with one atomic ``UPDATE ... SET reputation = reputation +
+delta`` per vote that is added, changed or removed, so reading it never touches the vote
+tables. The vote endpoints write with raw SQL and apply the delta themselves, see
+questions.votes. Other votes written without signals (queryset ``update``/``delete``) are
+picked up by ``recompute``, which rebuilds every score from the vote tables in bulk.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from questions.models import CommentVote, QuestionVote, ReplyVote
+
+
+User = get_user_model()
+
+# vote model, voted content field, author field of the content
+VOTED_CONTENT = (
+    (QuestionVote, "question", "author"),
+    (ReplyVote, "reply", "user"),
+    (CommentVote, "comment", "user"),
+)
+
+
+def vote_points(vote_type):
+    return settings.REPUTATION_VOTE_POINTS.get(vote_type, 0)
+
+
+def _author_subquery(model, content_field, author_field, content_id):
+    content = model._meta.get_field(content_field).related_model
+    return Subquery(content.objects.filter(pk=content_id).values(author_field)[:1])
+
+
+def apply_delta(vote, delta):
+    """
+    Adds ``delta`` to the reputation of the author of the content ``vote`` is on, in a single
+    statement that resolves the author in the database.
+    """
+    if not delta:
+        return
+    for model, content_field, author_field in VOTED_CONTENT:
+        if isinstance(vote, model):
+            content_id = getattr(vote, f"{content_field}_id")
+            author = _author_subquery(model, content_field, author_field, content_id)
+            User.objects.filter(pk=author).update(reputation=F("reputation") + delta)
+            return
+
+
+def score_expression():
+    """
+    The points of one vote row, for aggregating over a vote table.
+    """
+    return Case(
+        *[When(vote_type=vote_type, then=Value(points))
+          for vote_type, points in settings.REPUTATION_VOTE_POINTS.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def recompute(batch_size=5000):
+    """
+    Recomputes the reputation of every user from the vote tables, ``batch_size`` users per
+    statement. Each statement sums all three vote tables per author inside the database.
+    Returns the number of users updated.
+    """
+    totals = []
+    for model, content_field, author_field in VOTED_CONTENT:
+        votes = (
+            model.objects.filter(**{f"{content_field}__{author_field}": OuterRef("pk")})
+            .order_by()
+            .values(f"{content_field}__{author_field}")
+            .annotate(total=Sum(score_expression()))
+            .values("total")
+        )
+        totals.append(Coalesce(Subquery(votes, output_field=IntegerField()), Value(0)))
+    reputation = sum(totals[1:], totals[0])
+
+    updated = 0
+    last_id = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return updated
+        updated += User.objects.filter(pk__gte=user_ids[0], pk__lte=user_ids[-1]).update(
+            reputation=reputation
+        )
+        last_id = user_ids[-1]
+
+
+@receiver(post_save, sender=QuestionVote)
+@receiver(post_save, sender=ReplyVote)
+@receiver(post_save, sender=CommentVote)
+def vote_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_delta(instance, vote_points(instance.vote_type))
+    elif instance.tracker.has_changed("vote_type"):
+        previous = instance.tracker.previous("vote_type")
+        apply_delta(instance, vote_points(instance.vote_type) - vote_points(previous))
+
+
+@receiver(post_delete, sender=QuestionVote)
+@receiver(post_delete, sender=ReplyVote)
+@receiver(post_delete, sender=CommentVote)
+def vote_deleted(sender, instance, **kwargs):
+    apply_delta(instance, -vote_points(instance.vote_type))
@@ -487,4 +487,17 @@ class ViewQuestionSerializer(serializers.ModelSerializer):
         return question.question_views.count()
 
     def get_votes(self, question):
-        return QuestionVote.objects.filter(question=question, vote_type="UP_VOTE").count()
+        return question.up_votes
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=True, max_length=100)
+    kind = serializers.ChoiceField(choices=("subq", "qtag"), required=False)
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=25)
+
+
+class AutocompleteSerializer(serializers.Serializer):
+    kind = serializers.CharField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    slug = serializers.CharField(read_only=True)
+    weight = serializers.IntegerField(read_only=True)
@@ -0,0 +1,28 @@
+from core.coalesce import CoalescedTask
+from questions import autocomplete, counters, vote_buffer
+from theraq.celery import app as celery_app
+
+
+@celery_app.task
+def rebuild_autocomplete_index():
+    """
+    Has every web dyno rebuild its autocomplete index, to pick up new follower and question
+    counts.
+    """
+    autocomplete.bump_version()
+
+
+@celery_app.task(base=CoalescedTask)
+def recount_votes(target, target_id):
+    """
+    Recounts the votes of one question, reply or comment, see questions.counters.
+    """
+    return counters.recount(target, [target_id])
+
+
+@celery_app.task(base=CoalescedTask)
+def flush_vote_buffer():
+    """
+    Writes the votes buffered in write-behind mode, see questions.vote_buffer.
+    """
+    return vote_buffer.flush()
@@ -1,13 +1,26 @@
 import json
-
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from questions import autocomplete, counters, reputation, vote_buffer
 from questions.models import (
     QTag,
     Question,
+    QuestionQtag,
     QuestionVote,
     QuestionWatchers,
     Reply,
@@ -519,3 +532,398 @@ class TestQuestionVoteViewSet(APITestCase):
 class TestReplyVoteViewSet(APITestCase):
     def setUp(self):
         pass
+
+
+class TestReputation(APITestCase):
+    def setUp(self):
+        self.test_user, self.normal_client = create_normal_client()
+        self.author = create_user(username="author", email="author@user.com", password="authorpass")
+        self.subq = create_subq(sub_name="rep-sub", owner=self.author)
+        self.question = create_question(
+            post_title="Rep question", post_body="Body", author=self.author, subq=self.subq
+        )
+        self.reply = Reply.objects.create(
+            question=self.question, user=self.author, reply_body="Reply"
+        )
+        self.comment = Comment.objects.create(
+            question=self.question, user=self.author, comment_body="Comment"
+        )
+
+    def reputation(self):
+        return User.objects.values_list("reputation", flat=True).get(pk=self.author.pk)
+
+    def test_votes_update_author_reputation(self):
+        QuestionVote.objects.create(
+            question=self.question, user=self.test_user, vote_type="UP_VOTE"
+        )
+        ReplyVote.objects.create(reply=self.reply, user=self.test_user, vote_type="UP_VOTE")
+        comment_vote = CommentVote.objects.create(
+            comment=self.comment, user=self.test_user, vote_type="UP_VOTE"
+        )
+        self.assertEqual(self.reputation(), 3)
+        comment_vote.vote_type = "DOWN_VOTE"
+        comment_vote.save()
+        self.assertEqual(self.reputation(), 1)
+        comment_vote.delete()
+        self.assertEqual(self.reputation(), 2)
+        self.assertEqual(User.objects.get(pk=self.test_user.pk).reputation, 0)
+
+    def test_vote_endpoints_update_reputation(self):
+        self.normal_client.post(
+            f"/api/questions/question/{self.question.pk}/add_vote/", {"vote_type": "DOWN_VOTE"}
+        )
+        self.assertEqual(self.reputation(), -1)
+        self.normal_client.post(f"/api/questions/question/{self.question.pk}/remove_vote/")
+        self.assertEqual(self.reputation(), 0)
+
+    def test_vote_is_one_query(self):
+        vote = QuestionVote(question=self.question, user=self.test_user, vote_type="UP_VOTE")
+        # the insert and the reputation update
+        with self.assertNumQueries(2):
+            vote.save()
+
+    def test_recompute(self):
+        QuestionVote.objects.create(
+            question=self.question, user=self.test_user, vote_type="UP_VOTE"
+        )
+        ReplyVote.objects.create(reply=self.reply, user=self.test_user, vote_type="DOWN_VOTE")
+        CommentVote.objects.create(comment=self.comment, user=self.test_user, vote_type="UP_VOTE")
+        QuestionVote.objects.create(question=self.question, user=self.author, vote_type="UP_VOTE")
+        # writes that bypass the signals
+        QuestionVote.objects.filter(user=self.author).update(vote_type="DOWN_VOTE")
+        User.objects.update(reputation=42)
+        self.assertEqual(reputation.recompute(batch_size=1), User.objects.count())
+        self.assertEqual(self.reputation(), 0)
+        self.assertEqual(User.objects.get(pk=self.test_user.pk).reputation, 0)
+        User.objects.filter(pk=self.author.pk).update(reputation=42)
+        call_command("recompute_reputation", stdout=StringIO())
+        self.assertEqual(self.reputation(), 0)
+
+    def test_user_list_includes_reputation(self):
+        QuestionVote.objects.create(
+            question=self.question, user=self.test_user, vote_type="UP_VOTE"
+        )
+        res = self.normal_client.get("/api/users/user/", {"id": self.author.pk})
+        self.assertEqual(res.data["results"][0]["reputation"], 1)
+
+
+# coalesced tasks are sent once the transaction commits, which never happens inside a TestCase
+@mock.patch("core.coalesce.transaction.on_commit", lambda func: func())
+class TestVoteCounters(APITestCase):
+    def setUp(self):
+        self.test_user, self.normal_client = create_normal_client()
+        self.author = create_user(username="author", email="author@user.com", password="authorpass")
+        self.subq = create_subq(sub_name="count-sub", owner=self.author)
+        self.question = create_question(
+            post_title="Counted question", post_body="Body", author=self.author, subq=self.subq
+        )
+        self.reply = Reply.objects.create(
+            question=self.question, user=self.author, reply_body="Reply"
+        )
+        self.addCleanup(cache.clear)
+
+    def counts(self, model, pk):
+        return model.objects.values_list("up_votes", "down_votes").get(pk=pk)
+
+    def test_votes_are_counted(self):
+        self.normal_client.post(
+            f"/api/questions/question/{self.question.pk}/add_vote/", {"vote_type": "UP_VOTE"}
+        )
+        self.assertEqual(self.counts(Question, self.question.pk), (1, 0))
+        res = self.normal_client.get(f"/api/questions/question/{self.question.slug}/")
+        self.assertEqual(res.data["votes"], 1)
+        vote = ReplyVote.objects.create(reply=self.reply, user=self.test_user, vote_type="UP_VOTE")
+        vote.vote_type = "DOWN_VOTE"
+        vote.save()
+        self.assertEqual(self.counts(Reply, self.reply.pk), (0, 1))
+        vote.delete()
+        self.assertEqual(self.counts(Reply, self.reply.pk), (0, 0))
+
+    def test_votes_coalesce(self):
+        voters = [
+            create_user(username=f"voter{n}", email=f"voter{n}@user.com", password="voterpass")
+            for n in range(5)
+        ]
+        with mock.patch("questions.tasks.recount_votes.apply_async") as send:
+            for voter in voters:
+                QuestionVote.objects.create(question=self.question, user=voter, vote_type="UP_VOTE")
+        send.assert_called_once_with(
+            ("question", self.question.pk), countdown=settings.COALESCE_DELAY
+        )
+
+    def test_recount(self):
+        QuestionVote.objects.create(
+            question=self.question, user=self.test_user, vote_type="DOWN_VOTE"
+        )
+        Question.objects.update(up_votes=7, down_votes=7)
+        self.assertEqual(counters.recount("question"), 1)
+        self.assertEqual(self.counts(Question, self.question.pk), (0, 1))
+
+
+class TestVoteUpsert(APITestCase):
+    def setUp(self):
+        self.test_user, self.normal_client = create_normal_client()
+        self.author = create_user(username="author", email="author@user.com", password="authorpass")
+        self.subq = create_subq(sub_name="upsert-sub", owner=self.author)
+        self.question = create_question(
+            post_title="Voted question", post_body="Body", author=self.author, subq=self.subq
+        )
+        self.comment = Comment.objects.create(
+            question=self.question, user=self.author, comment_body="Comment"
+        )
+
+    def vote(self, vote_type, path=None):
+        path = path or f"/api/questions/question/{self.question.pk}"
+        return self.normal_client.post(f"{path}/add_vote/", {"vote_type": vote_type})
+
+    def state(self):
+        question = Question.objects.get(pk=self.question.pk)
+        return (
+            question.up_votes,
+            question.down_votes,
+            User.objects.get(pk=self.author.pk).reputation,
+        )
+
+    def test_add_change_retract(self):
+        self.assertEqual(self.vote("UP_VOTE").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.state(), (1, 0, 1))
+        res = self.vote("DOWN_VOTE")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["vote_type"], "DOWN_VOTE")
+        self.assertEqual(self.state(), (0, 1, -1))
+        self.vote("DOWN_VOTE")
+        self.assertEqual(self.state(), (0, 1, -1))
+        self.assertEqual(QuestionVote.objects.filter(question=self.question).count(), 1)
+        res = self.normal_client.post(f"/api/questions/question/{self.question.pk}/remove_vote/")
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.state(), (0, 0, 0))
+        res = self.normal_client.post(f"/api/questions/question/{self.question.pk}/remove_vote/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cast_returns_previous(self):
+        vote, previous, inserted = CommentVote.objects.cast(self.test_user, self.comment, "UP_VOTE")
+        self.assertEqual((previous, inserted), (None, True))
+        again, previous, inserted = CommentVote.objects.cast(
+            self.test_user, self.comment, "DOWN_VOTE"
+        )
+        self.assertEqual((again.pk, previous, inserted), (vote.pk, "UP_VOTE", False))
+        self.assertEqual(
+            CommentVote.objects.retract(self.test_user, self.comment).vote_type, "DOWN_VOTE"
+        )
+        self.assertIsNone(CommentVote.objects.retract(self.test_user, self.comment))
+
+    def test_comment_votes(self):
+        path = f"/api/questions/question-comment/{self.comment.pk}"
+        self.vote("UP_VOTE", path)
+        self.vote("UP_VOTE", path)
+        comment = Comment.objects.get(pk=self.comment.pk)
+        self.assertEqual((comment.up_votes, comment.down_votes), (1, 0))
+        self.assertEqual(CommentVote.objects.filter(comment=self.comment).count(), 1)
+
+    def test_one_vote_per_user(self):
+        QuestionVote.objects.create(
+            question=self.question, user=self.test_user, vote_type="UP_VOTE"
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            QuestionVote.objects.create(
+                question=self.question, user=self.test_user, vote_type="UP_VOTE"
+            )
+
+
+@override_settings(VOTE_WRITE_BEHIND=True)
+class TestVoteBuffer(APITestCase):
+    def setUp(self):
+        self.test_user, self.normal_client = create_normal_client()
+        self.author = create_user(username="author", email="author@user.com", password="authorpass")
+        self.voters = [
+            create_user(username=f"voter{i}", email=f"voter{i}@user.com", password="voterpass")
+            for i in range(2)
+        ]
+        self.subq = create_subq(sub_name="buffer-sub", owner=self.author)
+        self.question = create_question(
+            post_title="Viral question", post_body="Body", author=self.author, subq=self.subq
+        )
+        self.addCleanup(cache.clear)
+
+    def state(self):
+        question = Question.objects.get(pk=self.question.pk)
+        return (
+            question.up_votes,
+            question.down_votes,
+            User.objects.get(pk=self.author.pk).reputation,
+        )
+
+    def push_votes(self):
+        vote_buffer.push(QuestionVote, self.voters[0], self.question, "UP_VOTE")
+        vote_buffer.push(QuestionVote, self.voters[0], self.question, "DOWN_VOTE")
+        vote_buffer.push(QuestionVote, self.voters[1], self.question, "UP_VOTE")
+        vote_buffer.push(QuestionVote, self.test_user, self.question, "UP_VOTE")
+
+    def test_votes_are_acknowledged_then_flushed(self):
+        path = f"/api/questions/question/{self.question.pk}"
+        res = self.normal_client.post(f"{path}/add_vote/", {"vote_type": "UP_VOTE"})
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["vote_type"], "UP_VOTE")
+        vote_buffer.push(QuestionVote, self.voters[0], self.question, "UP_VOTE")
+        vote_buffer.push(QuestionVote, self.voters[0], self.question, "DOWN_VOTE")
+        self.assertEqual(self.state(), (0, 0, 0))
+        self.assertEqual(vote_buffer.pending(), 3)
+
+        self.assertEqual(vote_buffer.flush(), 3)
+        self.assertEqual(self.state(), (1, 1, 0))
+        self.assertEqual(QuestionVote.objects.filter(question=self.question).count(), 2)
+        self.assertEqual(vote_buffer.pending(), 0)
+
+        res = self.normal_client.post(f"{path}/remove_vote/")
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        vote_buffer.flush()
+        self.assertEqual(self.state(), (0, 1, -1))
+
+    def test_flush_in_batches(self):
+        self.push_votes()
+        self.assertEqual(vote_buffer.flush(batch_size=1), 4)
+        self.assertEqual(self.state(), (2, 1, 1))
+
+    def test_crash_during_flush_keeps_the_buffer(self):
+        self.push_votes()
+        with mock.patch("questions.vote_buffer.counters.adjust", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            vote_buffer.flush()
+        self.assertEqual(self.state(), (0, 0, 0))
+        self.assertFalse(QuestionVote.objects.exists())
+        self.assertEqual(vote_buffer.pending(), 4)
+
+        self.assertEqual(vote_buffer.flush(), 4)
+        self.assertEqual(self.state(), (2, 1, 1))
+
+    def test_crash_after_commit_is_not_counted_twice(self):
+        self.push_votes()
+        with mock.patch("questions.vote_buffer._acknowledge", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            vote_buffer.flush()
+        self.assertEqual(self.state(), (2, 1, 1))
+        self.assertEqual(vote_buffer.pending(), 4)
+
+        self.assertEqual(vote_buffer.flush(), 4)
+        self.assertEqual(self.state(), (2, 1, 1))
+        self.assertEqual(QuestionVote.objects.filter(question=self.question).count(), 3)
+
+    def test_entry_never_written(self):
+        # the web worker died between taking a sequence number and writing the entry
+        cache.add(vote_buffer.SEQUENCE_KEY, 0, None)
+        cache.incr(vote_buffer.SEQUENCE_KEY)
+        vote_buffer.push(QuestionVote, self.voters[0], self.question, "UP_VOTE")
+        self.assertEqual(vote_buffer.flush(), 0)
+        self.assertEqual(vote_buffer.pending(), 2)
+
+        later = time.time() + settings.VOTE_BUFFER_GAP_TIMEOUT + 1
+        with mock.patch("questions.vote_buffer.time.time", return_value=later):
+            self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(self.state(), (1, 0, 1))
+        self.assertEqual(vote_buffer.pending(), 0)
+
+    def test_concurrent_flush_waits(self):
+        self.push_votes()
+        cache.add(vote_buffer.FLUSH_LOCK_KEY, 1)
+        self.assertIsNone(vote_buffer.flush())
+        self.assertEqual(vote_buffer.pending(), 4)
+
+    def test_overlapping_flush_is_not_counted_twice(self):
+        self.push_votes()
+        read = vote_buffer._read
+
+        def read_then_lose_lock(flushed, limit):
+            entries = read(flushed, limit)
+            # the lock timed out while the batch was read, and a second flush took it over
+            cache.delete(vote_buffer.FLUSH_LOCK_KEY)
+            with mock.patch("questions.vote_buffer._read", read):
+                self.assertEqual(vote_buffer.flush(), 4)
+            return entries
+
+        with mock.patch("questions.vote_buffer._read", read_then_lose_lock):
+            self.assertEqual(vote_buffer.flush(), 0)
+        self.assertEqual(self.state(), (2, 1, 1))
+        self.assertEqual(QuestionVote.objects.filter(question=self.question).count(), 3)
+        self.assertEqual(vote_buffer.pending(), 0)
+
+    def test_flush_renews_its_lock(self):
+        self.push_votes()
+        with mock.patch("questions.vote_buffer.cache.touch", wraps=cache.touch) as touch:
+            self.assertEqual(vote_buffer.flush(batch_size=1), 4)
+        self.assertGreaterEqual(touch.call_count, 8)
+        self.assertIsNone(cache.get(vote_buffer.FLUSH_LOCK_KEY))
+
+
+class TestAutocomplete(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            AUTOCOMPLETE_INDEX_PATH=os.path.join(self.directory, "autocomplete.idx"),
+            AUTOCOMPLETE_VERSION_CHECK_INTERVAL=0,
+        )
+        self.settings_override.enable()
+        self.addCleanup(cache.clear)
+        self.test_user = create_user(
+            username="test_user", password="testing", email="tester@tester.com"
+        )
+        self.subq1 = create_subq(
+            sub_name="Early Intervention", description="EI", owner=self.test_user
+        )
+        self.subq2 = create_subq(sub_name="Pediatrics", description="Peds", owner=self.test_user)
+        self.archived = create_subq(
+            sub_name="Early Archived", description="Gone", owner=self.test_user
+        )
+        self.archived.archive()
+        self.tag = QTag.objects.create(tag_name="Early Childhood")
+        question = create_question(
+            post_title="My Title", post_body="My Body", author=self.test_user, subq=self.subq2
+        )
+        QuestionQtag.objects.create(qtag=self.tag, question=question)
+        autocomplete.build_index()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_autocomplete(self):
+        client = APIClient()
+        res = client.get("/api/autocomplete/?q=ear")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["slug"] for item in res.data], [self.tag.slug, self.subq1.slug])
+        self.assertEqual(res.data[0]["kind"], "qtag")
+
+        res = client.get("/api/autocomplete/?q=ear&kind=subq")
+        self.assertEqual([item["slug"] for item in res.data], [self.subq1.slug])
+
+    def test_autocomplete_no_queries(self):
+        with self.assertNumQueries(0):
+            res = APIClient().get("/api/autocomplete/?q=ped")
+        self.assertEqual([item["slug"] for item in res.data], [self.subq2.slug])
+
+    def test_autocomplete_bad_request(self):
+        res = APIClient().get("/api/autocomplete/")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @mock.patch("questions.autocomplete.transaction.on_commit", lambda func: func())
+    def test_refresh(self):
+        identity = autocomplete.get_index().identity
+        new_tag = QTag.objects.create(tag_name="Pediatric Feeding")
+        self.subq2.archive()
+        # saving only replaces the version token, the file is rebuilt after the next lookup
+        with mock.patch("questions.autocomplete._refresh_in_background") as refresh:
+            self.assertEqual(autocomplete.get_index().identity, identity)
+            self.assertEqual(
+                [entry.slug for entry in autocomplete.search("ped")], [self.subq2.slug]
+            )
+        refresh.assert_called_with(autocomplete.current_version())
+
+        autocomplete.refresh_index(autocomplete.current_version())
+        self.assertEqual([entry.slug for entry in autocomplete.search("ped")], [new_tag.slug])
+
+    def test_refresh_in_background(self):
+        autocomplete.bump_version()
+        version = autocomplete.current_version()
+        with mock.patch("questions.autocomplete.refresh_index") as refresh:
+            autocomplete.search("ped")
+            autocomplete._refresh["thread"].join()
+        refresh.assert_called_once_with(version)
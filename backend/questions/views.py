@@ -1,14 +1,18 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import filters, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 from core.mixins import MultipleFieldLookupMixin
 from core.renderers import TheraQJsonRenderer
 from core.serializers import EmptySerializer
+from questions import autocomplete, vote_buffer, votes
 from questions.models import (
     Comment,
     CommentVote,
@@ -20,6 +24,8 @@ from questions.models import (
     ReplyVote,
 )
 from questions.serializers import (
+    AutocompleteQuerySerializer,
+    AutocompleteSerializer,
     CommentVoteSerializer,
     CreateCommentVoteSerializer,
     CreateQTagSerializer,
@@ -41,6 +47,39 @@ from questions.serializers import (
 )
 
 
+def cast_vote(request, vote_model, serializer_class, target):
+    """
+    Adds or changes the vote of the requesting user: 201 for a new vote, 200 for a changed one,
+    202 when it is buffered in write-behind mode.
+    """
+    serializer = serializer_class(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if settings.VOTE_WRITE_BEHIND:
+        vote_buffer.push(vote_model, request.user, target, serializer.validated_data["vote_type"])
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    vote, previous = votes.cast(
+        vote_model, request.user, target, serializer.validated_data["vote_type"]
+    )
+    return Response(
+        serializer_class(vote).data,
+        status=status.HTTP_201_CREATED if previous is None else status.HTTP_200_OK,
+    )
+
+
+def retract_vote(request, vote_model, target):
+    """
+    Removes the vote of the requesting user: 204, 404 when there was none, 202 when the removal
+    is buffered in write-behind mode.
+    """
+    if settings.VOTE_WRITE_BEHIND:
+        vote_buffer.push(vote_model, request.user, target, None)
+        return Response(status=status.HTTP_202_ACCEPTED)
+    if votes.retract(vote_model, request.user, target) is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # TODO Change Viewers to ViewCount
 # TODO Change Followers to FollowerCount
 # pylint: disable=too-many-ancestors
@@ -146,22 +185,12 @@ class QuestionViewSet(MultipleFieldLookupMixin, ModelViewSet):
     @action(methods=["POST"], detail=True, name="Add/Update A Vote", url_name="add_vote")
     def add_vote(self, request, *args, **kwargs):
         question: Question = get_object_or_404(Question, pk=kwargs["pk"])
-        serializer = CreateQuestionVoteSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user, question=question)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return cast_vote(request, QuestionVote, CreateQuestionVoteSerializer, question)
 
     @action(methods=["POST"], detail=True, name="Remove A Vote", url_name="remove_vote")
     def remove_vote(self, request, *args, **kwargs):
-        pk = kwargs["pk"]
-        question: Question = get_object_or_404(Question, pk=pk)
-        try:
-            watch = QuestionVote.objects.get(user=request.user, question=question)
-            watch.delete()
-            return Response(status=204)
-        except QuestionVote.DoesNotExist:
-            return Response(status=404)
+        question: Question = get_object_or_404(Question, pk=kwargs["pk"])
+        return retract_vote(request, QuestionVote, question)
 
     @action(methods=["POST"], detail=True, name="Add A Comment", url_name="add_comment")
     def add_comment(self, request, *args, **kwargs):
@@ -227,6 +256,43 @@ class QTagViewSet(MultipleFieldLookupMixin, ModelViewSet):
         return Response(serializer.errors, status=400)
 
 
+class AutocompleteView(APIView):
+    """
+    Type-ahead suggestions for sub and tag names, ordered by popularity.
+
+    Served from the shared prefix index, so neither authentication nor the lookup
+    touch the database.
+    """
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+    renderer_classes = (TheraQJsonRenderer,)
+
+    @swagger_auto_schema(
+        query_serializer=AutocompleteQuerySerializer(),
+        responses={200: AutocompleteSerializer(many=True), 400: "Bad Request"},
+    )
+    def get(self, request, *args, **kwargs):
+        query = AutocompleteQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        kind = query.validated_data.get("kind")
+        results = autocomplete.search(
+            query.validated_data["q"],
+            limit=query.validated_data["limit"],
+            kinds=(autocomplete.KINDS[kind],) if kind else None,
+        )
+        data = [
+            {
+                "kind": autocomplete.KIND_NAMES[entry.kind],
+                "name": entry.label,
+                "slug": entry.slug,
+                "weight": entry.weight,
+            }
+            for entry in results
+        ]
+        return Response(status=200, data=data)
+
+
 # pylint: disable=too-many-ancestors
 class ReplyViewSet(ModelViewSet):
     queryset = Reply.objects.all()
@@ -293,21 +359,12 @@ class ReplyViewSet(ModelViewSet):
     @action(methods=["POST"], detail=True, name="Add/Update A Vote", url_name="add_vote")
     def add_vote(self, request, *args, **kwargs):
         reply: Reply = get_object_or_404(Reply, pk=kwargs["id"])
-        serializer = CreateReplyVoteSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user, reply=reply)
-            return Response(serializer.data, status=201)
-        return Response(serializer.errors, status=400)
+        return cast_vote(request, ReplyVote, CreateReplyVoteSerializer, reply)
 
     @action(methods=["POST"], detail=True, name="Remove A Vote", url_name="remove_vote")
     def remove_vote(self, request, *args, **kwargs):
         reply: Reply = get_object_or_404(Reply, pk=kwargs["id"])
-        try:
-            watch = ReplyVote.objects.get(user=request.user, reply=reply)
-            watch.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except ReplyVote.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+        return retract_vote(request, ReplyVote, reply)
 
     @action(methods=["POST"], detail=True, name="Add A Comment", url_name="add_comment")
     def add_comment(self, request, *args, **kwargs):
@@ -380,21 +437,12 @@ class QuestionCommentViewSet(ModelViewSet):
     @action(methods=["POST"], detail=True, name="Add/Update A Vote", url_name="add_vote")
     def add_vote(self, request, *args, **kwargs):
         comment: Comment = get_object_or_404(Comment, pk=kwargs["id"])
-        serializer = CreateCommentVoteSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user, comment=comment)
-            return Response(serializer.data, status=201)
-        return Response(serializer.errors, status=400)
+        return cast_vote(request, CommentVote, CreateCommentVoteSerializer, comment)
 
     @action(methods=["POST"], detail=True, name="Remove A Vote", url_name="remove_vote")
     def remove_vote(self, request, *args, **kwargs):
         comment: Comment = get_object_or_404(Comment, pk=kwargs["id"])
-        try:
-            comment_vote = CommentVote.objects.get(user=request.user, comment=comment)
-            comment_vote.delete()
-            return Response(status=204)
-        except CommentVote.DoesNotExist:
-            return Response(status=404)
+        return retract_vote(request, CommentVote, comment)
 
 
 # pylint: disable=too-many-ancestors
@@ -456,18 +504,12 @@ class ReplyCommentViewSet(ModelViewSet):
     @action(methods=["POST"], detail=True, name="Add/Update A Vote", url_name="add_vote")
     def add_vote(self, request, *args, **kwargs):
         comment: Comment = get_object_or_404(Comment, pk=kwargs["id"])
-        serializer = CreateCommentVoteSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user, comment=comment)
-            return Response(serializer.data, status=201)
-        return Response(serializer.errors, status=400)
+        return cast_vote(request, CommentVote, CreateCommentVoteSerializer, comment)
 
     @action(methods=["POST"], detail=True, name="Remove A Vote", url_name="remove_vote")
     def remove_vote(self, request, *args, **kwargs):
         comment: Comment = get_object_or_404(Comment, pk=kwargs["id"])
-        comment_vote = get_object_or_404(CommentVote, user=request.user, comment=comment)
-        comment_vote.delete()
-        return Response(status=204)
+        return retract_vote(request, CommentVote, comment)
 
 
 # pylint: disable=too-many-ancestors
@@ -0,0 +1,202 @@
+"""
+Write-behind buffering of votes, for questions that get more votes than their rows take.
+
+With ``VOTE_WRITE_BEHIND`` on, the vote endpoints do not touch the database: ``push`` appends
+the vote to a log in the default cache (Redis in production) and the request is answered with
+202 Accepted. The log is a counter handing out sequence numbers and one key per entry, so it
+survives the web worker that wrote it. ``flush``, run by the ``flush_vote_buffer`` task,
+replays the log in order: it keeps each user's last vote per target, writes them with one
+upsert and one delete per vote table, and moves counters and reputation with one UPDATE per
+target, all in one transaction. Only then does it acknowledge the entries, so a flush that
+crashes leaves them to the next one; replaying is harmless, as an entry that is already
+written changes nothing.
+
+Staleness is bounded: the first vote pushed after a flush sends the flush task
+``VOTE_BUFFER_DELAY`` seconds later, and celery beat sends one every minute in case a task is
+lost. A sequence number whose entry never got written (its worker died in between) holds the
+flush back for ``VOTE_BUFFER_GAP_TIMEOUT`` seconds at most, then is skipped.
+
+One flush runs at a time, under a lock holding a token of its owner. The lock is renewed with
+every batch, and a batch is only committed while its flush still holds the lock: one that
+outlived ``VOTE_BUFFER_LOCK_TIMEOUT`` rolls back and leaves its entries to the flush that took
+the lock over, instead of writing them a second time.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from questions import counters, reputation
+
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_KEY = "vote-buffer:sequence"
+FLUSHED_KEY = "vote-buffer:flushed"
+ENTRY_KEY = "vote-buffer:entry:{sequence}"
+GAP_KEY = "vote-buffer:gap:{sequence}"
+FLUSH_LOCK_KEY = "vote-buffer:flush-lock"
+
+
+def push(vote_model, user, target, vote_type):
+    """
+    Buffers a vote of ``user`` on ``target``, ``vote_type`` ``None`` retracting it, and makes
+    sure a flush follows.
+    """
+    # pylint: disable=import-outside-toplevel
+    from questions.tasks import flush_vote_buffer
+
+    name = next(
+        name for name, (_, model, _) in counters.VOTE_TARGETS.items() if model is vote_model
+    )
+    cache.add(SEQUENCE_KEY, 0, None)
+    sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(ENTRY_KEY.format(sequence=sequence), (name, target.pk, user.pk, vote_type), None)
+    flush_vote_buffer.coalesce(delay=settings.VOTE_BUFFER_DELAY)
+    return sequence
+
+
+def pending():
+    """
+    The number of buffered entries not flushed yet.
+    """
+    return (cache.get(SEQUENCE_KEY) or 0) - (cache.get(FLUSHED_KEY) or 0)
+
+
+def _read(flushed, limit):
+    """
+    The entries after ``flushed``, up to ``limit`` of them and up to the first gap that is not
+    old enough to skip. Returns the entries and the last sequence number read.
+    """
+    last = min(cache.get(SEQUENCE_KEY) or 0, flushed + limit)
+    keys = {
+        sequence: ENTRY_KEY.format(sequence=sequence) for sequence in range(flushed + 1, last + 1)
+    }
+    found = cache.get_many(list(keys.values()))
+    entries = []
+    for sequence, key in keys.items():
+        if key in found:
+            entries.append(found[key])
+            flushed = sequence
+            continue
+        gap = GAP_KEY.format(sequence=sequence)
+        cache.add(gap, time.time(), None)
+        if time.time() - cache.get(gap, time.time()) < settings.VOTE_BUFFER_GAP_TIMEOUT:
+            break
+        logger.warning("Skipping vote buffer entry %s, it was never written", sequence)
+        cache.delete(gap)
+        flushed = sequence
+    return entries, flushed
+
+
+def _write(entries):
+    """
+    Writes the last vote of every user on every target in ``entries``.
+    """
+    latest = {}
+    for name, target_id, user_id, vote_type in entries:
+        latest[(name, target_id, user_id)] = vote_type
+    existing_users = set(
+        get_user_model()
+        .objects.filter(pk__in={key[2] for key in latest})
+        .values_list("pk", flat=True)
+    )
+    for name, (model, vote_model, content_field) in counters.VOTE_TARGETS.items():
+        votes = {
+            (user_id, target_id): vote_type
+            for (vote_name, target_id, user_id), vote_type in latest.items()
+            if vote_name == name and user_id in existing_users
+        }
+        if not votes:
+            continue
+        # votes on content deleted since are dropped
+        targets = set(
+            model.objects.filter(pk__in={target_id for _, target_id in votes}).values_list(
+                "pk", flat=True
+            )
+        )
+        votes = {pair: vote_type for pair, vote_type in votes.items() if pair[1] in targets}
+        previous = {
+            (user_id, target_id): vote_type
+            for user_id, target_id, vote_type in vote_model.objects.select_for_update()
+            .filter(
+                **{f"{content_field}_id__in": targets},
+                user_id__in={user_id for user_id, _ in votes},
+            )
+            .values_list("user_id", f"{content_field}_id", "vote_type")
+            if (user_id, target_id) in votes
+        }
+        vote_model.objects.upsert_many(
+            [
+                (user_id, target_id, vote_type)
+                for (user_id, target_id), vote_type in votes.items()
+                if vote_type
+            ]
+        )
+        vote_model.objects.retract_many(
+            [pair for pair, vote_type in votes.items() if vote_type is None and pair in previous]
+        )
+
+        changes = defaultdict(lambda: [0, 0, 0])
+        for pair, vote_type in votes.items():
+            change = changes[pair[1]]
+            up_votes, down_votes = counters.difference(previous.get(pair), vote_type)
+            change[0] += up_votes
+            change[1] += down_votes
+            change[2] += reputation.vote_points(vote_type) - reputation.vote_points(
+                previous.get(pair)
+            )
+        for target_id, (up_votes, down_votes, points) in changes.items():
+            counters.adjust(name, target_id, up_votes, down_votes)
+            reputation.apply_delta(vote_model(**{f"{content_field}_id": target_id}), points)
+
+
+def _acknowledge(flushed, last):
+    cache.set(FLUSHED_KEY, last, None)
+    cache.delete_many(
+        [ENTRY_KEY.format(sequence=sequence) for sequence in range(flushed + 1, last + 1)]
+    )
+
+
+def _renew(token):
+    """
+    Extends the flush lock when ``token`` still holds it. Returns whether it does.
+    """
+    return cache.get(FLUSH_LOCK_KEY) == token and cache.touch(
+        FLUSH_LOCK_KEY, settings.VOTE_BUFFER_LOCK_TIMEOUT
+    )
+
+
+def flush(batch_size=None):
+    """
+    Writes the buffered votes to the database in batches of ``VOTE_BUFFER_BATCH_SIZE``
+    entries. Returns the number of entries flushed, ``None`` when another flush is running.
+    """
+    batch_size = batch_size or settings.VOTE_BUFFER_BATCH_SIZE
+    token = uuid.uuid4().hex
+    if not cache.add(FLUSH_LOCK_KEY, token, settings.VOTE_BUFFER_LOCK_TIMEOUT):
+        return None
+    total = 0
+    try:
+        while _renew(token):
+            flushed = cache.get(FLUSHED_KEY) or 0
+            entries, last = _read(flushed, batch_size)
+            if last == flushed:
+                return total
+            with transaction.atomic():
+                _write(entries)
+                if not _renew(token):
+                    logger.warning("Vote buffer flush lost its lock, rolling back its batch")
+                    transaction.set_rollback(True)
+                    return total
+            _acknowledge(flushed, last)
+            total += len(entries)
+        return total
+    finally:
+        if cache.get(FLUSH_LOCK_KEY) == token:
+            cache.delete(FLUSH_LOCK_KEY)
@@ -0,0 +1,38 @@
+"""
+Casting and retracting votes on questions, replies and comments.
+
+Each operation is one statement on the vote table (see questions.managers) followed by one
+UPDATE of the content's counters and one of its author's reputation, by exactly the
+difference the vote made.
+"""
+from questions import counters, reputation
+
+
+def cast(vote_model, user, target, vote_type):
+    """
+    Adds or changes the vote of ``user`` on ``target``. Returns the vote and the vote type it
+    replaced, ``None`` when the user had not voted.
+    """
+    vote, previous, inserted = vote_model.objects.cast(user, target, vote_type)
+    if previous is None and not inserted:
+        # a concurrent first vote of the same user, of unknown type: the counters are
+        # recounted, the reputation is left to recompute_reputation
+        counters.request_recount(vote)
+        return vote, previous
+    counters.vote_changed(vote, previous, vote_type)
+    reputation.apply_delta(
+        vote, reputation.vote_points(vote_type) - reputation.vote_points(previous)
+    )
+    return vote, previous
+
+
+def retract(vote_model, user, target):
+    """
+    Removes the vote of ``user`` on ``target``. Returns the removed vote, or ``None`` when
+    there was none.
+    """
+    vote = vote_model.objects.retract(user, target)
+    if vote is not None:
+        counters.vote_changed(vote, vote.vote_type, None)
+        reputation.apply_delta(vote, -reputation.vote_points(vote.vote_type))
+    return vote
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from subq import rollups
+
+
+class Command(BaseCommand):
+    """
+    Builds the daily SubQ rollups for every row that has not been rolled up yet.
+    With --reset the rollups are dropped and rebuilt from the first row. Rows newer than
+    --lag seconds are left to the periodic rollup; without a previous run, rows of today and
+    yesterday are.
+    """
+
+    help = "Backfill the daily SubQ analytics rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            dest="reset",
+            default=False,
+            help="Drop the existing rollups and watermarks before backfilling.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            dest="batch_size",
+            default=settings.SUBQ_STATS_BATCH_SIZE,
+            help="Number of source rows rolled up per transaction.",
+        )
+        parser.add_argument(
+            "--lag",
+            action="store",
+            type=int,
+            dest="lag",
+            default=settings.SUBQ_STATS_SAFETY_LAG,
+            help="Seconds a row must have been visible before it is rolled up, 0 for every row.",
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            self.stdout.write("Dropping existing rollups...")
+            rollups.reset()
+        processed = rollups.roll_up(batch_size=options["batch_size"], lag=options["lag"])
+        self.stdout.write(f"Rolled up {processed} rows\n")
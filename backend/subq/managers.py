@@ -0,0 +1,118 @@
+from django.db import connections, models
+from django.utils import timezone
+
+
+class SubQFollowerQuerySet(models.QuerySet):
+    """
+    Set based operations on sub memberships. Every method issues a single
+    UPDATE statement, no matter how many followers are matched.
+    """
+
+    def for_members(self, subq, user_ids):
+        """
+        Memberships of the given users within a sub. The owner of the sub is never matched,
+        so bulk moderation can not lock an owner out of their own sub.
+        """
+        queryset = self.filter(subq=subq, follower_id__in=user_ids)
+        if subq.owner_id is not None:
+            queryset = queryset.exclude(follower_id=subq.owner_id)
+        return queryset
+
+    def ban(self):
+        return self.update(is_banned=True, status=True, ban_date=timezone.now().date())
+
+    def unban(self):
+        return self.update(is_banned=False, ban_date=None)
+
+    def archive(self):
+        return self.update(status=True)
+
+    def join(self, user, subq, **defaults):
+        """
+        Joins ``user`` to ``subq`` with a single ``INSERT ... ON CONFLICT`` statement: it
+        creates a new membership with ``defaults``, keeps the active one, or restores an
+        archived one with today's join date, unless the user is banned from the sub. A restored
+        membership adds no row for the follower rollup to see, so it is counted as a join of
+        today in the sub's rollups. Returns ``False`` when the user is banned.
+
+        On Postgres the archived state is read by the statement itself, from the snapshot it
+        started with, so two re-joins of the same membership racing each other are both counted.
+        """
+        # pylint: disable=import-outside-toplevel
+        from subq.rollups import count_rejoin
+
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        instance = self.model(follower=user, subq=subq, **defaults)
+        fields = [field for field in meta.concrete_fields if not field.primary_key]
+        params = [
+            field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields
+        ]
+        table = quote(meta.db_table)
+        status, updated_date, join_date, is_banned, follower, subq_column = (
+            quote(meta.get_field(name).column)
+            for name in ("status", "updated_date", "join_date", "is_banned", "follower", "subq")
+        )
+        upsert = (
+            f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+            f"VALUES ({', '.join(['%s'] * len(fields))}) "
+            f"ON CONFLICT ({follower}, {subq_column}) "
+            f"DO UPDATE SET {status} = %s, {updated_date} = EXCLUDED.{updated_date}, "
+            f"{join_date} = CASE WHEN {table}.{status} "
+            f"THEN EXCLUDED.{join_date} ELSE {table}.{join_date} END "
+            f"WHERE {table}.{is_banned} IS NOT TRUE "
+            f"RETURNING {quote(meta.pk.column)}"
+        )
+        previous_sql = f"SELECT {status} FROM {table} WHERE {follower} = %s AND {subq_column} = %s"
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # the system column xmax is 0 on a row the statement inserted
+                cursor.execute(
+                    f"WITH previous AS ({previous_sql}) "
+                    f"{upsert}, (SELECT * FROM previous), xmax = 0",
+                    [user.pk, subq.pk] + params + [False],
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return False
+                _, archived, inserted = row
+            else:
+                # SQLite runs one write at a time, so the membership read first is the one
+                # the upsert finds
+                cursor.execute(previous_sql, [user.pk, subq.pk])
+                previous = cursor.fetchone()
+                cursor.execute(upsert, params + [False])
+                if cursor.fetchone() is None:
+                    return False
+                archived, inserted = previous is not None and previous[0], previous is None
+        if archived and not inserted:
+            count_rejoin(subq.pk, instance.join_date, using=self.db)
+        return True
+
+    def toggle_notifications(self, user, subq):
+        """
+        Flips the notification setting of an active membership in one ``UPDATE ... RETURNING``
+        statement. Returns the new setting, or ``None`` when ``user`` is not an active member.
+        """
+        connection = connections[self.db]
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        notifications, updated_date, status, follower, subq_column = (
+            quote(meta.get_field(name).column)
+            for name in ("notifications_enabled", "updated_date", "status", "follower", "subq")
+        )
+        sql = (
+            f"UPDATE {quote(meta.db_table)} "
+            f"SET {notifications} = CASE WHEN {notifications} THEN %s ELSE %s END, "
+            f"{updated_date} = %s "
+            f"WHERE {follower} = %s AND {subq_column} = %s AND {status} IS NOT TRUE "
+            f"RETURNING {notifications}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [False, True, timezone.now().date(), user.pk, subq.pk])
+            row = cursor.fetchone()
+        return None if row is None else bool(row[0])
+
+
+SubQFollowerManager = models.Manager.from_queryset(SubQFollowerQuerySet)
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('subq', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubQDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('new_questions', models.PositiveIntegerField(default=0)),
+                ('new_replies', models.PositiveIntegerField(default=0)),
+                ('new_votes', models.PositiveIntegerField(default=0)),
+                ('new_joins', models.PositiveIntegerField(default=0)),
+                ('active_posters', models.PositiveIntegerField(default=0)),
+                ('subq', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='subq.SubQ')),
+            ],
+            options={
+                'verbose_name': 'Sub Daily Stats',
+                'db_table': 'subq_daily_stats',
+                'unique_together': {('subq', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SubQDailyPoster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('subq', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='subq.SubQ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sub Daily Poster',
+                'db_table': 'subq_daily_poster',
+                'unique_together': {('subq', 'day', 'user')},
+            },
+        ),
+    ]
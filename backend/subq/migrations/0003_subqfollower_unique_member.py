@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_followers(apps, schema_editor):
+    """
+    Collapses duplicate memberships into the oldest row. A ban or moderator flag on any of
+    the duplicates is kept, and the membership stays active if any duplicate was active.
+    """
+    SubQFollower = apps.get_model("subq", "SubQFollower")
+    duplicates = (
+        SubQFollower.objects.values("follower", "subq")
+        .annotate(members=Count("pk"))
+        .filter(members__gt=1, follower__isnull=False, subq__isnull=False)
+        .order_by()
+    )
+    for group in duplicates:
+        rows = list(
+            SubQFollower.objects.filter(follower=group["follower"], subq=group["subq"]).order_by("pk")
+        )
+        keep = rows[0]
+        banned = [row for row in rows if row.is_banned]
+        keep.is_moderator = any(row.is_moderator for row in rows)
+        keep.notifications_enabled = any(row.notifications_enabled for row in rows)
+        if banned:
+            keep.is_banned, keep.status, keep.ban_date = True, True, banned[0].ban_date
+        else:
+            keep.status = all(row.status for row in rows)
+        keep.save()
+        SubQFollower.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subq', '0002_subqdailyposter_subqdailystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_followers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subqfollower',
+            constraint=models.UniqueConstraint(fields=('follower', 'subq'), name='subq_follower_unique_member'),
+        ),
+    ]
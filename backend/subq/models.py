@@ -9,6 +9,7 @@ from django.db import models
 from django.utils.text import slugify
 
 from core.models import BaseAppModel
+from subq.managers import SubQFollowerManager
 
 
 User = get_user_model()
@@ -43,9 +44,16 @@ class SubQFollower(BaseAppModel):
     is_banned = models.BooleanField(blank=True, null=True, default=False)
     ban_date = models.DateField(blank=True, null=True)
 
+    objects = SubQFollowerManager()
+
     class Meta:
         db_table = 'subq_follower'
         verbose_name = "Sub Follower"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["follower", "subq"], name="subq_follower_unique_member"
+            ),
+        ]
 
     def archive(self):
         self.status = True
@@ -55,10 +63,35 @@ class SubQFollower(BaseAppModel):
         self.is_banned = True
         self.status = True
         self.ban_date = datetime.now()
-        self.save()
+        self.save(update_fields=["is_banned", "status", "ban_date", "updated_date"])
 
     @staticmethod
     def join_sub(user: User, subq: SubQ):
-        subq_follower = SubQFollower(follower=user, subq=subq)
-        subq_follower.save()
-        return subq_follower
+        SubQFollower.objects.join(user, subq)
+        return SubQFollower.objects.get(follower=user, subq=subq)
+
+
+class SubQDailyStats(models.Model):
+    subq = models.ForeignKey(SubQ, models.CASCADE, related_name="daily_stats")
+    day = models.DateField()
+    new_questions = models.PositiveIntegerField(default=0)
+    new_replies = models.PositiveIntegerField(default=0)
+    new_votes = models.PositiveIntegerField(default=0)
+    new_joins = models.PositiveIntegerField(default=0)
+    active_posters = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'subq_daily_stats'
+        verbose_name = "Sub Daily Stats"
+        unique_together = (("subq", "day"),)
+
+
+class SubQDailyPoster(models.Model):
+    subq = models.ForeignKey(SubQ, models.CASCADE, related_name="+")
+    day = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, models.CASCADE, related_name="+")
+
+    class Meta:
+        db_table = 'subq_daily_poster'
+        verbose_name = "Sub Daily Poster"
+        unique_together = (("subq", "day", "user"),)
@@ -0,0 +1,191 @@
+"""
+Daily SubQ rollups, folded incrementally from the source tables.
+
+Each source table is walked in primary key order from its watermark. Primary keys are handed out
+when a row is inserted, not when its transaction commits, so a row with a lower key can become
+visible after rows with higher ones. A run therefore only goes up to the highest key it saw at
+least ``SUBQ_STATS_SAFETY_LAG`` seconds earlier (the watermark's horizon), by when the
+transactions that inserted the rows below it have committed. The first run of a source, having
+no horizon, goes up to the rows created before yesterday.
+
+Memberships restored by a re-join add no row, so ``count_rejoin`` counts them directly.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import TaskWatermark
+from questions.models import Comment, CommentVote, Question, QuestionVote, Reply, ReplyVote
+from subq.models import SubQDailyPoster, SubQDailyStats, SubQFollower
+
+
+# model: source table, subq: expression resolving the sub of a row, day: date column,
+# user: author column (rows count towards active posters), counter: SubQDailyStats column
+RollupSource = namedtuple("RollupSource", ("name", "model", "subq", "day", "user", "counter"))
+
+ROLLUP_SOURCES = (
+    RollupSource("question", Question, F("subq_id"), "created_date", "author_id", "new_questions"),
+    RollupSource("reply", Reply, F("question__subq_id"), "created_date", "user_id", "new_replies"),
+    RollupSource(
+        "comment",
+        Comment,
+        Coalesce("question__subq_id", "reply__question__subq_id"),
+        "created_date",
+        "user_id",
+        None,
+    ),
+    RollupSource(
+        "question_vote", QuestionVote, F("question__subq_id"), "created_date", None, "new_votes"
+    ),
+    RollupSource(
+        "reply_vote", ReplyVote, F("reply__question__subq_id"), "created_date", None, "new_votes"
+    ),
+    RollupSource(
+        "comment_vote",
+        CommentVote,
+        Coalesce("comment__question__subq_id", "comment__reply__question__subq_id"),
+        "created_date",
+        None,
+        "new_votes",
+    ),
+    RollupSource("follower", SubQFollower, F("subq_id"), "join_date", None, "new_joins"),
+)
+
+
+def watermark_name(source):
+    return f"subq_stats:{source.name}"
+
+
+def roll_up(batch_size=5000, lag=None):
+    """
+    Folds the rows created since the last run into the daily rollups, up to those created
+    ``lag`` seconds ago (``SUBQ_STATS_SAFETY_LAG`` by default, 0 for all of them). Returns the
+    number of source rows processed.
+    """
+    lag = settings.SUBQ_STATS_SAFETY_LAG if lag is None else lag
+    return sum(roll_up_source(source, batch_size, lag) for source in ROLLUP_SOURCES)
+
+
+def _upper_bound(source, watermark, latest, lag):
+    """
+    The highest primary key a run can safely roll up to, and whether it reached the horizon.
+    """
+    if not lag:
+        return latest, True
+    if watermark.horizon_seen is None:
+        cutoff = timezone.now().date() - timedelta(days=1)
+        rows = source.model.objects.filter(**{f"{source.day}__lt": cutoff})
+        return rows.aggregate(upper=Max("pk"))["upper"] or 0, True
+    if watermark.horizon_seen <= timezone.now() - timedelta(seconds=lag):
+        return watermark.horizon_id, True
+    return watermark.last_id, False
+
+
+def roll_up_source(source, batch_size, lag=0):
+    watermark, _ = TaskWatermark.objects.get_or_create(name=watermark_name(source))
+    latest = source.model.objects.aggregate(upper=Max("pk"))["upper"] or 0
+    upper, reached = _upper_bound(source, watermark, latest, lag)
+    if reached:
+        TaskWatermark.objects.filter(pk=watermark.pk).update(
+            horizon_id=latest, horizon_seen=timezone.now()
+        )
+    lower = watermark.last_id
+    processed = 0
+    while lower < upper:
+        high = min(lower + batch_size, upper)
+        with transaction.atomic():
+            processed += _roll_up_range(source, lower, high)
+            TaskWatermark.objects.filter(pk=watermark.pk).update(
+                last_id=high, last_run=timezone.now()
+            )
+        lower = high
+    return processed
+
+
+def _roll_up_range(source, lower, upper):
+    rows = (
+        source.model.objects.filter(pk__gt=lower, pk__lte=upper, **{f"{source.day}__isnull": False})
+        .annotate(rollup_subq=source.subq, rollup_day=F(source.day))
+        .filter(rollup_subq__isnull=False)
+    )
+    counts = list(
+        rows.order_by().values("rollup_subq", "rollup_day").annotate(rollup_count=Count("pk"))
+    )
+    if not counts:
+        return 0
+
+    SubQDailyStats.objects.bulk_create(
+        [SubQDailyStats(subq_id=row["rollup_subq"], day=row["rollup_day"]) for row in counts],
+        ignore_conflicts=True,
+    )
+    if source.counter:
+        for row in counts:
+            SubQDailyStats.objects.filter(subq_id=row["rollup_subq"], day=row["rollup_day"]).update(
+                **{source.counter: F(source.counter) + row["rollup_count"]}
+            )
+    if source.user:
+        posters = rows.filter(**{f"{source.user}__isnull": False}).order_by().values_list(
+            "rollup_subq", "rollup_day", source.user
+        ).distinct()
+        SubQDailyPoster.objects.bulk_create(
+            [
+                SubQDailyPoster(subq_id=subq_id, day=day, user_id=user_id)
+                for subq_id, day, user_id in posters
+            ],
+            ignore_conflicts=True,
+        )
+        poster_count = (
+            SubQDailyPoster.objects.filter(subq=OuterRef("subq"), day=OuterRef("day"))
+            .order_by()
+            .values("subq")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        for row in counts:
+            SubQDailyStats.objects.filter(subq_id=row["rollup_subq"], day=row["rollup_day"]).update(
+                active_posters=Subquery(poster_count)
+            )
+    return sum(row["rollup_count"] for row in counts)
+
+
+def count_rejoin(subq_id, day, using="default"):
+    """
+    Counts a membership restored by a re-join, which the follower rollup can not see, with a
+    single ``INSERT ... ON CONFLICT`` statement.
+    """
+    connection = connections[using]
+    meta = SubQDailyStats._meta
+    quote = connection.ops.quote_name
+    instance = SubQDailyStats(subq_id=subq_id, day=day, new_joins=1)
+    fields = [field for field in meta.concrete_fields if not field.primary_key]
+    params = [
+        field.get_db_prep_save(getattr(instance, field.attname), connection) for field in fields
+    ]
+    table = quote(meta.db_table)
+    new_joins, subq_column, day_column = (
+        quote(meta.get_field(name).column) for name in ("new_joins", "subq", "day")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+            f"VALUES ({', '.join(['%s'] * len(fields))}) "
+            f"ON CONFLICT ({subq_column}, {day_column}) "
+            f"DO UPDATE SET {new_joins} = {table}.{new_joins} + 1",
+            params,
+        )
+
+
+def reset():
+    """
+    Drops all rollups and watermarks, so the next run rebuilds them from scratch.
+    """
+    SubQDailyStats.objects.all().delete()
+    SubQDailyPoster.objects.all().delete()
+    TaskWatermark.objects.filter(
+        name__in=[watermark_name(source) for source in ROLLUP_SOURCES]
+    ).delete()
@@ -2,7 +2,7 @@ from rest_framework import serializers
 
 from accounts.serializers import IdUserSerializer
 from core.serializers import DynamicFieldsModelSerializer
-from subq.models import SubQ, SubQFollower
+from subq.models import SubQ, SubQDailyStats, SubQFollower
 
 
 class SubQFollowerSerializer(DynamicFieldsModelSerializer):
@@ -118,7 +118,9 @@ class CreateSubQFollowerSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         subq_data = validated_data.pop("subq")
         subq = SubQ.objects.get(**subq_data)
-        return SubQFollower.objects.create(subq=subq, **validated_data)
+        follower = validated_data.pop("follower")
+        SubQFollower.objects.join(follower, subq, **validated_data)
+        return SubQFollower.objects.get(follower=follower, subq=subq)
 
 
 class ViewSubQFollowerSerializer(DynamicFieldsModelSerializer):
@@ -134,5 +136,26 @@ class ViewSubQFollowerSerializer(DynamicFieldsModelSerializer):
         read_only_fields = ("id", "is_moderator", "join_date", "follower", "subq", "is_banned")
 
 
+class BulkModerationSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class SubQDailyStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubQDailyStats
+        fields = ("day", "new_questions", "new_replies", "new_votes", "new_joins", "active_posters")
+        read_only_fields = fields
+
+
+class SubQStatsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get("start") and data.get("end") and data["start"] > data["end"]:
+            raise serializers.ValidationError("start must not be after end")
+        return data
+
+
 class SubQUserSerializer(serializers.Serializer):
     user = IdUserSerializer(required=True)
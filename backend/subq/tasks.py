@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from questions.models import Comment, Question, Reply
+from subq import rollups
+from subq.models import SubQ, SubQFollower
+from theraq.celery import app as celery_app
+
+
+def archive_member_content(subq: SubQ, user_ids):
+    """
+    Archives every question, reply and comment written by the given users within a sub.
+    Runs one UPDATE per content table.
+    """
+    questions = Question.objects.filter(subq=subq, author_id__in=user_ids).update(status=True)
+    replies = Reply.objects.filter(question__subq=subq, user_id__in=user_ids).update(status=True)
+    comments = Comment.objects.filter(
+        Q(question__subq=subq) | Q(reply__question__subq=subq), user_id__in=user_ids
+    ).update(status=True)
+    return questions + replies + comments
+
+
+def moderate(subq: SubQ, operation: str, user_ids):
+    """
+    Applies a bulk moderation operation to one batch of users and returns the number of
+    affected rows.
+    """
+    if operation == "archive_content":
+        return archive_member_content(subq, user_ids)
+    followers = SubQFollower.objects.for_members(subq, user_ids)
+    if operation == "ban":
+        return followers.ban()
+    if operation == "unban":
+        return followers.unban()
+    if operation == "archive":
+        return followers.archive()
+    raise ValueError(f"Unknown moderation operation: {operation}")
+
+
+@celery_app.task(bind=True)
+def bulk_moderate(self, subq_id, operation, user_ids):
+    """
+    Applies a bulk moderation operation in batches of ``SUBQ_BULK_MODERATION_BATCH_SIZE`` users,
+    committing each batch on its own and reporting progress as the ``PROGRESS`` task state.
+    """
+    subq = SubQ.objects.get(pk=subq_id)
+    batch_size = settings.SUBQ_BULK_MODERATION_BATCH_SIZE
+    total = len(user_ids)
+    affected = 0
+    for start in range(0, total, batch_size):
+        with transaction.atomic():
+            affected += moderate(subq, operation, user_ids[start:start + batch_size])
+        if not self.request.is_eager:
+            self.update_state(
+                state="PROGRESS",
+                meta={"done": min(start + batch_size, total), "total": total, "affected": affected},
+            )
+    return {"done": total, "total": total, "affected": affected}
+
+
+@celery_app.task
+def roll_up_subq_stats():
+    """
+    Folds everything created since the previous run into the daily SubQ rollups.
+    """
+    return rollups.roll_up(batch_size=settings.SUBQ_STATS_BATCH_SIZE)
@@ -1,12 +1,25 @@
 import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
 from accounts.serializers import IdUserSerializer
-from subq.models import SubQ, SubQFollower
+from core.models import TaskWatermark
+from questions.models import Comment, Question, QuestionVote, Reply, ReplyVote
+from subq import rollups
+from subq.models import SubQ, SubQDailyStats, SubQFollower
+from subq.tasks import bulk_moderate
 
 
 User = get_user_model()
@@ -202,6 +215,197 @@ class TestSubQViewSet(APITestCase):
         self.assertFalse(refreshed_follower.is_moderator)
         self.assertTrue(refreshed_follower.notifications_enabled)
 
+    def test_join_twice_keeps_one_membership(self):
+        self.normal_client.post(f"/api/subqs/subq/{self.subq2.pk}/join/")
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq2.slug}/join/")
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            SubQFollower.objects.filter(follower=self.test_user, subq=self.subq2).count(), 1
+        )
+
+    def test_rejoin_after_leave(self):
+        follower = create_subq_follower(
+            follower=self.test_user, subq=self.subq1, notifications_enabled=False
+        )
+        self.normal_client.post(f"/api/subqs/subq/{self.subq1.pk}/leave/")
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq1.pk}/join/")
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        refreshed_follower = SubQFollower.objects.get(pk=follower.pk)
+        self.assertFalse(refreshed_follower.status)
+        self.assertFalse(refreshed_follower.notifications_enabled)
+
+    def test_join_banned(self):
+        follower = create_subq_follower(follower=self.test_user, subq=self.subq1)
+        follower.ban()
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq1.pk}/join/")
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(SubQFollower.objects.get(pk=follower.pk).status)
+
+    def test_leave_not_member(self):
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq1.pk}/leave/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_toggle_notifications(self):
+        follower = create_subq_follower(follower=self.test_user, subq=self.subq1)
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq1.pk}/toggle_notifications/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data["notifications_enabled"])
+        self.assertFalse(SubQFollower.objects.get(pk=follower.pk).notifications_enabled)
+
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq1.slug}/toggle_notifications/")
+        self.assertTrue(res.data["notifications_enabled"])
+
+        res = self.normal_client.post(f"/api/subqs/subq/{self.subq2.pk}/toggle_notifications/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_ban(self):
+        follower1 = create_subq_follower(follower=self.user1, subq=self.subq3)
+        follower2 = create_subq_follower(follower=self.user2, subq=self.subq3)
+        other_sub = create_subq_follower(follower=self.user1, subq=self.subq1)
+        payload = {"user_ids": [self.user1.pk, self.user2.pk, self.test_user.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.pk}/bulk_ban/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["affected"], 2)
+
+        for follower in SubQFollower.objects.filter(pk__in=[follower1.pk, follower2.pk]):
+            self.assertTrue(follower.is_banned)
+            self.assertTrue(follower.status)
+            self.assertIsNotNone(follower.ban_date)
+        self.assertFalse(SubQFollower.objects.get(pk=other_sub.pk).is_banned)
+
+    def test_bulk_ban_not_moderator(self):
+        create_subq_follower(follower=self.user1, subq=self.subq1)
+        payload = {"user_ids": [self.user1.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq1.pk}/bulk_ban/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_unban(self):
+        follower = create_subq_follower(follower=self.user1, subq=self.subq3)
+        follower.ban()
+        payload = {"user_ids": [self.user1.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.slug}/bulk_unban/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        refreshed_follower = SubQFollower.objects.get(pk=follower.pk)
+        self.assertFalse(refreshed_follower.is_banned)
+        self.assertIsNone(refreshed_follower.ban_date)
+
+    def test_bulk_archive(self):
+        follower = create_subq_follower(follower=self.user1, subq=self.subq3)
+        payload = {"user_ids": [self.user1.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.pk}/bulk_archive/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(SubQFollower.objects.get(pk=follower.pk).status)
+
+    def test_archive_content(self):
+        question = Question.objects.create(
+            post_title="Spam Title", post_body="Spam Body", author=self.user1, subq=self.subq3
+        )
+        other_question = Question.objects.create(
+            post_title="Other Title", post_body="Other Body", author=self.user1, subq=self.subq1
+        )
+        reply = Reply.objects.create(reply_body="Spam Reply", user=self.user1, question=question)
+        comment = Comment.objects.create(comment_body="Spam Comment", user=self.user1, reply=reply)
+        kept_reply = Reply.objects.create(
+            reply_body="Good Reply", user=self.user2, question=question
+        )
+        payload = {"user_ids": [self.user1.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.pk}/archive_content/", json.dumps(payload),
+            content_type="application/json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["affected"], 3)
+        self.assertTrue(Question.objects.get(pk=question.pk).status)
+        self.assertTrue(Reply.objects.get(pk=reply.pk).status)
+        self.assertTrue(Comment.objects.get(pk=comment.pk).status)
+        self.assertFalse(Question.objects.get(pk=other_question.pk).status)
+        self.assertFalse(Reply.objects.get(pk=kept_reply.pk).status)
+
+    @override_settings(SUBQ_BULK_MODERATION_SYNC_LIMIT=1, SUBQ_BULK_MODERATION_BATCH_SIZE=1)
+    @mock.patch("subq.views.transaction.on_commit", lambda func: func())
+    @mock.patch("subq.views.bulk_moderate.apply_async", wraps=bulk_moderate.apply_async)
+    def test_bulk_ban_queued(self, send):
+        create_subq_follower(follower=self.user1, subq=self.subq3)
+        create_subq_follower(follower=self.user2, subq=self.subq3)
+        payload = {"user_ids": [self.user1.pk, self.user2.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.pk}/bulk_ban/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        task_id = res.data["task_id"]
+        self.assertIsNotNone(task_id)
+        self.assertEqual(SubQFollower.objects.filter(subq=self.subq3, is_banned=True).count(), 2)
+        self.assertEqual(send.call_args[1]["task_id"], task_id)
+
+        self.addCleanup(cache.clear)
+        # eager tasks store no result
+        with mock.patch("subq.views.AsyncResult") as result:
+            result.return_value.configure_mock(id=task_id, state="SUCCESS", info=None)
+            res = self.normal_client.get(f"/api/subqs/subq/moderation/{task_id}/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["state"], "SUCCESS")
+
+    @override_settings(SUBQ_BULK_MODERATION_SYNC_LIMIT=1)
+    @mock.patch("subq.views.bulk_moderate.apply_async")
+    def test_bulk_ban_queued_after_commit(self, send):
+        payload = {"user_ids": [self.user1.pk, self.user2.pk]}
+        callbacks = []
+        with mock.patch("subq.views.transaction.on_commit", callbacks.append):
+            res = self.normal_client.post(
+                f"/api/subqs/subq/{self.subq3.pk}/bulk_ban/",
+                json.dumps(payload),
+                content_type="application/json",
+            )
+        self.addCleanup(cache.clear)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        send.assert_not_called()
+        for callback in callbacks:
+            callback()
+        send.assert_called_once_with(
+            (self.subq3.pk, "ban", sorted([self.user1.pk, self.user2.pk])),
+            task_id=res.data["task_id"],
+        )
+
+    @override_settings(SUBQ_BULK_MODERATION_SYNC_LIMIT=1)
+    def test_moderation_status_of_other_sub(self):
+        create_subq_follower(follower=self.user1, subq=self.subq3)
+        create_subq_follower(follower=self.user2, subq=self.subq3)
+        payload = {"user_ids": [self.user1.pk, self.user2.pk]}
+        res = self.normal_client.post(
+            f"/api/subqs/subq/{self.subq3.pk}/bulk_ban/",
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        task_id = res.data["task_id"]
+        self.addCleanup(cache.clear)
+        client = APIClient()
+        client.force_authenticate(user=self.user3)
+        res = client.get(f"/api/subqs/subq/moderation/{task_id}/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        # ids of tasks that are not bulk moderations, like credential imports, are unknown
+        res = self.normal_client.get("/api/subqs/subq/moderation/some-other-task/")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
 
 # pylint: disable=too-many-instance-attributes
 class TestSubQFollowerViewSet(APITestCase):
@@ -236,6 +440,10 @@ class TestSubQFollowerViewSet(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         self.assertEqual(res.data.get("subq")["id"], self.subq4.pk)
         self.assertEqual(res.data.get("follower")["id"], self.test_user.pk)
+        self.assertEqual(res.data.get("id"), self.follower_test.pk)
+        self.assertEqual(
+            SubQFollower.objects.filter(subq=self.subq4, follower=self.test_user).count(), 1
+        )
 
     def test_update(self):
         payload = {
@@ -286,3 +494,112 @@ class TestSubQFollowerViewSet(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         subqf_refreshed = SubQFollower.objects.get(pk=self.follower_test.pk)
         self.assertTrue(subqf_refreshed.status)
+
+
+class TestSubQRollups(TestCase):
+    def setUp(self):
+        self.owner = create_user(username="owner1", email="owner1@user.com", password="owner1pass")
+        self.user1 = create_user(username="user1", email="user1@user.com", password="user1pass")
+        self.user2 = create_user(username="user2", email="user2@user.com", password="user2pass")
+        self.subq1 = create_subq(sub_name="sub1", description="SUB 1 Decsription", owner=self.owner)
+        self.subq2 = create_subq(sub_name="sub2", description="SUB 2 Decsription", owner=self.owner)
+        create_subq_follower(follower=self.user1, subq=self.subq1)
+        create_subq_follower(follower=self.user2, subq=self.subq1)
+        self.question = Question.objects.create(
+            post_title="My Title", post_body="My Body", author=self.user1, subq=self.subq1
+        )
+        self.reply = Reply.objects.create(
+            reply_body="Reply", user=self.user2, question=self.question
+        )
+        QuestionVote.objects.create(vote_type="UP_VOTE", user=self.user2, question=self.question)
+        ReplyVote.objects.create(vote_type="UP_VOTE", user=self.user1, reply=self.reply)
+
+    def test_roll_up(self):
+        rollups.roll_up(lag=0)
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_questions, 1)
+        self.assertEqual(stats.new_replies, 1)
+        self.assertEqual(stats.new_votes, 2)
+        self.assertEqual(stats.new_joins, 2)
+        self.assertEqual(stats.active_posters, 2)
+        self.assertFalse(SubQDailyStats.objects.filter(subq=self.subq2).exists())
+
+    def test_roll_up_incremental(self):
+        rollups.roll_up(batch_size=1, lag=0)
+        Question.objects.create(
+            post_title="Title 2", post_body="Body 2", author=self.user1, subq=self.subq1
+        )
+        Question.objects.create(
+            post_title="Title 3", post_body="Body 3", author=self.owner, subq=self.subq2
+        )
+        self.assertEqual(rollups.roll_up(lag=0), 2)
+        self.assertEqual(rollups.roll_up(lag=0), 0)
+
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_questions, 2)
+        self.assertEqual(stats.active_posters, 2)
+        self.assertEqual(SubQDailyStats.objects.get(subq=self.subq2).new_questions, 1)
+
+    def test_backfill_reset(self):
+        rollups.roll_up(lag=0)
+        call_command("backfill_subq_stats", "--reset", "--lag", "0", stdout=StringIO())
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_questions, 1)
+        self.assertEqual(stats.new_votes, 2)
+
+    def test_roll_up_waits_for_the_safety_lag(self):
+        # without a horizon only rows created before yesterday are safe
+        self.assertEqual(rollups.roll_up(lag=600), 0)
+        self.assertEqual(rollups.roll_up(lag=600), 0)
+        Question.objects.create(
+            post_title="Title 2", post_body="Body 2", author=self.user1, subq=self.subq1
+        )
+        TaskWatermark.objects.update(horizon_seen=timezone.now() - timedelta(seconds=601))
+        # the rows of setUp, seen by the first run, but not the question created after it
+        self.assertEqual(rollups.roll_up(lag=600), 6)
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_questions, 1)
+        TaskWatermark.objects.update(horizon_seen=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(rollups.roll_up(lag=600), 1)
+
+    def test_rejoin_is_counted(self):
+        rollups.roll_up(lag=0)
+        SubQFollower.objects.filter(follower=self.user1, subq=self.subq1).update(status=True)
+        self.assertTrue(SubQFollower.objects.join(self.user1, self.subq1))
+        self.assertTrue(SubQFollower.objects.join(self.user1, self.subq1))
+        SubQFollower.objects.filter(follower=self.user2, subq=self.subq1).update(
+            status=True, is_banned=True
+        )
+        self.assertFalse(SubQFollower.objects.join(self.user2, self.subq1))
+        rollups.roll_up(lag=0)
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_joins, 3)
+
+    def test_rejoin_restored_by_upsert(self):
+        SubQFollower.objects.filter(follower=self.user1, subq=self.subq1).update(
+            status=True, join_date=timezone.now().date() - timedelta(days=30)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(SubQFollower.objects.join(self.user1, self.subq1))
+        self.assertFalse(any(query["sql"].startswith("UPDATE") for query in queries))
+        membership = SubQFollower.objects.get(follower=self.user1, subq=self.subq1)
+        self.assertFalse(membership.status)
+        self.assertEqual(membership.join_date, timezone.now().date())
+        stats = SubQDailyStats.objects.get(subq=self.subq1, day=timezone.now().date())
+        self.assertEqual(stats.new_joins, 1)
+
+    def test_stats_endpoint(self):
+        rollups.roll_up(lag=0)
+        client = APIClient()
+        client.force_authenticate(user=self.user1)
+        res = client.get(f"/api/subqs/subq/{self.subq1.slug}/stats/")
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        client.force_authenticate(user=self.owner)
+        res = client.get(f"/api/subqs/subq/{self.subq1.slug}/stats/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["totals"]["new_questions"], 1)
+        self.assertEqual(res.data["totals"]["new_joins"], 2)
+        self.assertEqual(len(res.data["days"]), 1)
+
+        res = client.get(f"/api/subqs/subq/{self.subq1.pk}/stats/?start=2020-01-02&end=2020-01-01")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -42,6 +42,39 @@ urlpatterns = [
     path("subq/<slug:sub_name>/ban/", SubQViewSet.as_view({
         'post': 'ban',
     })),
+    path("subq/<int:pk>/bulk_ban/", SubQViewSet.as_view({
+        'post': 'bulk_ban',
+    })),
+    path("subq/<slug:sub_name>/bulk_ban/", SubQViewSet.as_view({
+        'post': 'bulk_ban',
+    })),
+    path("subq/<int:pk>/bulk_unban/", SubQViewSet.as_view({
+        'post': 'bulk_unban',
+    })),
+    path("subq/<slug:sub_name>/bulk_unban/", SubQViewSet.as_view({
+        'post': 'bulk_unban',
+    })),
+    path("subq/<int:pk>/bulk_archive/", SubQViewSet.as_view({
+        'post': 'bulk_archive',
+    })),
+    path("subq/<slug:sub_name>/bulk_archive/", SubQViewSet.as_view({
+        'post': 'bulk_archive',
+    })),
+    path("subq/<int:pk>/archive_content/", SubQViewSet.as_view({
+        'post': 'archive_content',
+    })),
+    path("subq/<slug:sub_name>/archive_content/", SubQViewSet.as_view({
+        'post': 'archive_content',
+    })),
+    path("subq/<int:pk>/stats/", SubQViewSet.as_view({
+        'get': 'stats',
+    })),
+    path("subq/<slug:sub_name>/stats/", SubQViewSet.as_view({
+        'get': 'stats',
+    })),
+    path("subq/moderation/<str:task_id>/", SubQViewSet.as_view({
+        'get': 'moderation_status',
+    })),
     path("subq/<int:pk>/join/", SubQViewSet.as_view({
         'post': 'join',
     })),
@@ -54,6 +87,12 @@ urlpatterns = [
     path("subq/<slug:sub_name>/leave/", SubQViewSet.as_view({
         'post': 'leave',
     })),
+    path("subq/<int:pk>/toggle_notifications/", SubQViewSet.as_view({
+        'post': 'toggle_notifications',
+    })),
+    path("subq/<slug:sub_name>/toggle_notifications/", SubQViewSet.as_view({
+        'post': 'toggle_notifications',
+    })),
     ]
 
 urlpatterns += router.urls
@@ -1,4 +1,13 @@
+from datetime import timedelta
+
+from celery import uuid
+from celery.result import AsyncResult
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import filters, status
@@ -15,13 +24,20 @@ from subq.serializers import (
     CreateSubQSerializer,
     ViewSubQFollowerSerializer,
     CreateSubQFollowerSerializer,
-    ListSubQSerializer
+    ListSubQSerializer,
+    BulkModerationSerializer,
+    SubQDailyStatsSerializer,
+    SubQStatsQuerySerializer
 )
 from accounts.serializers import IdUserSerializer
-from subq.models import SubQ, SubQFollower
+from subq.models import SubQ, SubQDailyStats, SubQFollower
+from subq.tasks import bulk_moderate, moderate
 
 User = get_user_model()
 
+# the sub a queued bulk moderation task works on, so only its moderators can follow it
+MODERATION_TASK_KEY = "subq-moderation-task:{task_id}"
+
 
 class SubQViewSet(ModelViewSet):
     queryset = SubQ.objects.order_by('sub_name')
@@ -40,7 +56,11 @@ class SubQViewSet(ModelViewSet):
             return ListSubQSerializer
         if self.action == "add_moderator" or self.action == "remove_moderator" or self.action == "ban":
             return IdUserSerializer
-        if self.action == "leave" or self.action == "join":
+        if self.action in ("bulk_ban", "bulk_unban", "bulk_archive", "archive_content"):
+            return BulkModerationSerializer
+        if self.action == "stats":
+            return SubQDailyStatsSerializer
+        if self.action in ("leave", "join", "toggle_notifications", "moderation_status"):
             return EmptySerializer
         return ViewSubQSerializer
 
@@ -220,14 +240,11 @@ class SubQViewSet(ModelViewSet):
             item = get_object_or_404(SubQ, slug=kwargs["sub_name"])
         except KeyError:
             item = get_object_or_404(SubQ, pk=kwargs["pk"])
-        if request.user == item.owner:
+        if item.owner_id == request.user.pk:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        try:
-            follower: SubQFollower = SubQFollower.objects.get(follower=request.user, subq=item)
-            follower.archive()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except SubQFollower.DoesNotExist:
+        if not SubQFollower.objects.filter(follower=request.user, subq=item).archive():
             return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @swagger_auto_schema(
         responses={
@@ -247,16 +264,228 @@ class SubQViewSet(ModelViewSet):
             item = get_object_or_404(SubQ, slug=kwargs["sub_name"])
         except KeyError:
             item = get_object_or_404(SubQ, pk=kwargs["pk"])
+        if not SubQFollower.objects.join(request.user, item):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        return Response(status=204)
+
+    @swagger_auto_schema(
+        responses={
+            200: "Notifications Toggled",
+            404: "SubQ Does not Exist | User Not a member of Sub",
+        }
+    )
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Toggles the Current User's Sub notifications",
+        url_name="toggle_notifications",
+    )
+    def toggle_notifications(self, request, *args, **kwargs):
+        """
+        Turns notifications for the selected Sub on or off for the currently logged in User,
+        and returns the new setting.
+        """
         try:
-            follower, created = SubQFollower.objects.get_or_create(follower=request.user, subq=item)
-            if follower.is_banned:
-                return Response(status=status.HTTP_401_UNAUTHORIZED)
-            follower.status = False
-            follower.save()
-            return Response(status=204)
-        except SubQFollower.DoesNotExist:
-            SubQFollower.join_sub(request.user, item)
-            return Response(status=201)
+            item = get_object_or_404(SubQ, slug=kwargs["sub_name"])
+        except KeyError:
+            item = get_object_or_404(SubQ, pk=kwargs["pk"])
+        enabled = SubQFollower.objects.toggle_notifications(request.user, item)
+        if enabled is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(status=200, data={"notifications_enabled": enabled})
+
+    @swagger_auto_schema(
+        responses={
+            200: "Users Banned",
+            202: "Moderation Task Queued",
+            404: "SubQ Does not Exist",
+            401: "UnAuthorized",
+            400: "Bad Request"
+        }
+    )
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Bans many users from a sub",
+        url_name="bulk_ban",
+    )
+    def bulk_ban(self, request, *args, **kwargs):
+        """
+        Bans (and archives) many followers of the selected SubQ at once.
+
+        Only a Moderator, Owner, or Superuser may perform this function
+        """
+        return self._bulk_moderate(request, "ban", **kwargs)
+
+    @swagger_auto_schema(
+        responses={
+            200: "Users Unbanned",
+            202: "Moderation Task Queued",
+            404: "SubQ Does not Exist",
+            401: "UnAuthorized",
+            400: "Bad Request"
+        }
+    )
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Unbans many users from a sub",
+        url_name="bulk_unban",
+    )
+    def bulk_unban(self, request, *args, **kwargs):
+        """
+        Lifts the ban of many followers of the selected SubQ at once. Unbanned users stay
+        archived until they re-join the sub.
+
+        Only a Moderator, Owner, or Superuser may perform this function
+        """
+        return self._bulk_moderate(request, "unban", **kwargs)
+
+    @swagger_auto_schema(
+        responses={
+            200: "Users Archived",
+            202: "Moderation Task Queued",
+            404: "SubQ Does not Exist",
+            401: "UnAuthorized",
+            400: "Bad Request"
+        }
+    )
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Archives many followers of a sub",
+        url_name="bulk_archive",
+    )
+    def bulk_archive(self, request, *args, **kwargs):
+        """
+        Archives (removes) many followers of the selected SubQ at once.
+
+        Only a Moderator, Owner, or Superuser may perform this function
+        """
+        return self._bulk_moderate(request, "archive", **kwargs)
+
+    @swagger_auto_schema(
+        responses={
+            200: "Content Archived",
+            202: "Moderation Task Queued",
+            404: "SubQ Does not Exist",
+            401: "UnAuthorized",
+            400: "Bad Request"
+        }
+    )
+    @action(
+        detail=True,
+        methods=['POST'],
+        name="Archives content of users in a sub",
+        url_name="archive_content",
+    )
+    def archive_content(self, request, *args, **kwargs):
+        """
+        Archives every question, reply and comment the given users posted in the selected SubQ.
+
+        Only a Moderator, Owner, or Superuser may perform this function
+        """
+        return self._bulk_moderate(request, "archive_content", **kwargs)
+
+    @swagger_auto_schema(responses={200: "Moderation Task State", 404: "Task Does not Exist"})
+    @action(
+        detail=False,
+        methods=['GET'],
+        name="State of a bulk moderation task",
+        url_name="moderation_status",
+    )
+    def moderation_status(self, request, *args, **kwargs):
+        """
+        Reports the state and progress of a queued bulk moderation task.
+
+        Only a Moderator, Owner, or Superuser of the sub the task works on may see it
+        """
+        subq_id = cache.get(MODERATION_TASK_KEY.format(task_id=kwargs["task_id"]))
+        subq = SubQ.objects.filter(pk=subq_id).first() if subq_id is not None else None
+        if subq is None or (
+            not request.user.is_superuser and not self._is_moderator_or_owner(request.user, subq)
+        ):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        result = AsyncResult(kwargs["task_id"], app=bulk_moderate.app)
+        info = result.info if isinstance(result.info, dict) else None
+        return Response(
+            status=200, data={"task_id": result.id, "state": result.state, "progress": info}
+        )
+
+    @swagger_auto_schema(
+        query_serializer=SubQStatsQuerySerializer(),
+        responses={
+            200: SubQDailyStatsSerializer(many=True),
+            404: "SubQ Does not Exist",
+            401: "UnAuthorized",
+            400: "Bad Request"
+        }
+    )
+    @action(
+        detail=True,
+        methods=['GET'],
+        name="Daily statistics of a sub",
+        url_name="stats",
+    )
+    def stats(self, request, *args, **kwargs):
+        """
+        Daily statistics of the selected SubQ between ``start`` and ``end`` (defaults to the
+        last 30 days). Served from the daily rollups, which lag by up to one rollup interval
+        plus ``SUBQ_STATS_SAFETY_LAG``.
+
+        Only a Moderator, Owner, or Superuser may perform this function
+        """
+        try:
+            item = get_object_or_404(SubQ, slug=kwargs["sub_name"])
+        except KeyError:
+            item = get_object_or_404(SubQ, pk=kwargs["pk"])
+        if not self._is_moderator_or_owner(request.user, item) and not request.user.is_superuser:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        query = SubQStatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        end = query.validated_data.get("end", timezone.now().date())
+        start = query.validated_data.get("start", end - timedelta(days=29))
+        days = SubQDailyStats.objects.filter(subq=item, day__range=(start, end)).order_by("day")
+        totals = days.aggregate(
+            new_questions=Sum("new_questions"),
+            new_replies=Sum("new_replies"),
+            new_votes=Sum("new_votes"),
+            new_joins=Sum("new_joins"),
+        )
+        return Response(status=200, data={
+            "start": start,
+            "end": end,
+            "totals": {key: value or 0 for key, value in totals.items()},
+            "days": SubQDailyStatsSerializer(days, many=True).data,
+        })
+
+    def _bulk_moderate(self, request, operation, **kwargs):
+        try:
+            item = get_object_or_404(SubQ, slug=kwargs["sub_name"])
+        except KeyError:
+            item = get_object_or_404(SubQ, pk=kwargs["pk"])
+        if not self._is_moderator_or_owner(request.user, item) and not request.user.is_superuser:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = BulkModerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        user_ids = sorted(set(serializer.validated_data["user_ids"]))
+        if len(user_ids) > settings.SUBQ_BULK_MODERATION_SYNC_LIMIT:
+            # the request runs in a transaction: the task is sent once it commits, under an id
+            # picked here so the response can carry it
+            task_id = uuid()
+            transaction.on_commit(
+                lambda: bulk_moderate.apply_async((item.pk, operation, user_ids), task_id=task_id)
+            )
+            cache.set(
+                MODERATION_TASK_KEY.format(task_id=task_id),
+                item.pk,
+                settings.SUBQ_MODERATION_TASK_TIMEOUT,
+            )
+            return Response(status=status.HTTP_202_ACCEPTED, data={"task_id": task_id})
+        affected = moderate(item, operation, user_ids)
+        return Response(status=200, data={"affected": affected})
 
     def _is_moderator_or_owner(self, user: User, subq: SubQ):
         if user == subq.owner:
@@ -0,0 +1,20 @@
+"""
+ASGI config for theraq project.
+
+It exposes the ASGI callable as a module-level variable named ``application``. Serve it with an
+ASGI server, for example ``gunicorn theraq.asgi -k uvicorn.workers.UvicornWorker``; see
+core.asgi for how requests are run.
+"""
+
+import os
+
+import django
+
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "theraq.settings.production")
+django.setup(set_prefix=False)
+
+from core.asgi import ASGIHandler  # noqa: E402 pylint: disable=wrong-import-position
+
+
+application = ASGIHandler()
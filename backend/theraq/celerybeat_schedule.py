@@ -4,4 +4,24 @@ from celery.schedules import crontab
 CELERYBEAT_SCHEDULE = {
     # Internal tasks
     "clearsessions": {"schedule": crontab(hour=3, minute=0), "task": "accounts.tasks.clearsessions"},
+    "license-expirations": {
+        "schedule": crontab(hour=6, minute=0),
+        "task": "accounts.tasks.sweep_license_expirations",
+    },
+    "data-export-expirations": {
+        "schedule": crontab(hour=4, minute=0),
+        "task": "accounts.tasks.expire_data_exports",
+    },
+    "autocomplete-index": {
+        "schedule": crontab(minute=30),
+        "task": "questions.tasks.rebuild_autocomplete_index",
+    },
+    "vote-buffer-flush": {
+        "schedule": crontab(),
+        "task": "questions.tasks.flush_vote_buffer",
+    },
+    "subq-stats-rollup": {
+        "schedule": crontab(minute="*/15"),
+        "task": "subq.tasks.roll_up_subq_stats",
+    },
 }
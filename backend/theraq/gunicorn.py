@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration, used by the Procfile with ``--config python:theraq.gunicorn``.
+
+The master loads the application (``preload_app``) and warms it up with core.warmup before it
+forks, so workers start with every module imported and serve their first request as fast as
+any other. The pages holding those objects are shared with the master copy-on-write. As the
+gc module documentation recommends, the master loads with the garbage collector disabled, so
+collections leave no holes in those pages, and freezes it before forking, so collections in the
+workers never write to, and so copy, them.
+
+On start the master also removes the metric files left by the previous run, see core.metrics.
+"""
+import gc
+import os
+import time
+
+import decouple
+
+
+# "config" is itself a gunicorn setting, so decouple is not imported by name
+preload_app = decouple.config("GUNICORN_PRELOAD", default=True, cast=bool)
+warm_up_app = decouple.config("GUNICORN_WARM_UP", default=True, cast=bool)
+
+if preload_app:
+    # the application is loaded right after this configuration
+    gc.disable()
+
+
+def on_starting(server):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "theraq.settings.production")
+    # pylint: disable=import-outside-toplevel
+    from core import metrics
+
+    # the metric files of the previous run's workers
+    metrics.clear()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    if warm_up_app:
+        # pylint: disable=import-outside-toplevel
+        from core.warmup import warm_up
+
+        started = time.perf_counter()
+        built = warm_up()
+        server.log.info("Warmed up %s serializers in %.2fs", built, time.perf_counter() - started)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
@@ -3,6 +3,7 @@ import datetime
 import os
 
 from decouple import config  # noqa
+from kombu import Queue
 from . import blacklist_usernames
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,6 +13,23 @@ def base_dir_join(*args):
     return os.path.join(BASE_DIR, *args)
 
 
+def cache_from_url(url):
+    """
+    A ``CACHES`` entry for a redis://, rediss://, file:///path or locmem:// URL.
+    """
+    scheme, _, location = url.partition("://")
+    if scheme in ("redis", "rediss"):
+        return {"BACKEND": "core.cache.RedisCache", "LOCATION": url, "KEY_PREFIX": "theraq"}
+    if scheme == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": location,
+        }
+    if scheme == "locmem":
+        return {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": location}
+    raise ValueError(f"Unsupported cache URL: {url}")
+
+
 SITE_ID = 1
 
 SECURE_HSTS_PRELOAD = True
@@ -74,9 +92,18 @@ SWAGGER_SETTINGS = {
             'in': 'header'
         }
     },
+    'SPEC_URL': 'schema-json',
 }
+REDOC_SETTINGS = {
+    'SPEC_URL': 'schema-json',
+}
+# Schema generated at build time by the build_openapi_schema command, see core.openapi
+OPENAPI_SCHEMA_PATH = config("OPENAPI_SCHEMA_PATH", default=base_dir_join("var", "openapi.json"))
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.RequestProfilingMiddleware",
+    "core.middleware.NPlusOneMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -86,8 +113,62 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.ReplicaRoutingMiddleware",
+    "core.middleware.AtomicWriteRequestsMiddleware",
 ]
 
+# A request running the same SELECT, with any parameters, more than NPLUSONE_THRESHOLD times
+# is reported according to NPLUSONE_ACTION: "raise", "log" or None, see core.nplusone
+NPLUSONE_ACTION = None
+NPLUSONE_THRESHOLD = 5
+
+# Databases whose writes are wrapped in a transaction per unsafe request, see core.middleware;
+# safe requests run in autocommit mode instead of under ATOMIC_REQUESTS
+ATOMIC_WRITE_DATABASES = ("default",)
+# Seconds between liveness checks of a persistent database connection
+CONN_HEALTH_CHECK_INTERVAL = 30
+
+# Reads of safe requests go to one of these aliases, writes to "default", see core.routers
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"]
+DATABASE_REPLICAS = ()
+# Seconds a client reads from the primary after a write, to cover the replication lag
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = "primary_pin"
+
+# Request threads of an ASGI process (theraq.asgi), see core.asgi; GET and HEAD requests to
+# ASGI_READ_PATHS run on their own pool of ASGI_READ_THREADS. The question feed is left out
+# while it runs a dozen queries per question.
+ASGI_THREADS = 4
+ASGI_READ_THREADS = 8
+# Every request thread holds its own persistent connection (CONN_MAX_AGE), so the threads of
+# one process may not exceed its share of the database's connection limit. The hobby Postgres
+# allows 20: 7 go to the celery workers (realtime 4, bulk 2, maintenance 1), 1 is kept for
+# one-off dynos and migrations, which leaves 12 for a single ASGI process.
+ASGI_DB_CONNECTIONS = 12
+ASGI_READ_PATHS = (
+    r"^/api/questions/question/[-\w]+/$",
+    r"^/api/subqs/subq/$",
+    r"^/api/autocomplete/$",
+)
+
+# Opt-in request timings and profiles, see core.middleware.RequestProfilingMiddleware; the
+# timing headers are sent to staff users sending an X-Profile header
+REQUEST_PROFILING = config("REQUEST_PROFILING", default=False, cast=bool)
+REQUEST_PROFILING_HEADER = "HTTP_X_PROFILE"
+# cProfile dumps of every Nth request and of requests slower than this many milliseconds, 0 for none
+REQUEST_PROFILE_EVERY = config("REQUEST_PROFILE_EVERY", default=0, cast=int)
+REQUEST_PROFILE_SLOW_MS = config("REQUEST_PROFILE_SLOW_MS", default=0, cast=int)
+REQUEST_PROFILE_DIR = config("REQUEST_PROFILE_DIR", default=base_dir_join("var", "profiles"))
+
+# Prometheus metrics at /metrics, see core.metrics; scrapers send METRICS_TOKEN as a bearer token
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# Directory shared by the processes of a server, and seconds between writes of each process
+METRICS_DIR = config("METRICS_DIR", default=base_dir_join("var", "metrics"))
+METRICS_FLUSH_INTERVAL = 5
+# Seconds the values of a Celery pool process stay in the cache after its last write
+METRICS_SNAPSHOT_TIMEOUT = 60 * 60 * 24 * 7
+
 ROOT_URLCONF = "theraq.urls"
 
 TEMPLATES = [
@@ -143,8 +224,104 @@ WEBPACK_LOADER = {
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
-CELERY_ACKS_LATE = True
+CELERY_TASK_ACKS_LATE = True
 CELERY_TIMEZONE = TIME_ZONE
+# Tasks run on one of three queues, each consumed by its own worker process (see the Procfile)
+# so long exports and imports never hold up counters and notifications: "realtime" for
+# user-facing work and anything not routed, "bulk" for long batch jobs, "maintenance" for the
+# periodic jobs of celery beat
+CELERY_TASK_QUEUES = tuple(
+    Queue(name, routing_key=name) for name in ("realtime", "bulk", "maintenance")
+)
+CELERY_TASK_DEFAULT_QUEUE = "realtime"
+CELERY_TASK_DEFAULT_EXCHANGE = "tasks"
+CELERY_TASK_ROUTES = {
+    "accounts.tasks.import_user_credentials": {"queue": "bulk"},
+    "accounts.tasks.export_user_data": {"queue": "bulk"},
+    "subq.tasks.bulk_moderate": {"queue": "bulk"},
+    "accounts.tasks.clearsessions": {"queue": "maintenance"},
+    "accounts.tasks.sweep_license_expirations": {"queue": "maintenance"},
+    "accounts.tasks.expire_data_exports": {"queue": "maintenance"},
+    "questions.tasks.rebuild_autocomplete_index": {"queue": "maintenance"},
+    "subq.tasks.roll_up_subq_stats": {"queue": "maintenance"},
+}
+# Beat only sends tasks while it holds a lock in the cache, so a second beat process stays
+# idle; the lock expires BEAT_LOCK_TIMEOUT seconds after its holder stopped renewing it
+CELERY_BEAT_SCHEDULER = "core.beat:LockedScheduler"
+CELERY_BEAT_MAX_LOOP_INTERVAL = 60
+BEAT_LOCK_TIMEOUT = 3 * CELERY_BEAT_MAX_LOOP_INTERVAL
+# Seconds a coalesced task waits for more calls to join it, and at most remains claimed by a
+# run that has not started, see core.coalesce
+COALESCE_DELAY = 10
+COALESCE_TIMEOUT = 60 * 10
+
+# Cache
+CACHES = {"default": cache_from_url(config("CACHE_URL", default="locmem://"))}
+# Seconds core.cache entries are fresh by default, and served stale afterwards while one
+# process recomputes them
+CACHE_DEFAULT_TIMEOUT = 60 * 5
+CACHE_STALE_TTL = 60
+# Seconds a recompute lock is held at most, and waited for when there is no stale value
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 2
+
+# SubQ moderation
+# Bulk moderation requests above this many users are handed to a Celery task
+SUBQ_BULK_MODERATION_SYNC_LIMIT = 200
+SUBQ_BULK_MODERATION_BATCH_SIZE = 500
+# Seconds the state of a queued bulk moderation task can be looked up
+SUBQ_MODERATION_TASK_TIMEOUT = 60 * 60 * 24
+# Source rows folded into the daily SubQ rollups per transaction, and seconds a row waits
+# before it is rolled up, for the transactions inserting rows with lower keys to commit
+SUBQ_STATS_BATCH_SIZE = 5000
+SUBQ_STATS_SAFETY_LAG = 60 * 10
+
+# Autocomplete
+# The index file is shared through mmap by every worker on a host, and rebuilt in the
+# background when its version token in the cache changed, checked every few seconds
+AUTOCOMPLETE_INDEX_PATH = config(
+    "AUTOCOMPLETE_INDEX_PATH", default=base_dir_join("var", "autocomplete.idx")
+)
+AUTOCOMPLETE_VERSION_CHECK_INTERVAL = 10
+# Upper bound of index keys inspected per lookup
+AUTOCOMPLETE_SCAN_LIMIT = 2000
+
+# Reputation
+# Points a vote of each type adds to the reputation of the content's author
+REPUTATION_VOTE_POINTS = {"UP_VOTE": 1, "DOWN_VOTE": -1}
+# Users recomputed per statement by recompute_reputation
+REPUTATION_RECOMPUTE_BATCH_SIZE = 5000
+
+# Votes
+# With write-behind on, votes are buffered in the cache, answered with 202 and written by the
+# flush_vote_buffer task VOTE_BUFFER_DELAY seconds later, see questions.vote_buffer
+VOTE_WRITE_BEHIND = config("VOTE_WRITE_BEHIND", default=False, cast=bool)
+VOTE_BUFFER_DELAY = 2
+# Buffered votes written per transaction
+VOTE_BUFFER_BATCH_SIZE = 500
+# Seconds a buffer entry that was never written holds the flush back, and a flush is locked
+VOTE_BUFFER_GAP_TIMEOUT = 30
+VOTE_BUFFER_LOCK_TIMEOUT = 60
+
+# Users
+# Seconds a serialized profile page stays cached; edits invalidate it immediately
+USER_PROFILE_CACHE_TIMEOUT = 60 * 15
+# Seconds an authenticated user is served from the cache instead of the database
+AUTH_USER_CACHE_TIMEOUT = 60
+# Days before expiration a license holder is reminded, and licenses flagged per chunk
+LICENSE_REMINDER_DAYS = (60, 30, 7)
+LICENSE_SWEEP_BATCH_SIZE = 1000
+# Credential import rows validated and written per chunk, and validation processes per import
+CREDENTIAL_IMPORT_BATCH_SIZE = 1000
+CREDENTIAL_IMPORT_WORKERS = config("CREDENTIAL_IMPORT_WORKERS", default=2, cast=int)
+# Users the in-memory availability filter is sized for at least, and its false positive rate
+ACCOUNT_FILTER_MIN_CAPACITY = 100000
+ACCOUNT_FILTER_ERROR_RATE = 0.001
+# Storage directory of the data export archives, rows fetched per query while writing one and
+# days an archive can be downloaded before expire_data_exports deletes it
+DATA_EXPORT_PREFIX = "exports/data"
+DATA_EXPORT_CHUNK_SIZE = 2000
+DATA_EXPORT_RETENTION_DAYS = 7
 
 # Sentry
 SENTRY_DSN = config("SENTRY_DSN", default="")
@@ -158,8 +335,8 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # 'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-        'dj_rest_auth.jwt_auth.JWTCookieAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
+        'accounts.authentication.CachedJWTCookieAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': [
         'djangorestframework_camel_case.render.CamelCaseJSONRenderer',
@@ -13,7 +13,19 @@ SECRET_KEY = config("SECRET_KEY")
 DATABASES = {
     "default": config("DATABASE_URL", cast=db_url),
 }
-DATABASES["default"]["ATOMIC_REQUESTS"] = True
+# Connections are reused across requests and health checked, see core.middleware
+DATABASES["default"]["CONN_MAX_AGE"] = config("CONN_MAX_AGE", default=600, cast=int)
+# Read replicas, see core.routers
+for number, url in enumerate(config("DATABASE_REPLICA_URLS", default="", cast=Csv()), start=1):
+    DATABASES[f"replica{number}"] = db_url(url, conn_max_age=DATABASES["default"]["CONN_MAX_AGE"])
+DATABASE_REPLICAS = tuple(alias for alias in DATABASES if alias != "default")
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=REPLICA_PIN_SECONDS, cast=int)
+
+ASGI_THREADS = config("ASGI_THREADS", default=ASGI_THREADS, cast=int)
+ASGI_READ_THREADS = config("ASGI_READ_THREADS", default=ASGI_READ_THREADS, cast=int)
+ASGI_DB_CONNECTIONS = config("ASGI_DB_CONNECTIONS", default=ASGI_DB_CONNECTIONS, cast=int)
+
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
 
 ALLOWED_HOSTS = config("ALLOWED_HOSTS", cast=Csv())
 
@@ -22,6 +34,15 @@ STATIC_URL = "/static/"
 
 MEDIA_ROOT = base_dir_join("mediafiles")
 MEDIA_URL = "/media/"
+# Dynos do not share a disk, so files one dyno writes and another reads (credential import
+# uploads, data export archives) are kept in a private S3 bucket
+DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
+AWS_ACCESS_KEY_ID = config("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = config("AWS_SECRET_ACCESS_KEY")
+AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME")
+AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default=None)
+AWS_DEFAULT_ACL = "private"
+AWS_S3_FILE_OVERWRITE = False
 
 SERVER_EMAIL = "mgtripoli@triippztech.com"
 
@@ -46,6 +67,10 @@ X_FRAME_OPTIONS = "DENY"
 # Webpack
 WEBPACK_LOADER["DEFAULT"]["CACHE"] = True
 
+# Cache
+# Shared by every dyno; defaults to the Redis server of the Celery broker
+CACHES = {"default": cache_from_url(config("CACHE_URL", default=config("REDIS_URL")))}
+
 # Celery
 CELERY_BROKER_URL = config("REDIS_URL")
 CELERY_RESULT_BACKEND = config("REDIS_URL")
@@ -60,7 +85,7 @@ MIDDLEWARE.insert(  # insert WhiteNoiseMiddleware right after SecurityMiddleware
 
 # django-log-request-id
 MIDDLEWARE.insert(  # insert RequestIDMiddleware on the top
-    0, "log_request_id.middleware.RequestIDMiddleware"
+    0, "core.middleware.RequestIDMiddleware"
 )
 
 LOG_REQUEST_ID_HEADER = "HTTP_X_REQUEST_ID"
@@ -101,6 +126,11 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": False,
         },
+        "core.routers": {
+            "handlers": ["console"],
+            "level": config("DB_ROUTING_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
     },
 }
 
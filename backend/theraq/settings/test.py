@@ -4,7 +4,9 @@ from .base import *  # noqa
 SECRET_KEY = "test"
 
 DATABASES = {
-    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": base_dir_join("db.sqlite3"),}
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": base_dir_join("db.sqlite3"),},
+    # a separate database standing in for a read replica, only routed to by the routing tests
+    "replica": {"ENGINE": "django.db.backends.sqlite3", "NAME": base_dir_join("replica.sqlite3"),},
 }
 
 STATIC_ROOT = base_dir_join('staticfiles')
@@ -16,11 +18,16 @@ MEDIA_URL = '/media/'
 DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 STATICFILES_STORAGE = "django.contrib.staticfiles.storage.StaticFilesStorage"
 
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 # Speed up password hashing
 PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.MD5PasswordHasher",
 ]
 
+# Report N+1 queries, see core.nplusone
+NPLUSONE_ACTION = "raise"
+
 # Celery
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True